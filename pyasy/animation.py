@@ -2,6 +2,8 @@
 
 import textwrap
 
+import numpy as np
+
 import base
 
 ######################################################################
@@ -33,6 +35,12 @@ class Animation(base.Base):
 
        XXX
 
+       **Preview mode**
+
+       In preview mode (see :class:`pyasy.plot.Plot`), only a few
+       frames are kept, and the last frame is shipped out as a low
+       resolution PNG instead of the animation.
+
        **Methods**
 
        """
@@ -42,12 +50,16 @@ class Animation(base.Base):
         base.Base.__init__(self, **kwargs)
 
         self.asy.send('import animate')
-        self.asy.send('settings.tex="pdflatex"')
+        if not self.preview:
+            self.asy.send('settings.tex="pdflatex"')
+            self.tex = 'pdflatex'
         #self.asy.send('settings.keep=true')
 
 
     ##################################################################
 
+    @base.synchronized
+    @base.recorded
     def animate(self, x, t, y, pen=None,
                 xlabel='$x$', ylabel='',
                 xticks=('LeftTicks', {}),
@@ -55,6 +67,10 @@ class Animation(base.Base):
                 xlims=None,
                 ylims=None,
                 tlabel=None,
+                frames=None,
+                rate=None,
+                tolerance=None,
+                static=None,
                 **kwargs):
         """Create an animation of *y* vs *x* for the various values of
            time in *t*.
@@ -70,12 +86,71 @@ class Animation(base.Base):
            * *yticks*:
            * *xlims*:
            * *ylims*:
+           * *frames*: If set, *y* is resampled (by linear
+             interpolation in time) to this many equally spaced
+             frames.
+           * *rate*: If set, *y* is resampled to this many frames per
+             unit of time (overrides *frames*).
+           * *tolerance*: If set, consecutive frames that differ from
+             the last distinct frame by no more than *tolerance* (the
+             maximum absolute difference) are replaced by repeats of
+             it: their data isn't sent, and the picture of the
+             distinct frame is added again (rather than drawn again),
+             but each repeat is still a page of the animation.
+           * *static*: List of Asymptote commands that draw static
+             parts of the animation (eg, reference lines) into the
+             background picture ``bg``, eg, ``['draw(bg, (0,0)--(1,0),
+             dotted)']``.
+
+           The static parts of the animation (axes, ticks, labels,
+           and *static*) are rendered once, and only the data and the
+           time label are drawn in each frame.
+
+           Resampling and duplicate elimination are done (by PyAsy)
+           before the data is sent to Asymptote.  Return the time
+           stamps of the frames that were kept.
 
         """
 
         asy = self.asy
         pen = self._pen(pen, **kwargs)
 
+        x = np.asanyarray(x)
+        t = np.asanyarray(t)
+        y = np.asanyarray(y)
+
+        if rate is not None or frames is not None:
+            t, y = self._resample(t, y, frames, rate)
+
+        repeats = None
+        if tolerance is not None:
+            t, y, repeats = self._unique(t, y, tolerance)
+
+        kx = self._stride(len(x), self.preview_grid)
+        if kx > 1:
+            # clip to the limits before decimating
+            s = self._clip(x, xlims)
+            x, y = x[s], y[:,s]
+            kx = self._stride(len(x), self.preview_grid)
+
+        kt = self._stride(len(t), self.preview_frames)
+
+        k, rasterize = self._degrade('frame', len(t))
+        kt = max(kt, k)
+
+        if kx > 1:
+            # keep the last sample, and the gaps (nans) in any frame
+            keep = np.arange(len(x)) % kx == 0
+            keep |= np.isnan(y).any(axis=0)
+            keep[-1] = True
+            x, y = x[keep], y[:,keep]
+
+        if kt > 1:
+            t = t[::kt]
+            y = y[::kt]
+            if repeats is not None:
+                repeats = np.add.reduceat(repeats, np.arange(0, len(repeats), kt))
+
         # size
         w, h, k = self.size
         k = str(k).lower()
@@ -101,63 +176,158 @@ class Animation(base.Base):
         o = xticks[1]
         ticks = xticks[0] + '(' + ','.join(['%s=%s' % (str(k), str(o[k])) for k in o]) + ')'
 
-        xaxis = '''xaxis(p,
+        xaxis = '''xaxis(bg,
                          Label("%(xlabel)s", MidPoint, S),
                          YEquals(y1),
                          x1, x2,
                          %(ticks)s,
                          above=true
-                         )''' % { 'xlabel': xlabel,
+                         )''' % { 'xlabel': self._label(xlabel),
                                   'ticks': ticks }
 
         # y ticks
         o = yticks[1]
         ticks = yticks[0] + '(' + ','.join(['%s=%s' % (str(k), str(o[k])) for k in o]) + ')'
 
-        yaxis = '''yaxis(p,
+        yaxis = '''yaxis(bg,
                          "%(ylabel)s",
                          LeftRight,
                          y1, y2,
                          %(ticks)s,
                          above=true
-                         )''' % { 'ylabel': ylabel,
+                         )''' % { 'ylabel': self._label(ylabel),
                                    'ticks': ticks }
 
         # time label
         if tlabel is None:
             tlabel = ''
         else:
-            tlabel = 'label(p, %(format)s, (%(x)s, %(y)s), %(direction)s);' % tlabel
+            tlabel = 'label(p, %(format)s, T*(%(x)s, %(y)s), %(direction)s);' % tlabel
+
 
+        # repeated frames
+        if repeats is not None:
+            self.asy.load([ ('R', repeats) ])
+            add = 'for (int r=0; r<R[i]; ++r) a.add(p);'
+        else:
+            add = 'a.add(p);'
 
         # animate!
         self._slurp3(x, t, y)
+        self._account('frame', t.size)
+        self._account('line', y.size)
         self.asy.send('''animation a;
           ZZ = transpose(ZZ);
 
+          picture bg;
+          size(bg, %(size)s);
+          %(xaxis)s;
+          %(yaxis)s;
+          %(static)s
+          frame background = bg.fit();
+          transform T = bg.calculateTransform();
+
           for (int i=0; i<Y.length; ++i) {
             picture p;
             real t = Y[i];
-            size(p, %(size)s);
-            draw(p, graph(X, ZZ[i][:]), %(pen)s);
-            %(xaxis)s;
-            %(yaxis)s;
+            add(p, background);
+            draw(p, T*graph(X, ZZ[i][:]), %(pen)s);
             %(tlabel)s
-            a.add(p);
+            %(add)s
           }
 
         ''' % {'size': size, 'pen': pen,
-               'xaxis': xaxis, 'yaxis': yaxis, 'tlabel': tlabel })
+               'xaxis': xaxis, 'yaxis': yaxis, 'tlabel': tlabel,
+               'static': ''.join([ c + ';' for c in static or [] ]),
+               'add': add })
+
+        return t
+
+
+    def _resample(self, t, y, frames=None, rate=None):
+        """Resample the frames *y* (indexed as ``y[n,i]``) at times
+           *t* to *frames* equally spaced frames (or *rate* frames per
+           unit of time).  Return the new ``(t, y)``."""
+
+        # duplicate time stamps: keep the first frame
+        t, first = np.unique(t, return_index=True)
+        y = y[first]
+
+        if len(t) < 2:
+            return t, y
+
+        if rate is not None:
+            tn = np.arange(t[0], t[-1] + 0.5/rate, 1.0/rate)
+            tn = np.minimum(tn, t[-1])
+        else:
+            tn = np.linspace(t[0], t[-1], frames)
+
+        # linear interpolation (in time) of every sample at once
+        j = np.clip(np.searchsorted(t, tn, side='right') - 1, 0, len(t) - 2)
+        w = ((tn - t[j])/(t[j+1] - t[j]))[:,np.newaxis]
+
+        return tn, (1.0 - w)*y[j] + w*y[j+1]
+
+
+    def _unique(self, t, y, tolerance):
+        """Drop the frames of *y* that differ from the last kept
+           frame by no more than *tolerance*.  Return the kept ``(t,
+           y, repeats)``, where *repeats* is the number of frames each
+           kept frame stands for."""
+
+        n = len(t)
+        if n < 2:
+            return t, y, np.ones(n, dtype=int)
+
+        y2 = np.reshape(y, (n, -1))
+        index = np.arange(n)
+
+        # frames that differ from the previous frame by more than twice
+        # the tolerance are kept whatever the last kept frame is
+        keep = np.zeros(n, dtype=bool)
+        keep[0] = True
+        keep[1:] = np.abs(np.diff(y2, axis=0)).max(axis=1) > 2*tolerance
+
+        # the others are compared to the last kept frame: the first
+        # frame of each run that is too far from it is kept, until no
+        # frame is
+        while True:
+            last = np.maximum.accumulate(np.where(keep, index, 0))
+            over = np.flatnonzero(np.abs(y2 - y2[last]).max(axis=1) > tolerance)
+            if not over.size:
+                break
+            keep[over[np.unique(last[over], return_index=True)[1]]] = True
+
+        kept = np.flatnonzero(keep)
+        return t[kept], y[kept], np.diff(np.append(kept, n))
 
 
     ##################################################################
 
-    def shipout(self, basename='animation', render=False):
-        """Shipout the current animation."""
+    @base.synchronized
+    def shipout(self, basename='animation', render=False, close=True,
+                memory=False, file=None):
+        """Shipout the current animation.
+
+           If *memory* is True, the animation is returned as a string
+           (rather than written to the current directory), or, if a
+           *file* (a file-like object) is given, written to it (see
+           :func:`pyasy.plot.Plot.shipout`).
+
+           If *close* is False, the Asymptote session is kept alive
+           (see :func:`pyasy.plot.Plot.shipout`).
+
+           """
 
         asy = self.asy
 
-        if render:
+        self._check_budget()
+
+        if self.preview:
+            ship = '''
+              add(a.pictures[a.pictures.length-1]);
+              shipout("%(basename)s", format="png")'''
+        elif render:
             ship = '''
               label(a.pdf("controls", multipage=false));
               shipout("%(basename)s", "pdf")'''
@@ -166,5 +336,12 @@ class Animation(base.Base):
               a.global=true;
               a.export("%(basename)s", NoBox, multipage=true)'''
 
+        if memory or file is not None:
+            return self._shipout_memory(lambda name: asy.send(ship % {'basename': name}),
+                                        basename, 'png' if self.preview else 'pdf',
+                                        close, file)
+
         asy.send(ship % {'basename': basename})
-        asy.close()
+
+        if close:
+            asy.close()
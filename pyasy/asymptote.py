@@ -1,7 +1,19 @@
 """PyAsy Asymptote class."""
 
+import os
+import select
+import shutil
 import struct
 import subprocess
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import container
+import resources
+import shared
 
 class Asymptote(object):
     """PyAsy Asymptote class (used to communicate with an Asymptote
@@ -21,10 +33,46 @@ class Asymptote(object):
          (This can be enable later by setting the *echo* instance
          variable.)
 
+       * *directory* - Working directory of the Asymptote engine
+         (output is written here).  Defaults to the current
+         directory.
+
+       * *memory_limit* - Memory limit (in megabytes) of the Asymptote
+         engine (and the processes it runs, eg, LaTeX).  Defaults to
+         the ``PYASY_MEMORY_LIMIT`` environment variable, if set.
+
+       * *cpu_limit* - CPU time limit (in seconds) of the Asymptote
+         engine (and the processes it runs).  Defaults to the
+         ``PYASY_CPU_LIMIT`` environment variable, if set.
+
+       An engine that exceeds its limits is killed, and the next
+       command (or :func:`close`) raises a
+       :class:`pyasy.resources.ResourceError`.  The memory and CPU
+       time used by the engine are sampled while it runs (see
+       :func:`usage`).
+
+       **Threads**
+
+       Each instance owns its Asymptote engine and a private scratch
+       directory for slurp files, so independent instances can be
+       used from different threads at the same time.  Commands and
+       data transfers are serialised by the re-entrant *lock* of the
+       instance, which can also be held to make a sequence of
+       commands atomic (eg, slurping data and then drawing it)::
+
+       >>> with plot.asy.lock:
+       ...     plot.asy.slurp2(x, y)
+       ...     plot.asy.send('draw(graph(X, Y))')
+
        **Methods**
 
        """
 
+    # slurp arrays (and their types)
+    asy_types = { 'X': ('real[]', float), 'Y': ('real[]', float),
+                  'Z': ('real[]', float), 'ZZ': ('real[][]', float),
+                  'O': ('int[]', 'intc') }
+
     asy_slurp2 = """void slurp2(string filename) {
                       file dat = binput(filename);
 
@@ -61,14 +109,84 @@ class Asymptote(object):
                       close(dat);
                     }"""
 
+    asy_slurp2o = """void slurp2o(string filename) {
+                       file dat = binput(filename);
+
+                       int N = dat;
+                       int K = dat;
+
+                       X = new real[N];
+                       Y = new real[N];
+
+                       X[:] = dat.dimension(N);
+                       Y[:] = dat.dimension(N);
+                       O = dat.dimension(K);
+
+                       close(dat);
+                     }"""
+
+    asy_segments = """path[] segments(real[] x, real[] y, int[] offsets) {
+                        path[] g;
+
+                        for (int k=0; k<offsets.length-1; ++k)
+                          g.push(graph(x[offsets[k]:offsets[k+1]],
+                                       y[offsets[k]:offsets[k+1]]));
+
+                        return g;
+                      }"""
+
+    asy_pairs = """void drawpairs(picture pic, real[] x, real[] y, pen p,
+                                   arrowbar bar=None) {
+                     for (int i=0; i<x.length-1; i+=2)
+                       draw(pic, (x[i],y[i])--(x[i+1],y[i+1]), p, bar=bar);
+                   }
+
+                   void fillpairs(picture pic, real[] x, real[] y, pen p) {
+                     for (int i=0; i<x.length-1; i+=2)
+                       fill(pic, box((x[i],y[i]), (x[i+1],y[i+1])), p);
+                   }
 
-    def __init__(self, echo=False, **kwargs):
+                   void labelpoints(picture pic, string[] s, real[] x, real[] y,
+                                    align a, pen p) {
+                     for (int i=0; i<s.length; ++i)
+                       label(pic, s[i], (x[i],y[i]), a, p);
+                   }"""
+
+    asy_triangles = """void filltriangles(picture pic, real[] x, real[] y, int[] t,
+                                           real[] c, pen[] pal, pen edges=nullpen) {
+                         int n = pal.length-1;
+                         for (int i=0; i<c.length; ++i) {
+                           int k = 3*i;
+                           path g = (x[t[k]],y[t[k]])--(x[t[k+1]],y[t[k+1]])
+                                    --(x[t[k+2]],y[t[k+2]])--cycle;
+                           filldraw(pic, g, pal[round(c[i]*n)], edges);
+                         }
+                       }"""
+
+
+    def __init__(self, echo=False, directory=None,
+                 memory_limit=None, cpu_limit=None, **kwargs):
         self.echo = echo
+        self.directory = directory
+        self.memory_limit, self.cpu_limit = resources.limits(memory_limit, cpu_limit)
+        self.monitor = None
+        self.lock = threading.RLock()
+        self.scratch = None
+        self.written = []
+        self.finished = []
+        self.recorder = None
+        self.slurps = []
         self.open()
         self.send('real[] X, Y, Z')
         self.send('real[][] ZZ')
+        self.send('int[] O')
         self.send(self.asy_slurp2)
+        self.send(self.asy_slurp2o)
         self.send(self.asy_slurp3)
+        self.send(self.asy_segments)
+        self.send(self.asy_pairs)
+        self.send(self.asy_triangles)
+        self.send(container.asy_load)
 
         self.count = 0
 
@@ -76,32 +194,44 @@ class Asymptote(object):
     def send(self, cmd):
         """Send a command to the Asymptote engine.  A trailing
            semicolon is added automatically."""
-        if self.echo:
-            print cmd+';'
+        with self.lock:
+            if self.echo:
+                print cmd+';'
 
-        self.session.stdin.write(cmd+';\n')
-        self.session.stdin.flush()
+            self._check()
 
+            try:
+                self.session.stdin.write(cmd+';\n')
+                self.session.stdin.flush()
+            except IOError:
+                # the engine was killed (see pyasy.resources)
+                self._check()
+                raise
 
-    def slurp2(self, x, y, **kwargs):
+
+    def slurp2(self, x, y, offsets=None, **kwargs):
         """Send the *x* and *y* ndarrays to the Asymptote engine.
 
            The slurpped data is stored, in Asymptote, in the ``X`` and
            ``Y`` arrays (of type ``real``).
 
-           """
+           If *offsets* is given, it is sent in the same transfer and
+           stored in the ``O`` array (of type ``int``).  Segment ``k``
+           of a gapped series is then ``X[O[k]:O[k+1]]`` (see the
+           Asymptote ``segments`` function).
 
-        slurp = '.tmp%d.dat' % (self.count)
-
-        f = open(slurp, 'wb')
-        f.write(struct.pack("i", x.size))
-        x.tofile(f)
-        y.tofile(f)
-        f.close()
+           """
 
-        self.count = self.count + 1
+        parts = [ struct.pack("i", x.size) ]
+        if offsets is not None:
+            parts.append(struct.pack("i", offsets.size))
+        parts.extend([ x, y ])
 
-        self.send('slurp2("%s")' % (slurp))
+        if offsets is not None:
+            parts.append(offsets.astype('intc'))
+            self._transfer('slurp2o', parts)
+        else:
+            self._transfer('slurp2', parts)
 
 
     def slurp3(self, x, y, z, **kwargs):
@@ -115,25 +245,242 @@ class Asymptote(object):
 
            """
 
-        slurp = '.tmp%d.dat' % (self.count)
+        self._transfer('slurp3', [ struct.pack("i", x.size),
+                                   struct.pack("i", y.size),
+                                   x, y, z ])
+
+
+    def load(self, arrays, **kwargs):
+        """Send *arrays* (a list of ``(name, ndarray)`` pairs) to the
+           Asymptote engine in one transfer (see
+           :mod:`pyasy.container`).
+
+           Each array is stored, in Asymptote, in a variable of the
+           same *name*: one-dimensional arrays as ``real[]`` or
+           ``int[]`` (depending on their type), two-dimensional
+           floating point arrays as ``real[][]`` (indexed as
+           ``name[i][j]``), and other arrays as flat ``real[]`` or
+           ``int[]`` (in C order).  The slurp arrays (``X``, ``Y``,
+           ``Z``, ``ZZ``, and ``O``) are assigned, and other variables
+           are declared.
+
+           """
+
+        arrays = [ (name, np.asanyarray(a, dtype=self.asy_types[name][1])
+                    if name in self.asy_types else np.asanyarray(a))
+                   for name, a in arrays ]
+
+        self._transfer('load', container.parts(arrays))
+
+        commands = []
+        for k, (name, a) in enumerate(arrays):
+            if name in self.asy_types:
+                asy_type = self.asy_types[name][0]
+            elif container.dtype(a).kind != 'f':
+                asy_type = 'int[]'
+            elif a.ndim == 2:
+                asy_type = 'real[][]'
+            else:
+                asy_type = 'real[]'
+
+            value = { 'real[]': 'Reals[%d]', 'int[]': 'Ints[%d]',
+                      'real[][]': 'grid(Reals[%d], Shapes[%d])' }[asy_type]
+            value = value % ((k,)*value.count('%d'))
+
+            if name in self.asy_types:
+                commands.append('%s = %s' % (name, value))
+            else:
+                commands.append('%s %s = %s' % (asy_type, name, value))
+
+        self.send('; '.join(commands))
 
-        f = open(slurp, 'wb')
-        f.write(struct.pack("i", x.size))
-        f.write(struct.pack("i", y.size))
-        x.tofile(f)
-        y.tofile(f)
-        z.tofile(f)
-        f.close()
 
-        self.count = self.count + 1
+    def replay(self, slurps):
+        """Read the next data transfers from the existing slurp files
+           *slurps* (in order) instead of writing them (see
+           :mod:`pyasy.session`)."""
 
-        self.send('slurp3("%s")' % (slurp))
+        with self.lock:
+            self.slurps = list(slurps)
+
+
+    def _transfer(self, reader, parts):
+        """Write *parts* (strings and ndarrays) to a new slurp file
+           and read it with the Asymptote function *reader*.  If the
+           ndarrays are shared arrays laid out exactly as *parts*,
+           their file is read instead (see :mod:`pyasy.shared`)."""
+
+        with self.lock:
+            # replayed transfers are read from the session archive
+            if self.slurps:
+                self.send('%s("%s")' % (reader, self.slurps.pop(0)))
+                return
+
+            # shared arrays are read directly (see pyasy.shared)
+            slurp = shared.filename(parts)
+            if slurp is not None:
+                if self.recorder is not None:
+                    self.recorder.slurp(slurp)
+                self.send('%s("%s")' % (reader, slurp))
+                return
+
+            if self.scratch is None:
+                self.scratch = tempfile.mkdtemp(prefix='pyasy-')
+
+            slurp = os.path.join(self.scratch, '.tmp%d.dat' % (self.count))
+
+            f = open(slurp, 'wb')
+            for part in parts:
+                if isinstance(part, str):
+                    f.write(part)
+                else:
+                    part.tofile(f)
+            f.close()
+
+            self.written.append(slurp)
+            self.count = self.count + 1
+
+            if self.recorder is not None:
+                self.recorder.slurp(slurp)
+
+            self.send('%s("%s")' % (reader, slurp))
 
 
     def open(self):
-        self.session = subprocess.Popen(['asy'],stdin=subprocess.PIPE)
+        self.cwd = os.path.abspath(self.directory or os.curdir)
+
+        self.session = subprocess.Popen(['asy'],stdin=subprocess.PIPE,
+                                        cwd=self.directory)
+
+        self.monitor = resources.Monitor(self.session,
+                                         memory_limit=self.memory_limit,
+                                         cpu_limit=self.cpu_limit,
+                                         kill=self._kill)
+        self.monitor.start()
+
+
+    def private(self):
+        """Return a new private output directory as ``(path,
+           name)``: its *path*, and its *name* relative to the working
+           directory of the engine (which is where it is created, as
+           Asymptote only writes below its working directory).  The
+           caller removes it."""
+
+        path = tempfile.mkdtemp(prefix='.pyasy-', dir=self.cwd)
+        return path, os.path.relpath(path, self.cwd)
+
+
+    def sync(self):
+        """Wait for the Asymptote engine to finish the commands sent
+           so far (eg, a shipout), and remove the slurp files it has
+           read.  The functions in *finished* are then called (eg, to
+           collect the files written by the engine, see
+           :mod:`pyasy.labels`)."""
+
+        with self.lock:
+            written, self.written = self.written, []
+
+            # the fifo is in a private directory below the working
+            # directory of the engine (where it is allowed to write)
+            path, name = self.private()
+            fifo = os.path.join(path, 'sync')
+
+            # the engine writes to the fifo once it gets there
+            os.mkfifo(fifo)
+            fd = os.open(fifo, os.O_RDONLY | os.O_NONBLOCK)
+            try:
+                self.send('file sync = output("%s"); write(sync, 1); close(sync)'
+                          % os.path.join(name, 'sync'))
+
+                while True:
+                    if select.select([ fd ], [], [], 0.1)[0] and os.read(fd, 64):
+                        break
+                    if not resources.alive(self.session.pid):
+                        self._check()
+                        raise RuntimeError('pyasy: Asymptote engine exited')
+                    time.sleep(0.01)
+            finally:
+                os.close(fd)
+                shutil.rmtree(path, ignore_errors=True)
+
+            for slurp in written:
+                os.remove(slurp)
+
+            for f in self.finished:
+                f()
+
+
+    def release(self):
+        """Remove the slurp files written so far once the engine has
+           read them (see :func:`sync`), so that a long running engine
+           (see :mod:`pyasy.live`) doesn't fill its scratch
+           directory."""
+
+        with self.lock:
+            if self.written:
+                self.sync()
+
+
+    def _kill(self):
+
+        # the engine along with the processes it runs (eg, LaTeX); the
+        # process tree is walked rather than running the engine in its
+        # own session, which would need an unsafe preexec_fn when
+        # other threads are running
+        resources.kill(self.session.pid)
+
+
+    def _check(self):
+        """Raise a ResourceError if the engine exceeded its limits."""
+
+        if self.monitor is not None and self.monitor.error is not None:
+            raise resources.ResourceError(self.monitor.error)
+
+
+    def usage(self):
+        """Return a dictionary with the memory (*rss* and *peak_rss*,
+           in bytes) and the CPU time (*cpu*, in seconds) used by the
+           Asymptote engine (and the processes it runs) so far, or in
+           total once the engine is closed."""
+
+        if self.monitor is None:
+            return { 'rss': 0, 'peak_rss': 0, 'cpu': 0.0, 'samples': 0 }
+
+        return self.monitor.usage()
 
 
     def close(self):
-        self.session.stdin.close();
-        self.session.wait()
+        """Close the Asymptote engine (and wait for it to finish)."""
+
+        with self.lock:
+            if self.session.stdin.closed:
+                return
+
+            try:
+                self.session.stdin.close();
+            except IOError:
+                pass
+
+            # total resource usage of the finished engine (including
+            # the processes it ran); the monitor doesn't reap the
+            # engine, so that it is reaped here
+            try:
+                pid, status, usage = os.wait4(self.session.pid, 0)
+                self.session.returncode = (-os.WTERMSIG(status) if os.WIFSIGNALED(status)
+                                           else os.WEXITSTATUS(status))
+                with self.monitor.lock:
+                    self.monitor.rss = 0
+                    self.monitor.cpu = max(self.monitor.cpu, usage.ru_utime + usage.ru_stime)
+                    self.monitor.peak_rss = max(self.monitor.peak_rss, usage.ru_maxrss*1024)
+            except (OSError, AttributeError):
+                self.session.wait()
+
+            self.monitor.stop()
+
+            if self.scratch is not None:
+                shutil.rmtree(self.scratch, ignore_errors=True)
+
+            self._check()
+
+            for f in self.finished:
+                f()
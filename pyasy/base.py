@@ -1,10 +1,58 @@
 """PyAsy base object (helper functions)."""
 
+import functools
+import os
+import shutil
 import textwrap
+import warnings
 
 import numpy as np
 
 import asymptote
+import cost
+import labels
+import pipeline
+import raster
+import scales
+
+
+######################################################################
+
+def synchronized(method):
+    """Decorator: hold the Asymptote engine lock while *method* runs.
+
+       Every method of a plot that talks to the engine or changes the
+       plot state is synchronized, so that a plot can be shared by
+       several threads (eg, the data slurped by one method can't be
+       replaced by another thread before it is drawn).
+
+       """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.asy.lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def recorded(method):
+    """Decorator: record calls of *method* in the session archive of
+       the plot, if it is being recorded (see :mod:`pyasy.session`)."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        recorder = self.asy.recorder
+        if recorder is None:
+            return method(self, *args, **kwargs)
+
+        recorder.begin(method.__name__, args, kwargs)
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            recorder.end()
+
+    return wrapper
 
 
 ######################################################################
@@ -12,20 +60,76 @@ import asymptote
 class Base(object):
     """PyAsy base object."""
 
+    # preview mode limits
+    preview_points = 2000               # samples per line/scatter
+    preview_grid   = 128                # samples per density/animation axis
+    preview_frames = 12                 # animation frames
+    preview_render = 1                  # pixels per bp
+
+    # default resolution of rasterized layers
+    raster_dpi = 300
+
+    # the render budget doesn't decimate artists below these counts
+    # (see _degrade)
+    budget_minimum = { 'frame': 10 }
+    budget_minimum_default = 100
+
     def __init__(self,
                  xlims=None, ylims=None,
                  smooth=None,
                  size=(4,4,False),
                  defaultpen=None, plotpen=None,
                  markers=False,
+                 preview=None,
+                 label_cache=None,
+                 server=None,
+                 budget=None,
+                 record=None,
+                 xscale=None, yscale=None,
+                 workers=None,
                  **kwargs):
 
+        # preview mode (defaults to the PYASY_PREVIEW environment variable)
+        if preview is None:
+            preview = os.environ.get('PYASY_PREVIEW', '') not in ('', '0')
+
+        # label cache (defaults to the PYASY_LABEL_CACHE environment
+        # variable); there is no LaTeX to cache in preview mode
+        if label_cache is None:
+            label_cache = os.environ.get('PYASY_LABEL_CACHE') or None
+
+        if isinstance(label_cache, str):
+            label_cache = labels.cache(label_cache)
+
+        # session recording (see pyasy.session), before the engine is
+        # started in case the arguments can't be recorded
+        recorder = None
+        if record is not None:
+            import session
+            init = dict(xlims=xlims, ylims=ylims, smooth=smooth, size=size,
+                        defaultpen=defaultpen, plotpen=plotpen,
+                        markers=markers, preview=preview, budget=budget,
+                        label_cache=label_cache,
+                        xscale=xscale, yscale=yscale, workers=workers)
+            init.update(kwargs)
+            recorder = session.Recorder(record, type(self).__name__, init)
+
         # init asy
-        asy = asymptote.Asymptote(**kwargs)
+        if server is not None:
+            import daemon
+            asy = daemon.RemoteAsymptote(server, **kwargs)
+        else:
+            asy = asymptote.Asymptote(**kwargs)
+        asy.recorder = recorder
         asy.send('import graph')
         asy.send('import contour')
         asy.send('import palette')
 
+        if preview:
+            asy.send('settings.tex="none"')
+            asy.send('settings.outformat="png"')
+            asy.send('settings.render=%d' % self.preview_render)
+
         # init pens
         if defaultpen is not None:
             if isinstance(defaultpen, str):
@@ -51,6 +155,13 @@ class Base(object):
             import markers
             asy.send(markers.markers)
 
+        # init label outlines (see pyasy.labels)
+        if label_cache is not None and not preview:
+            asy.send(labels.asy_outlines)
+            asy.finished.append(self._store_labels)
+        else:
+            label_cache = None
+
         # init self
         self.asy = asy
         self.xlims = xlims
@@ -58,13 +169,180 @@ class Base(object):
         self.size = size
         self.picture = 0
         self.plots = []
+        self.composed = 0
         self.palette = False
         self.export_tex = False
         self.smooth = smooth
+        self.preview = preview
+        self.label_cache = label_cache
+        self.tex = 'latex'
+        self.outlines = {}
+        self.unsaved = []
+        self.label_directory = None
+        self.remote = server is not None
+        self.budget = budget
+        self.counts = {}
+        self.simplified = None
+        self.workers = pipeline.workers(workers)
+        self.pool = pipeline.pool(self.workers)
+        self.xscale = scales.scale(xscale)
+        self.yscale = scales.scale(yscale)
 
 
     ##################################################################
 
+    @synchronized
+    def close(self):
+        """Close the Asymptote engine.
+
+           This is only necessary if the plot was shipped out with
+           *close* set to False.
+
+           """
+
+        self.asy.close()
+
+
+    ##################################################################
+
+    def estimate(self):
+        """Return a dictionary with the counts of what has been queued
+           so far (see :mod:`pyasy.cost`), and the predicted render
+           *time* (seconds) and output *size* (bytes)."""
+
+        if self.budget is not None:
+            t, s = self.budget.predict(self.counts)
+        else:
+            t, s = cost.model.predict(self.counts)
+
+        return { 'counts': dict(self.counts), 'time': t, 'size': s }
+
+
+    def usage(self):
+        """Return a dictionary with the memory (*rss* and *peak_rss*,
+           in bytes) and the CPU time (*cpu*, in seconds) used by the
+           Asymptote engine of the figure (see
+           :func:`pyasy.asymptote.Asymptote.usage`).  Once the figure
+           is shipped out, these are the totals for the figure."""
+
+        return self.asy.usage()
+
+
+    ##################################################################
+
+    def _shipout_memory(self, ship, basename, format, close=True, file=None):
+        """Ship out with *ship* (a function of the name to ship out
+           to) to a private directory of the engine, and return the
+           output in *format* (a string, or a dictionary of strings
+           keyed by format if *format* is a list), or write it to
+           *file*."""
+
+        formats = [format] if isinstance(format, str) else format
+        if file is not None and len(formats) != 1:
+            raise ValueError('pyasy: only one format can be written to a file')
+
+        path, name = self.asy.private()
+        try:
+            ship(os.path.join(name, basename))
+
+            if close:
+                self.asy.close()
+            else:
+                self.asy.sync()
+
+            outputs = {}
+            for fmt in formats:
+                filename = '%s.%s' % (basename, fmt)
+                if path is None:
+                    # render server (the output may have been moved to
+                    # its output directory)
+                    outputs[fmt] = self.asy.outputs[filename]
+                    if self.asy.output is None:
+                        continue
+                    filename = outputs[fmt]
+                else:
+                    filename = os.path.join(path, filename)
+
+                f = open(filename, 'rb')
+                outputs[fmt] = f.read()
+                f.close()
+
+        finally:
+            if path is not None:
+                shutil.rmtree(path, ignore_errors=True)
+
+        if file is not None:
+            file.write(outputs[formats[0]])
+            return None
+
+        if isinstance(format, str):
+            return outputs[format]
+
+        return outputs
+
+
+    def _account(self, kind, n):
+        self.counts[kind] = self.counts.get(kind, 0) + n
+
+
+    def _degrade(self, kind, n, rasterize=False, pending=None):
+        """Apply the budget policy to an artist of *n* units of
+           *kind*, given the *pending* counts (of the artists that
+           have been degraded but not yet drawn, see
+           :func:`pyasy.plot.Plot.lines`).  Return ``(stride,
+           rasterize)``.
+
+           An artist isn't decimated below *budget_minimum* units: it
+           is rasterized instead (if it can be), or decimated to the
+           minimum with a warning.
+
+           """
+
+        budget = self.budget
+        if budget is None or rasterize:
+            return 1, rasterize
+
+        counts = dict(self.counts)
+        for k in pending or {}:
+            counts[k] = counts.get(k, 0) + pending[k]
+
+        allowed = budget.allowance(counts, kind)
+        if n <= allowed:
+            return 1, False
+
+        if budget.action == 'warn':
+            warnings.warn('pyasy: %s of %d units exceeds the render budget'
+                          % (kind, n))
+            return 1, False
+
+        rasterizable = kind in ('line', 'scatter', 'density', 'triangle')
+        if budget.action == 'rasterize' and rasterizable:
+            return 1, True
+
+        k = int(np.ceil(n/max(allowed, 1.0)))
+        minimum = min(n, self.budget_minimum.get(kind, self.budget_minimum_default))
+        if -(-n//k) >= minimum:
+            return k, False
+
+        if rasterizable:
+            warnings.warn('pyasy: %s of %d units exceeds the render budget '
+                          '(rasterized rather than decimated)' % (kind, n))
+            return 1, True
+
+        warnings.warn('pyasy: %s of %d units exceeds the render budget '
+                      '(decimated to %d units)' % (kind, n, minimum))
+        return max(n//minimum, 1), False
+
+
+    def _check_budget(self):
+
+        if self.budget is not None and self.budget.over(self.counts):
+            e = self.estimate()
+            warnings.warn('pyasy: predicted render time (%.1fs) or size '
+                          '(%d bytes) exceeds the render budget'
+                          % (e['time'], e['size']))
+
+
     def _pen(self, pen, **kwargs):
 
         if pen is not None:
@@ -81,6 +359,118 @@ class Base(object):
         return '+'.join(pen)
 
 
+    def _label(self, label):
+
+        # no LaTeX in preview mode: drop math delimiters
+        if self.preview:
+            return label.replace('$', '')
+
+        return label
+
+
+    def _outlines(self, text):
+        """Return the name of an Asymptote frame with the outlines of
+           the (typeset) label *text*, from the label cache (see
+           :mod:`pyasy.labels`).  Labels that aren't in the cache are
+           typeset (by ``texpath``), and their outlines are added to
+           the cache once the engine has finished."""
+
+        cache = self.label_cache
+        key = cache.key(text, self.tex, self.defaultpen)
+        if key in self.outlines:
+            return self.outlines[key]
+
+        name = 'L%d' % len(self.outlines)
+        self.outlines[key] = name
+
+        outlines = cache.lookup(key)
+        if outlines is not None:
+            self.asy.load([ (name + 'a', outlines) ])
+            self.asy.send('frame %s = fillframe(readoutlines(%sa))' % (name, name))
+            return name
+
+        self.asy.send('path[] %sg = texpath(Label(%s))' % (name, self._string(text)))
+        self.asy.send('frame %s = fillframe(%sg)' % (name, name))
+
+        # the render server writes in its own directory
+        if not self.remote:
+            if self.label_directory is None:
+                self.label_directory = self.asy.private()
+
+            path, directory = self.label_directory
+            self.asy.send('writeoutlines("%s", %sg)'
+                          % (os.path.join(directory, key), name))
+            self.unsaved.append((key, os.path.join(path, key)))
+
+        return name
+
+
+    def _store_labels(self):
+
+        # add the outlines written by the engine to the label cache
+        # (see _outlines)
+        unsaved, self.unsaved = self.unsaved, []
+
+        for key, filename in unsaved:
+            try:
+                self.label_cache.store(key, filename)
+            except (IOError, OSError), e:
+                warnings.warn('pyasy: label not cached: %s' % e)
+
+        if self.label_directory is not None:
+            shutil.rmtree(self.label_directory[0], ignore_errors=True)
+            self.label_directory = None
+
+
+    def _string(self, s):
+        """Return *s* as an Asymptote string literal (backslashes and
+           double quotes are escaped, so that the string reads back as
+           is)."""
+
+        return '"%s"' % s.replace('\\', '\\\\').replace('"', '\\"')
+
+
+    def _stride(self, n, limit):
+
+        # decimate n samples down to (at most) limit samples in preview mode
+        if not self.preview or n <= limit:
+            return 1
+
+        return int(np.ceil(float(n)/limit))
+
+
+    def _clip(self, a, lims):
+        """Return the slice of the (sorted) grid coordinates *a* within
+           *lims* (and one more on each side), or of all of them if
+           *lims* is None."""
+
+        if lims is None or not len(a):
+            return slice(0, len(a))
+
+        lo, hi = min(lims), max(lims)
+        start = max(np.searchsorted(a, lo, side='left') - 1, 0)
+        stop = min(np.searchsorted(a, hi, side='right') + 1, len(a))
+
+        return slice(start, max(stop, start + 1))
+
+
+    def _decimate_grid(self, x, y, z, kx, ky):
+        """Decimate the grid *z* (indexed as ``z[i,j]`` at ``(x[i],
+           y[j])``) by *kx* and *ky*.  A decimated value is NaN if its
+           block of the grid has a gap (NaN or masked value), so that
+           the gaps are kept."""
+
+        gap = np.ma.getmaskarray(z) | ~np.isfinite(np.ma.getdata(z))
+        ix = np.arange(0, len(x), kx)
+        iy = np.arange(0, len(y), ky)
+        gap = np.logical_or.reduceat(np.logical_or.reduceat(gap, ix, axis=0), iy, axis=1)
+
+        z = np.array(np.ma.getdata(z)[::kx,::ky], dtype=float)
+        z[gap] = np.nan
+
+        return x[::kx], y[::ky], z
+
+
     def _picture(self, **kwargs):
 
         if self.picture == 0:
@@ -89,50 +479,432 @@ class Base(object):
         return 'p%d' % (self.picture)
 
 
-    def _filter_and_slurp2(self, x, y, **kwargs):
+    def _filter2(self, x, y, parallel=True, **kwargs):
+        """Filter (and smooth) *x* and *y*.
+
+           NaN, infinite and masked (``numpy.ma``) values are treated
+           as gaps and removed.  Return ``(x, y, offsets)``, where
+           *offsets* are the offsets of each contiguous segment (see
+           :func:`pyasy.asymptote.Asymptote.slurp2`).
+
+           If *parallel* is True, large arrays are filtered in chunks
+           on the preprocessing pool (see :mod:`pyasy.pipeline`).
+
+           """
+
+        x, y, offsets, columns = self._filter2_columns(x, y, [], parallel=parallel)
+
+        return x, y, offsets
+
 
-        x = 1.0*np.array(x)
-        y = 1.0*np.array(y)
+    def _filter2_columns(self, x, y, columns, parallel=True, **kwargs):
+        """As :func:`_filter2`, but also filter the per point
+           *columns* (a list of arrays, or None) along with *x* and
+           *y*.  Non-finite values in the columns are gaps too.
+           Return ``(x, y, offsets, columns)``.
+
+           """
+
+        x = np.ma.asarray(x)
+        y = np.ma.asarray(y)
 
         if len(y) > len(x):
            y = y[:len(x)]
 
-        if self.xlims is not None:
-            i = x > self.xlims[0]
-            x = x[i]
-            y = y[i]
+        columns = [ c if c is None else np.ma.asarray(c) for c in columns ]
+
+        pool = self.pool if parallel else None
+
+        def mask(s):
+            # scale, and mark gaps (and points outside xlims) in a chunk
+            cx = np.ma.masked_invalid(self._scaled(0, 1.0*x[s]))
+            cy = np.ma.masked_invalid(self._scaled(1, 1.0*y[s]))
+            cc = [ c if c is None else np.ma.masked_invalid(1.0*c[s]) for c in columns ]
+
+            gap  = np.ma.getmaskarray(cx) | np.ma.getmaskarray(cy)
+            for c in cc:
+                if c is not None:
+                    gap |= np.ma.getmaskarray(c)
+            keep = ~gap
+
+            if self.xlims is not None:
+                xlims = self._scaled(0, self.xlims)
+                with np.errstate(invalid='ignore'):
+                    keep &= (cx.data > xlims[0]) & (cx.data < xlims[1])
+
+            return (cx.data, cy.data, [ c if c is None else c.data for c in cc ],
+                    gap, keep)
+
+        parts = pipeline.map(pool, mask, pipeline.chunks(len(x), pool))
+
+        if len(parts) == 1:
+            x, y, columns, gap, keep = parts[0]
+        else:
+            x, y, gap, keep = [ np.concatenate([ p[i] for p in parts ]) for i in (0, 1, 3, 4) ]
+            columns = [ c if c is None else np.concatenate([ p[2][i] for p in parts ])
+                        for i, c in enumerate(columns) ]
+
+        # points in the same segment share the same count of gaps before them
+        segment = np.cumsum(gap)[keep]
+
+        x = x[keep]
+        y = y[keep]
+        columns = [ c if c is None else c[keep] for c in columns ]
+
+        offsets = np.concatenate(([0], np.flatnonzero(np.diff(segment)) + 1, [x.size]))
+
+        # preview: decimate the visible points, per segment (so that
+        # the gaps, and the ends of each segment, are kept)
+        k = self._stride(x.size, self.preview_points)
+        if k > 1:
+            segment = np.repeat(np.arange(offsets.size - 1), np.diff(offsets))
+            sel = (np.arange(x.size) - offsets[:-1][segment]) % k == 0
+            sel[offsets[1:] - 1] = True
 
-            i = x < self.xlims[1]
-            x = x[i]
-            y = y[i]
+            x = x[sel]
+            y = y[sel]
+            columns = [ c if c is None else c[sel] for c in columns ]
+            offsets = np.searchsorted(segment[sel], np.arange(offsets.size))
 
         # XXX: document this somewhere
         # XXX: see http://www.scipy.org/Cookbook/SignalSmooth for more smoothing options...
 
-        if self.smooth:                 # moving average
+        if self.smooth:                 # moving average (per segment)
             w = np.ones(self.smooth)
-            y = np.convolve(w/w.sum(), y, mode='same')
 
-        self.asy.slurp2(x, y)
+            def smooth(s):
+                # segments shorter than the window are left as they are
+                # (mode='same' would return len(w) samples)
+                if len(s) < len(w):
+                    return s
+                return np.convolve(w/w.sum(), s, mode='same')
+
+            y = np.concatenate(pipeline.map(pool, smooth, np.split(y, offsets[1:-1])))
+
+        return x, y, offsets, columns
+
+
+    def _filter_and_slurp2(self, x, y, segments=False, simplify=None, **kwargs):
+        """Filter (see :func:`_filter2`) and send *x* and *y* to the
+           Asymptote engine.
+
+           If *segments* is True and the data has gaps, the segment
+           offsets are sent along with the data and returned,
+           otherwise None is returned.
+
+           If *simplify* is given, the line is simplified (see
+           :func:`_simplify`) to within *simplify* bp first.
+
+           """
+
+        return self._slurp_prepared2(self._prepare2(x, y, simplify), segments)
+
+
+    def _prepare2(self, x, y, simplify=None, parallel=True):
+        """Filter (and simplify) *x* and *y* (see
+           :func:`_filter_and_slurp2`), without changing the state of
+           the plot (so that series can be prepared by the
+           preprocessing pool, see :mod:`pyasy.pipeline`)."""
+
+        x, y, offsets = self._filter2(x, y, parallel=parallel)
+
+        simplified = None
+        if simplify:
+            before = x.size
+            x, y, offsets = self._simplify(x, y, offsets, simplify)
+            simplified = (before, x.size)
+
+        return x, y, offsets, simplified
+
+
+    def _slurp_prepared2(self, prepared, segments=False):
+        """Send a series prepared by :func:`_prepare2` to the
+           Asymptote engine (see :func:`_filter_and_slurp2`)."""
+
+        x, y, offsets, simplified = prepared
+
+        if simplified is not None:
+            self.simplified = simplified
+
+        if segments and offsets.size > 2:
+            self.asy.slurp2(x, y, offsets=offsets)
+        else:
+            self.asy.slurp2(x, y)
+            offsets = None
 
         self.x = x
         self.y = y
         self._bounds(x, y)
 
+        return offsets
+
+
+    def _simplify(self, x, y, offsets, tolerance):
+        """Simplify the line through *x* and *y* (with segment
+           *offsets*, see :func:`_filter2`) with the Ramer-Douglas-
+           Peucker algorithm: vertices closer than *tolerance* (in bp,
+           at the size of the plot) to the simplified line are
+           removed.  Return the simplified ``(x, y, offsets)``.
+
+           All of the intervals being split are processed at once (in
+           NumPy), so each level of the recursion is one pass over the
+           remaining vertices.  Dense lines are first thinned to the
+           first vertex in each *tolerance*/4 of arc length (so that
+           the removed vertices are within *tolerance*/4 of a kept
+           vertex), and then simplified to within the rest of the
+           tolerance.
+
+           """
+
+        if x.size < 3:
+            return x, y, offsets
+
+        # output units (bp): the plot spans (at least) this line
+        w, h = self.plots[-1]['size'][:2]
+        xlims = self._scaled(0, self.xlims) if self.xlims is not None else (x.min(), x.max())
+        ylims = self._scaled(1, self.ylims) if self.ylims is not None else (y.min(), y.max())
+        u = x*(72.0*w/(xlims[1] - xlims[0]) if xlims[1] > xlims[0] else 1.0)
+        v = y*(72.0*h/(ylims[1] - ylims[0]) if ylims[1] > ylims[0] else 1.0)
+
+        def ends(offsets, size):
+            # the ends of each segment are always kept
+            keep = np.zeros(size, dtype=bool)
+            keep[offsets[:-1]] = True
+            keep[offsets[1:]-1] = True
+            return keep
+
+        def select(keep, offsets):
+            segment = np.repeat(np.arange(offsets.size - 1), np.diff(offsets))[keep]
+            return np.searchsorted(segment, np.arange(offsets.size))
+
+        # thin by arc length (if the line is dense)
+        w = tolerance/4.0
+        arc = np.concatenate(([0.0], np.cumsum(np.hypot(np.diff(u), np.diff(v)))))
+        bins = np.floor(arc/w)
+        keep = ends(offsets, x.size)
+        keep[1:] |= bins[1:] != bins[:-1]
+
+        if keep.sum() < x.size/2:
+            x, y, u, v = x[keep], y[keep], u[keep], v[keep]
+            offsets = select(keep, offsets)
+            tolerance = tolerance - w
+
+        keep = ends(offsets, x.size)
+
+        s = offsets[:-1]
+        e = offsets[1:] - 1
+
+        while s.size:
+            n = e - s - 1
+            s, e, n = s[n > 0], e[n > 0], n[n > 0]
+            if s.size == 0:
+                break
+
+            # interior vertices of each interval
+            k = np.repeat(np.arange(s.size), n)
+            i = np.repeat(s + 1, n) + np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+
+            # distance from the chord (segment) of the interval
+            ax, ay = u[s][k], v[s][k]
+            dx, dy = u[e][k] - ax, v[e][k] - ay
+            l2 = dx*dx + dy*dy
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t = np.clip(np.where(l2 > 0, ((u[i] - ax)*dx + (v[i] - ay)*dy)/l2, 0.0), 0.0, 1.0)
+            d = np.hypot(u[i] - ax - t*dx, v[i] - ay - t*dy)
+
+            # farthest vertex of each interval
+            dmax = np.maximum.reduceat(d, np.cumsum(n) - n)
+            split = dmax > tolerance
+            far = np.flatnonzero(d == dmax[k])
+            far = far[np.unique(k[far], return_index=True)[1]]
+
+            m = i[far][split]
+            keep[m] = True
+
+            s, e = np.concatenate((s[split], m)), np.concatenate((m, e[split]))
+
+        return x[keep], y[keep], select(keep, offsets)
+
+
+    def _raster_pixel(self, xmin, xmax, ymin, ymax, dpi=None):
+        """Return the size ``(hx, hy)``, in data units, of a pixel at
+           *dpi* in the current plot (assuming that the plot will span
+           its current bounds and the given data bounds)."""
+
+        if dpi is None:
+            dpi = self.raster_dpi
+
+        if 'bounds' in self.plots[-1]:
+            d = self.plots[-1]['bounds']
+            xmin, ymin = min(xmin, d['min'][0]), min(ymin, d['min'][1])
+            xmax, ymax = max(xmax, d['max'][0]), max(ymax, d['max'][1])
+
+        w, h = self.plots[-1]['size'][:2]
+
+        hx = (xmax - xmin)/(w*dpi) if xmax > xmin else 1.0
+        hy = (ymax - ymin)/(h*dpi) if ymax > ymin else 1.0
+
+        return hx, hy
+
+
+    def _filter_and_rasterize2(self, x, y, picture, pen, dpi=None,
+                               linewidth=0.5, dotsize=None, **kwargs):
+        """Filter (see :func:`_filter2`) *x* and *y*, rasterize them
+           (as a line of width *linewidth*, or as dots of diameter
+           *dotsize*, both in bp), and add the raster to *picture* as
+           an image in *pen*, with the coverage of each pixel as its
+           opacity (so that the raster composites over the artists
+           drawn before it)."""
+
+        if dpi is None:
+            dpi = self.raster_dpi
+
+        x, y, offsets = self._filter2(x, y)
+        if x.size == 0:
+            return
+
+        xmin, xmax = x.min(), x.max()
+        ymin, ymax = y.min(), y.max()
+        hx, hy = self._raster_pixel(xmin, xmax, ymin, ymax, dpi)
+
+        if dotsize is not None:
+            width = dotsize*dpi/72.0
+        else:
+            width = linewidth*dpi/72.0
+
+        # pad by the line width (or dot size) plus a pixel
+        pad = int(np.ceil(width)) + 1
+        shape = (int(np.ceil((xmax - xmin)/hx)) + 2*pad,
+                 int(np.ceil((ymax - ymin)/hy)) + 2*pad)
+        initial = (xmin - pad*hx, ymin - pad*hy)
+        final = (initial[0] + shape[0]*hx, initial[1] + shape[1]*hy)
+
+        if dotsize is not None:
+            f = raster.points(x, y, initial, final, shape, radius=width/2)
+        else:
+            f = raster.lines(x, y, initial, final, shape,
+                             width=width, offsets=offsets)
+
+        self._account('raster', f.size)
+
+        self.asy.slurp3(initial[0] + hx*(np.arange(shape[0]) + 0.5),
+                        initial[1] + hy*(np.arange(shape[1]) + 0.5),
+                        np.clip(f, 0.0, 1.0))
+        self.asy.send('''pen[] A = sequence(new pen(int k) { return %s + opacity(k/255); }, 256);
+                         pen[][] P = new pen[ZZ.length][];
+                         for (int i=0; i<ZZ.length; ++i)
+                           P[i] = A[round(255*ZZ[i])];
+                         image(%s, P, (%r, %r), (%r, %r), antialias=true)'''
+                      % ((pen, picture) + initial + final))
+
+        self.x = x
+        self.y = y
+        self._bounds(x, y)
+
+
+    def _extent(self, axis, lower=None, upper=None):
+        """Return *lower* and *upper* (arrays or scalars) along
+           *axis* (0 for x, 1 for y), defaulting to the limits (or the
+           current bounds) of the plot."""
+
+        lims = (self.xlims, self.ylims)[axis]
+        if lims is None and 'bounds' in self.plots[-1]:
+            d = self.plots[-1]['bounds']
+            lims = self._unscaled(axis, np.array([ d['min'][axis], d['max'][axis] ]))
+
+        if lims is None and (lower is None or upper is None):
+            raise ValueError('pyasy: no %s limits for the annotations' % 'xy'[axis])
+
+        if lower is None:
+            lower = lims[0]
+        if upper is None:
+            upper = lims[1]
+
+        return lower, upper
+
+
+    def _slurp_pairs(self, x0, y0, x1, y1):
+        """Send the pairs of points ``(x0[i], y0[i])`` and ``(x1[i],
+           y1[i])`` (arrays or scalars, broadcast against each other,
+           in data space) to the Asymptote engine in one transfer,
+           interleaved as ``X[2i]``, ``X[2i+1]`` (see the Asymptote
+           ``drawpairs`` and ``fillpairs`` functions).  Return the
+           number of pairs."""
+
+        x0, y0, x1, y1 = np.broadcast_arrays(*[ np.ravel(np.asarray(a, dtype=float))
+                                                for a in (x0, y0, x1, y1) ])
+        x0, x1 = self._scaled(0, x0), self._scaled(0, x1)
+        y0, y1 = self._scaled(1, y0), self._scaled(1, y1)
+
+        x = np.empty(2*x0.size)
+        y = np.empty(2*x0.size)
+        x[0::2] = x0
+        x[1::2] = x1
+        y[0::2] = y0
+        y[1::2] = y1
+
+        self.asy.slurp2(x, y)
+
+        return x0.size
+
 
     def _slurp3(self, x, y, z, **kwargs):
 
-        x = 1.0*np.array(x)
-        y = 1.0*np.array(y)
-        z = 1.0*np.array(z)
+        # no copies of float arrays (see pyasy.shared)
+        x = np.asanyarray(x, dtype=float)
+        y = np.asanyarray(y, dtype=float)
+        z = np.asanyarray(z, dtype=float)
 
         self.asy.slurp3(x, y, z)
 
 
+    def _scaled(self, axis, a):
+        """Return *a* (an array, or a scalar) transformed by the
+           scale of *axis* (0 for x, 1 for y, see :mod:`pyasy.scales`).
+           Values outside the domain of the scale become NaN."""
+
+        scale = (self.xscale, self.yscale)[axis]
+        if scale.linear:
+            return a
+
+        with np.errstate(all='ignore'):
+            return scale.forward(np.asanyarray(a, dtype=float))
+
+
+    def _unscaled(self, axis, a):
+        """Return *a* transformed back to data space (see
+           :func:`_scaled`)."""
+
+        scale = (self.xscale, self.yscale)[axis]
+        if scale.linear:
+            return a
+
+        with np.errstate(all='ignore'):
+            return scale.inverse(np.asanyarray(a, dtype=float))
+
+
     def _bounds(self, x, y):
 
-        x = 1.0*np.array(x)
-        y = 1.0*np.array(y)
+        x = 1.0*np.ravel(x)
+        y = 1.0*np.ravel(y)
+
+        def bounds(s):
+            # bounds of a chunk (ignoring gaps)
+            i = np.isfinite(x[s]) & np.isfinite(y[s])
+            if not i.any():
+                return None
+            return x[s][i].min(), x[s][i].max(), y[s][i].min(), y[s][i].max()
+
+        pool = self.pool
+        parts = [ b for b in pipeline.map(pool, bounds, pipeline.chunks(x.size, pool))
+                  if b is not None ]
+
+        if not parts:
+            return
+
+        parts = np.array(parts)
+        x = np.array([ parts[:,0].min(), parts[:,1].max() ])
+        y = np.array([ parts[:,2].min(), parts[:,3].max() ])
 
         if 'bounds' in self.plots[-1]:
             d = self.plots[-1]['bounds']
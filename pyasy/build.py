@@ -0,0 +1,344 @@
+"""PyAsy batch figure builder.
+
+   The ``pyasy`` command builds all of the figures in a directory,
+   make-style: a figure is only rebuilt if one of its outputs is
+   missing or older than one of its inputs (or if its inputs have
+   changed since it was last built).  Outdated figures are built in
+   parallel, and a timing summary is printed at the end::
+
+     $ pyasy figures/ -j 4
+
+   A figure is either:
+
+   * A script (``name.py``) with a comment listing its outputs,
+     eg::
+
+       # pyasy-outputs: name.pdf name.png
+
+     which is run (with the figure directory as the current
+     directory) by the Python interpreter running ``pyasy``.  Its
+     inputs are the script and the data files (``.npy`` and
+     ``.npz``) named in the script.  Other scripts (eg, modules
+     imported by the figures, or scripts that generate data) aren't
+     figures.
+
+   * A declarative figure spec (``name.json``), eg::
+
+       { "format": ["pdf", "png"],
+         "init": { "size": [4, 3, false] },
+         "calls": [ { "method": "line",
+                      "args": [ { "data": "run.npz:t" },
+                                { "data": "run.npz:energy" } ],
+                      "kwargs": { "pen": "red" } },
+                    { "method": "axis",
+                      "kwargs": { "xlabel": "$t$", "ylabel": "$E$" } } ] }
+
+     The calls are made (in order) on a :class:`pyasy.plot.Plot`
+     (or on a :class:`pyasy.animation.Animation` if *class* is
+     ``"Animation"``), as in :mod:`pyasy.session`.  Arguments of the
+     form ``{"data": "file.npy"}`` or ``{"data": "file.npz:name"}``
+     are loaded from the data files, which are the inputs of the
+     spec (along with the spec itself).  The output is
+     *output.format* (*output* defaults to the spec name, and
+     *format* to ``"pdf"``).
+
+   A figure is only recorded as built if it writes all of its
+   outputs.  The inputs of each figure are recorded in
+   ``.pyasy-build.json`` in the figure directory.
+
+   """
+
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import Queue
+
+import numpy as np
+
+
+manifest = '.pyasy-build.json'
+
+
+######################################################################
+
+def _data_files(value):
+
+    # data file names referenced by a spec argument
+    if isinstance(value, dict) and 'data' in value:
+        return [ value['data'].split(':')[0] ]
+    if isinstance(value, (list, tuple)):
+        return sum([ _data_files(v) for v in value ], [])
+    if isinstance(value, dict):
+        return sum([ _data_files(v) for v in value.values() ], [])
+    return []
+
+
+def _data(directory, value, cache):
+
+    # resolve the data references in a spec argument
+    if isinstance(value, dict) and 'data' in value:
+        name, _, key = value['data'].partition(':')
+        if name not in cache:
+            cache[name] = np.load(os.path.join(directory, name))
+        if key:
+            return cache[name][key]
+        return cache[name]
+    if isinstance(value, list):
+        return tuple([ _data(directory, v, cache) for v in value ])
+    if isinstance(value, dict):
+        return dict([ (str(k), _data(directory, value[k], cache)) for k in value ])
+    if isinstance(value, unicode):
+        return str(value)
+    return value
+
+
+def figures(directory):
+    """Return the figures in *directory* (a list of dictionaries with
+       the figure *name*, *path*, *kind* (``'script'`` or
+       ``'spec'``), *inputs*, and *outputs*)."""
+
+    figures = []
+
+    for f in sorted(os.listdir(directory)):
+        name, ext = os.path.splitext(f)
+        path = os.path.join(directory, f)
+
+        if ext == '.py':
+            source = open(path).read()
+            m = re.search(r'^#\s*pyasy-outputs:(.*)$', source, re.MULTILINE)
+            if not m or not m.group(1).split():
+                continue
+            inputs = re.findall(r'''['"]([^'"\s]+\.np[yz])['"]''', source)
+            outputs = m.group(1).split()
+            kind = 'script'
+
+        elif ext == '.json' and f != manifest:
+            spec = json.load(open(path))
+            if not isinstance(spec, dict) or 'calls' not in spec:
+                continue
+            inputs = _data_files(spec.get('calls', []))
+            formats = spec.get('format', 'pdf')
+            if not isinstance(formats, list):
+                formats = [ formats ]
+            outputs = [ '%s.%s' % (spec.get('output', name), fmt) for fmt in formats ]
+            kind = 'spec'
+
+        else:
+            continue
+
+        figures.append({ 'name': f, 'path': path, 'kind': kind,
+                         'inputs': [ f ] + sorted(set(inputs)),
+                         'outputs': outputs })
+
+    return figures
+
+
+def stale(directory, figure, built=None):
+    """Return True if *figure* (see :func:`figures`) needs to be
+       rebuilt.  *built* is the manifest of the last build."""
+
+    if built is not None and built.get(figure['name']) != figure['inputs']:
+        return True
+
+    def mtime(f):
+        f = os.path.join(directory, f)
+        if os.path.exists(f):
+            return os.path.getmtime(f)
+        return None
+
+    outputs = [ mtime(f) for f in figure['outputs'] ]
+    if None in outputs:
+        return True
+
+    inputs = [ mtime(f) for f in figure['inputs'] ]
+    return max([ t for t in inputs if t is not None ]) > min(outputs)
+
+
+######################################################################
+
+def render(path):
+    """Render the figure spec *path* (see the module
+       documentation)."""
+
+    import animation
+    import plot
+
+    directory = os.path.dirname(os.path.abspath(path))
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = json.load(open(path))
+    cache = {}
+
+    cls = { 'Plot': plot.Plot, 'Animation': animation.Animation }[spec.get('class', 'Plot')]
+
+    init = _data(directory, spec.get('init', {}), cache)
+    init['directory'] = directory
+    p = cls(**init)
+
+    for call in spec.get('calls', []):
+        args = _data(directory, call.get('args', []), cache)
+        kwargs = _data(directory, call.get('kwargs', {}), cache)
+        getattr(p, str(call['method']))(*args, **kwargs)
+
+    output = str(spec.get('output', name))
+    if cls is animation.Animation:
+        p.shipout(output)
+    else:
+        p.shipout(output, _data(directory, spec.get('format', 'pdf'), cache))
+
+
+def _run(directory, figure):
+
+    # build figure, return (ok, message)
+    start = int(time.time())
+
+    if figure['kind'] == 'spec':
+        try:
+            render(figure['path'])
+        except Exception, e:
+            return False, '%s: %s' % (type(e).__name__, e)
+
+    else:
+        p = subprocess.Popen([ sys.executable, figure['name'] ], cwd=directory,
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = p.communicate()[0]
+        if p.returncode != 0:
+            lines = output.strip().splitlines()
+            return False, lines[-1] if lines else 'exit status %d' % p.returncode
+
+    # outputs left over from an earlier build don't count (mtimes
+    # may be truncated to the second)
+    def written(f):
+        f = os.path.join(directory, f)
+        return os.path.exists(f) and os.path.getmtime(f) >= start
+
+    missing = [ f for f in figure['outputs'] if not written(f) ]
+    if missing:
+        return False, 'missing outputs: %s' % ' '.join(missing)
+
+    return True, ''
+
+
+def build(directory, jobs=None, force=False, dry_run=False, echo=True):
+    """Build the outdated figures in *directory* (see the module
+       documentation) with *jobs* parallel workers (defaults to the
+       number of processors).  If *force* is True, all figures are
+       built.  Return a list of ``(figure, status, seconds, message)``
+       tuples, where *status* is ``'built'``, ``'failed'``,
+       ``'stale'`` (for a dry run), or ``'up to date'``."""
+
+    import multiprocessing
+
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+
+    try:
+        built = json.load(open(os.path.join(directory, manifest)))
+    except (IOError, ValueError):
+        built = {}
+
+    results = {}
+    queue = Queue.Queue()
+
+    for figure in figures(directory):
+        if force or stale(directory, figure, built):
+            if dry_run:
+                results[figure['name']] = (figure['name'], 'stale', 0.0, '')
+            else:
+                queue.put(figure)
+        else:
+            results[figure['name']] = (figure['name'], 'up to date', 0.0, '')
+
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            try:
+                figure = queue.get_nowait()
+            except Queue.Empty:
+                return
+
+            start = time.time()
+            ok, message = _run(directory, figure)
+            elapsed = time.time() - start
+
+            with lock:
+                if ok:
+                    built[figure['name']] = figure['inputs']
+                else:
+                    built.pop(figure['name'], None)
+                results[figure['name']] = (figure['name'],
+                                           'built' if ok else 'failed',
+                                           elapsed, message)
+                if echo:
+                    print '%-32s %-10s %7.1fs' % results[figure['name']][:3]
+
+    threads = [ threading.Thread(target=worker) for i in range(max(jobs, 1)) ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    if not dry_run:
+        f = open(os.path.join(directory, manifest), 'w')
+        json.dump(built, f, indent=1)
+        f.close()
+
+    return [ results[k] for k in sorted(results) ]
+
+
+def summary(results, elapsed):
+    """Return the timing summary (a string) of the build *results*
+       (see :func:`build`)."""
+
+    lines = [ '%-32s %-10s %8s' % ('figure', 'status', 'time') ]
+    for name, status, seconds, message in results:
+        line = '%-32s %-10s %7.1fs' % (name, status, seconds)
+        if message:
+            line = line + '  ' + message
+        lines.append(line)
+
+    counts = {}
+    for r in results:
+        counts[r[1]] = counts.get(r[1], 0) + 1
+
+    lines.append('%s in %.1fs' % (', '.join([ '%d %s' % (counts[s], s)
+                                              for s in sorted(counts) ]) or 'nothing',
+                                  elapsed))
+
+    return '\n'.join(lines)
+
+
+######################################################################
+
+def main(args=None):
+    """Build figures (see the module documentation)."""
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='PyAsy batch figure builder.')
+    parser.add_argument('directory', nargs='?', default='.',
+                        help='figure directory')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of figures built in parallel')
+    parser.add_argument('-B', '--force', action='store_true',
+                        help='build all figures')
+    parser.add_argument('-n', '--dry-run', action='store_true',
+                        help='list outdated figures without building them')
+    args = parser.parse_args(args)
+
+    start = time.time()
+    results = build(args.directory, jobs=args.jobs, force=args.force,
+                    dry_run=args.dry_run, echo=False)
+
+    print summary(results, time.time() - start)
+
+    if [ r for r in results if r[1] == 'failed' ]:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""PyAsy binary container format.
+
+   A container holds any number of named, typed arrays of any shape
+   and is read by a single Asymptote function (``load``), so new
+   transfers don't need new Asymptote readers (unlike the fixed slurp
+   layouts of :class:`pyasy.asymptote.Asymptote`)::
+
+   >>> plot.asy.load([ ('X', x), ('Y', y), ('I', indices) ])
+
+   **Layout** (version 1)
+
+   All header entries are native ``int`` (32 bit):
+
+   * magic number (``0x50794173``), version, and number of arrays;
+   * for each array: length of the name, the name (one character
+     code per entry), dtype code (see *dtypes*), number of
+     dimensions, and the shape.
+
+   The header is followed by the data of each array, in order, in
+   native byte order (C order for multi-dimensional arrays).
+
+   Asymptote reads floating point arrays as ``real`` and integer
+   arrays as ``int``.  Other types are converted when the container
+   is written: booleans and small integers (eg, ``uint8`` RGB
+   rasters) to ``int32``, and other floating point types to
+   ``float64``.
+
+   """
+
+import struct
+
+import numpy as np
+
+
+######################################################################
+
+magic = 0x50794173
+version = 1
+
+# dtype codes
+dtypes = [ np.dtype('float64'), np.dtype('float32'),
+           np.dtype('int32'), np.dtype('int64') ]
+
+
+asy_load = """int[] Types;
+              int[][] Shapes;
+              real[][] Reals;
+              int[][] Ints;
+
+              void load(string filename) {
+                file dat = binput(filename);
+
+                int magic = dat;
+                int version = dat;
+                int n = dat;
+
+                Types = new int[n];
+                Shapes = new int[n][];
+                Reals = new real[n][];
+                Ints = new int[n][];
+
+                for (int k=0; k<n; ++k) {
+                  int m = dat;
+                  int[] name = dat.dimension(m);
+                  Types[k] = dat;
+                  int d = dat;
+                  int[] shape = dat.dimension(d);
+                  Shapes[k] = shape;
+                }
+
+                for (int k=0; k<n; ++k) {
+                  int size = 1;
+                  for (int i=0; i<Shapes[k].length; ++i)
+                    size *= Shapes[k][i];
+
+                  if (Types[k] == 0) {
+                    real[] a = dat.dimension(size);
+                    Reals[k] = a;
+                  } else if (Types[k] == 1) {
+                    dat.singlereal(true);
+                    real[] a = dat.dimension(size);
+                    Reals[k] = a;
+                    dat.singlereal(false);
+                  } else if (Types[k] == 2) {
+                    int[] a = dat.dimension(size);
+                    Ints[k] = a;
+                  } else {
+                    dat.singleint(false);
+                    int[] a = dat.dimension(size);
+                    Ints[k] = a;
+                    dat.singleint(true);
+                  }
+                }
+
+                close(dat);
+              }
+
+              real[][] grid(real[] a, int[] shape) {
+                real[][] g = new real[shape[0]][shape[1]];
+                for (int i=0; i<shape[0]; ++i)
+                  g[i] = a[i*shape[1]:(i+1)*shape[1]];
+                return g;
+              }"""
+
+
+######################################################################
+
+def dtype(a):
+    """Return the dtype that ndarray *a* is written as."""
+
+    if a.dtype in dtypes:
+        return a.dtype
+    if a.dtype.kind in 'bui' and a.dtype.itemsize <= 4:
+        return np.dtype('int32')
+    if a.dtype.kind in 'ui':
+        return np.dtype('int64')
+    return np.dtype('float64')
+
+
+def parts(arrays):
+    """Return the container of *arrays* (a list of ``(name,
+       array)`` pairs) as a list of header strings and (contiguous)
+       ndarrays."""
+
+    arrays = [ (name, np.asanyarray(a)) for name, a in arrays ]
+    arrays = [ (name, np.ascontiguousarray(a, dtype=dtype(a)))
+               for name, a in arrays ]
+
+    header = [ magic, version, len(arrays) ]
+    for name, a in arrays:
+        header.append(len(name))
+        header.extend([ ord(ch) for ch in name ])
+        header.append(dtypes.index(a.dtype))
+        header.append(a.ndim)
+        header.extend(a.shape)
+
+    return [ struct.pack('i'*len(header), *header) ] + [ a for name, a in arrays ]
+
+
+def read(filename):
+    """Read a container file.  Return a list of ``(name, array)``
+       pairs."""
+
+    f = open(filename, 'rb')
+
+    def ints(n):
+        return struct.unpack('i'*n, f.read(4*n))
+
+    m, v, n = ints(3)
+    if m != magic or v > version:
+        raise ValueError('pyasy: %s is not a (version %d) container'
+                         % (filename, version))
+
+    header = []
+    for k in range(n):
+        name = ''.join([ chr(ch) for ch in ints(ints(1)[0]) ])
+        t = dtypes[ints(1)[0]]
+        shape = ints(ints(1)[0])
+        header.append((name, t, shape))
+
+    arrays = []
+    for name, t, shape in header:
+        size = int(np.prod(shape))
+        a = np.fromfile(f, dtype=t, count=size).reshape(shape)
+        arrays.append((name, a))
+
+    f.close()
+
+    return arrays
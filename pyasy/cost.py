@@ -0,0 +1,238 @@
+"""PyAsy render cost estimates.
+
+   Each plot keeps running counts of what it has queued: points per
+   line (``'line'``), dots per scatter plot (``'scatter'``), grid cells
+   per density plot (``'density'``), triangles per unstructured mesh
+   (``'triangle'``), animation frames (``'frame'``), and pixels of
+   rasterized layers (``'raster'``).  A linear
+   :class:`CostModel` predicts the render time and output size from
+   these counts, and a :class:`Budget` decides what to do when a plot
+   is predicted to exceed its time or size budget::
+
+   >>> budget = pyasy.cost.Budget(time=10.0, size=5e6, action='rasterize')
+   >>> plot = pyasy.plot.Plot(budget=budget)
+   >>> plot.line(x, y)                 # rasterized if too expensive
+   >>> print plot.estimate()
+
+   The default model coefficients are rough; they should be
+   calibrated on the build machine with :func:`benchmark`::
+
+   >>> pyasy.cost.model.calibrate(pyasy.cost.benchmark())
+
+   """
+
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+
+######################################################################
+
+kinds = [ 'line', 'scatter', 'density', 'triangle', 'frame', 'raster' ]
+
+
+class CostModel(object):
+    """Linear model of render time (seconds) and output size (bytes).
+
+       The predicted time is ``time['overhead'] + sum(time[kind] *
+       counts[kind])`` (and similarly for the size).
+
+       **Arguments**
+
+       * *time* - Dictionary of time coefficients (overrides the
+         defaults).
+       * *size* - Dictionary of size coefficients (overrides the
+         defaults).
+
+       **Methods**
+
+       """
+
+    default_time = { 'overhead': 1.0, 'line': 5e-6, 'scatter': 5e-5,
+                     'density': 2e-7, 'triangle': 5e-5, 'frame': 0.2,
+                     'raster': 5e-8 }
+
+    default_size = { 'overhead': 2e4, 'line': 16.0, 'scatter': 60.0,
+                     'density': 3.0, 'triangle': 80.0, 'frame': 2e4,
+                     'raster': 1.0 }
+
+    def __init__(self, time=None, size=None):
+        self.time = dict(self.default_time)
+        self.size = dict(self.default_size)
+        self.time.update(time or {})
+        self.size.update(size or {})
+
+
+    def predict(self, counts):
+        """Return the predicted ``(time, size)`` for *counts* (a
+           dictionary keyed by kind)."""
+
+        t = self.time['overhead']
+        s = self.size['overhead']
+        for k in counts:
+            t = t + self.time[k]*counts[k]
+            s = s + self.size[k]*counts[k]
+
+        return t, s
+
+
+    def calibrate(self, samples):
+        """Fit the coefficients (by least squares) to *samples*, a list
+           of ``(counts, time, size)`` tuples of measured renders (see
+           :func:`benchmark`)."""
+
+        A = np.array([ [1.0] + [ c.get(k, 0) for k in kinds ]
+                       for c, t, s in samples ])
+        T = np.array([ t for c, t, s in samples ])
+        S = np.array([ s for c, t, s in samples ])
+
+        for coefficients, b in [ (self.time, T), (self.size, S) ]:
+            x = np.linalg.lstsq(A, b, rcond=None)[0]
+            x = np.maximum(x, 0.0)
+            coefficients['overhead'] = x[0]
+            for i, k in enumerate(kinds):
+                if A[:,i+1].any():
+                    coefficients[k] = x[i+1]
+
+
+model = CostModel()
+
+
+######################################################################
+
+class Budget(object):
+    """Render budget and degradation policy.
+
+       **Arguments**
+
+       * *time* - Render time budget (seconds), or None.
+
+       * *size* - Output size budget (bytes), or None.
+
+       * *action* - What to do with an artist that would take the plot
+         over budget: ``'warn'`` (issue a warning), ``'decimate'``
+         (decimate the data so that it fits), or ``'rasterize'``
+         (rasterize lines, scatter plots, density plots, and meshes;
+         decimate animation frames).
+
+       * *model* - Cost model (defaults to ``pyasy.cost.model``).
+
+       **Methods**
+
+       """
+
+    actions = [ 'warn', 'decimate', 'rasterize' ]
+
+    def __init__(self, time=None, size=None, action='warn', model=None):
+        if action not in self.actions:
+            raise ValueError('pyasy: unknown budget action: %s' % action)
+
+        self.time = time
+        self.size = size
+        self.action = action
+        self.model = model
+
+
+    def predict(self, counts):
+        """Return the predicted ``(time, size)`` for *counts*."""
+        return (self.model or model).predict(counts)
+
+
+    def over(self, counts):
+        """Return True if *counts* are predicted to exceed the
+           budget."""
+
+        t, s = self.predict(counts)
+        return (self.time is not None and t > self.time) or \
+               (self.size is not None and s > self.size)
+
+
+    def allowance(self, counts, kind):
+        """Return the number of units of *kind* that can be added to
+           *counts* without exceeding the budget."""
+
+        m = self.model or model
+        t, s = m.predict(counts)
+
+        allowed = float('inf')
+        if self.time is not None and m.time[kind] > 0:
+            allowed = min(allowed, (self.time - t)/m.time[kind])
+        if self.size is not None and m.size[kind] > 0:
+            allowed = min(allowed, (self.size - s)/m.size[kind])
+
+        return max(allowed, 0.0)
+
+
+######################################################################
+
+def benchmark(sizes=(1000, 10000, 100000), **kwargs):
+    """Render synthetic plots of each kind and of the given *sizes*
+       (number of units) and return a list of ``(counts, time, size)``
+       tuples (see :func:`CostModel.calibrate`).
+
+       Any keyword arguments are passed on to the PyAsy Plot and
+       Animation constructors.
+
+       """
+
+    import animation
+    import plot
+
+    samples = []
+
+    # the engines render in a scratch directory (rather than changing
+    # the working directory of the process, which other threads use)
+    directory = tempfile.mkdtemp(prefix='pyasy-')
+    kwargs = dict(kwargs, directory=directory)
+
+    try:
+        for n in sizes:
+            m = int(np.sqrt(n))
+            x = np.linspace(0.0, 1.0, n)
+            u = np.linspace(0.0, 1.0, m)
+
+            for kind in [ 'line', 'scatter', 'density', 'triangle', 'raster', 'frame' ]:
+                start = time.time()
+
+                if kind == 'frame':
+                    frames = max(n/1000, 2)
+                    a = animation.Animation(**kwargs)
+                    a.animate(u, np.arange(frames), np.random.rand(frames, m))
+                    a.shipout('benchmark')
+                    counts = a.counts
+                else:
+                    p = plot.Plot(**kwargs)
+                    if kind == 'line':
+                        p.line(x, np.random.rand(n))
+                    elif kind == 'scatter':
+                        p.scatter(x, np.random.rand(n))
+                    elif kind == 'raster':
+                        p.line(x, np.random.rand(n), rasterize=True)
+                    elif kind == 'triangle':
+                        g = np.arange(m*m).reshape(m, m)[:-1,:-1].ravel()
+                        t = np.concatenate((np.array([ g, g+1, g+m ]).T,
+                                            np.array([ g+1, g+m+1, g+m ]).T))
+                        points = np.array(np.meshgrid(u, u)).reshape(2, -1).T
+                        p.tripcolor(points, t, np.random.rand(len(t)))
+                    else:
+                        p.density(u, u, np.random.rand(m, m))
+                    p.axis()
+                    p.shipout('benchmark')
+                    counts = p.counts
+
+                elapsed = time.time() - start
+                files = [ os.path.join(directory, f) for f in os.listdir(directory) ]
+                size = sum([ os.path.getsize(f) for f in files
+                             if os.path.basename(f).startswith('benchmark.') ])
+                for f in files:
+                    os.remove(f)
+
+                samples.append((dict(counts), elapsed, size))
+
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return samples
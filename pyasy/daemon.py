@@ -0,0 +1,518 @@
+"""PyAsy render server (and client).
+
+   The render server is a long running process that owns a pool of
+   warm Asymptote engines (ie, engines that have already been started
+   and have already imported the *graph*, *contour*, and *palette*
+   modules), and renders figure jobs sent to it over a local Unix
+   socket.
+
+   To start a render server::
+
+     $ python -m pyasy.daemon /tmp/pyasy.sock --engines 4
+
+   To render a plot with a render server, pass the socket address to
+   the PyAsy Plot class::
+
+     >>> plot = pyasy.plot.Plot(server='/tmp/pyasy.sock')
+     >>> plot.line(x, y)
+     >>> plot.shipout('plot')
+
+   The plot is built as usual, but the Asymptote commands and slurped
+   arrays are buffered and sent to the server as a single job when the
+   plot is shipped out.
+
+   **Protocol**
+
+   Each message is a 4 byte (network order) header length, a JSON
+   header, and the payloads of the files listed (as ``[name, size]``
+   pairs) in the ``files`` entry of the header.  Requests have an
+   ``op`` entry, which is one of:
+
+   * ``render`` - Render the Asymptote ``commands`` (a list of
+     strings) after writing the payloads to the working directory of
+     an engine.  The reply lists (and carries) the output files, or,
+     if an ``output`` directory was given, the reply lists the
+     ``paths`` of the output files moved there.
+
+   * ``health`` - Reply with the number of warm engines.
+
+   * ``stats`` - Reply with server statistics (see
+     :func:`Server.statistics`).
+
+   Replies have an ``ok`` entry, and an ``error`` entry if ``ok`` is
+   false.  If the server is busy (too many queued jobs) the error is
+   ``'busy'``.
+
+   """
+
+import json
+import os
+import Queue
+import shutil
+import socket
+import SocketServer
+import struct
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import asymptote
+
+
+######################################################################
+# protocol
+
+def _recv_exactly(sock, size):
+
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1<<20))
+        if not chunk:
+            raise IOError('pyasy: connection closed by peer')
+        chunks.append(chunk)
+        size = size - len(chunk)
+
+    return ''.join(chunks)
+
+
+def _recv_to_file(sock, size, filename):
+
+    f = open(filename, 'wb')
+    while size > 0:
+        chunk = sock.recv(min(size, 1<<20))
+        if not chunk:
+            raise IOError('pyasy: connection closed by peer')
+        f.write(chunk)
+        size = size - len(chunk)
+    f.close()
+
+
+def _size(part):
+    if isinstance(part, str):
+        return len(part)
+    return part.nbytes
+
+
+def send_message(sock, header, files=()):
+    """Send *header* (a dictionary) and *files* (a list of ``(name,
+       parts)`` tuples, where *parts* is a list of strings and
+       ndarrays) over the socket *sock*."""
+
+    header = dict(header)
+    header['files'] = [ (name, sum([ _size(p) for p in parts ]))
+                        for name, parts in files ]
+    header = json.dumps(header)
+
+    sock.sendall(struct.pack('!I', len(header)) + header)
+    for name, parts in files:
+        for part in parts:
+            if isinstance(part, str):
+                sock.sendall(part)
+            else:
+                sock.sendall(buffer(np.ascontiguousarray(part)))
+
+
+def recv_header(sock):
+    """Receive a message header over the socket *sock*.  The file
+       payloads (if any) should be received next."""
+
+    size, = struct.unpack('!I', _recv_exactly(sock, 4))
+    return json.loads(_recv_exactly(sock, size))
+
+
+def request(address, header, files=()):
+    """Send a request to the render server at *address* and return
+       ``(reply, outputs)``, where *outputs* is a dictionary of output
+       file contents (keyed by file name)."""
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(address)
+
+    try:
+        send_message(sock, header, files)
+        reply = recv_header(sock)
+        outputs = {}
+        for name, size in reply.get('files', []):
+            outputs[name] = _recv_exactly(sock, size)
+    finally:
+        sock.close()
+
+    return reply, outputs
+
+
+######################################################################
+# client
+
+class RemoteAsymptote(asymptote.Asymptote):
+    """PyAsy Asymptote class for rendering with a render server.
+
+       Commands and slurped arrays are buffered, and sent to the
+       render server at *address* as one job when the engine is
+       closed (usually by :func:`pyasy.plot.Plot.shipout`).
+
+       **Arguments**
+
+       * *address* - Socket address of the render server.
+
+       * *output* - If None (the default), the output files are sent
+         back by the server and written to the current directory.
+         Otherwise, the server moves the output files to the
+         *output* directory (which must be accessible to the server).
+
+       In both cases the *outputs* instance variable is a dictionary
+       of the output files: keyed by file name, with the contents of
+       the file (or the path to the file) as values.
+
+       """
+
+    def __init__(self, address, output=None, **kwargs):
+        self.address = address
+        self.output = output
+        asymptote.Asymptote.__init__(self, **kwargs)
+
+
+    def open(self):
+        self.commands = []
+        self.files = []
+        self.outputs = {}
+        self.closed = False
+        self.write = True
+
+
+    def send(self, cmd):
+        """Buffer a command for the render server."""
+        with self.lock:
+            if self.echo:
+                print cmd+';'
+
+            self.commands.append(cmd)
+
+
+    def _transfer(self, reader, parts):
+
+        with self.lock:
+            slurp = '.tmp%d.dat' % (self.count)
+            self.files.append((slurp, parts))
+            self.count = self.count + 1
+
+            self.send('%s("%s")' % (reader, slurp))
+
+
+    def private(self):
+        """Keep the output files in memory (in *outputs*) rather than
+           writing them to the current directory."""
+
+        self.write = False
+        return None, ''
+
+
+    def sync(self):
+        raise ValueError('pyasy: the render server only renders when the engine is closed')
+
+
+    def close(self):
+        """Send the buffered job to the render server and wait for the
+           output."""
+
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+
+            reply, outputs = request(self.address,
+                                     { 'op': 'render',
+                                       'commands': self.commands,
+                                       'output': self.output },
+                                     self.files)
+
+            self.commands = []
+            self.files = []
+
+        if not reply['ok']:
+            raise RuntimeError('pyasy render server: %s' % reply['error'])
+
+        if self.output is not None:
+            for path in reply['paths']:
+                self.outputs[os.path.basename(path)] = path
+        else:
+            for name in outputs if self.write else ():
+                f = open(os.path.join(self.directory or os.curdir, name), 'wb')
+                f.write(outputs[name])
+                f.close()
+            self.outputs = outputs
+
+
+def health(address):
+    """Return the health of the render server at *address*."""
+    return request(address, { 'op': 'health' })[0]
+
+
+def statistics(address):
+    """Return the statistics of the render server at *address*."""
+    return request(address, { 'op': 'stats' })[0]
+
+
+######################################################################
+# server
+
+class _Handler(SocketServer.BaseRequestHandler):
+
+    def handle(self):
+        server = self.server.pyasy
+
+        try:
+            header = recv_header(self.request)
+        except IOError:
+            return
+
+        op = header.get('op')
+        if op == 'render':
+            server.render(self.request, header)
+        elif op == 'health':
+            send_message(self.request, server.health())
+        elif op == 'stats':
+            send_message(self.request, server.statistics())
+        else:
+            send_message(self.request, { 'ok': False,
+                                         'error': 'unknown op: %s' % op })
+
+
+class _UnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+class Server(object):
+    """PyAsy render server.
+
+       **Arguments**
+
+       * *address* - Socket address (a file name).
+
+       * *engines* - Number of warm Asymptote engines (and hence the
+         number of jobs rendered concurrently).
+
+       * *max_queue* - Maximum number of jobs waiting for an engine.
+         Further jobs are rejected (with a ``'busy'`` error) until the
+         queue drains.
+
+       Any other keyword arguments are passed on to the
+       pyasy.asymptote.Asymptote constructor.
+
+       **Methods**
+
+       """
+
+    def __init__(self, address, engines=2, max_queue=16, **kwargs):
+        self.address = address
+        self.engines = engines
+        self.max_queue = max_queue
+        self.kwargs = kwargs
+
+        self.pool = Queue.Queue()
+        self.workers = threading.Semaphore(engines)
+        self.slots = threading.Semaphore(engines + max_queue)
+
+        self.lock = threading.Lock()
+        self.stats = { 'jobs': 0, 'failed': 0, 'rejected': 0,
+                       'active': 0, 'queued': 0, 'time': 0.0 }
+        self.started = time.time()
+
+
+    def _start(self):
+
+        directory = tempfile.mkdtemp(prefix='pyasy-')
+        try:
+            engine = asymptote.Asymptote(directory=directory, **self.kwargs)
+            engine.send('import graph')
+            engine.send('import contour')
+            engine.send('import palette')
+        except:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+
+        return engine
+
+
+    def _engine(self):
+
+        # put a warm engine in the pool, or None if it can't be started
+        # (the job that gets it then starts one itself, and fails if it
+        # can't), so that the pool never runs dry
+        try:
+            engine = self._start()
+        except Exception:
+            engine = None
+
+        self.pool.put(engine)
+
+
+    def _count(self, **kwargs):
+        self.lock.acquire()
+        for k in kwargs:
+            self.stats[k] = self.stats[k] + kwargs[k]
+        self.lock.release()
+
+
+    def health(self):
+        """Return a dictionary with the number of warm engines."""
+        return { 'ok': True, 'engines': self.pool.qsize() }
+
+
+    def statistics(self):
+        """Return a dictionary of server statistics: the number of jobs
+           rendered, failed, rejected, active and queued, the mean
+           render time (in seconds), and the uptime (in seconds)."""
+
+        self.lock.acquire()
+        stats = dict(self.stats)
+        self.lock.release()
+
+        total = stats.pop('time')
+        stats['mean_time'] = total/stats['jobs'] if stats['jobs'] else 0.0
+        stats['uptime'] = time.time() - self.started
+        stats['ok'] = True
+
+        return stats
+
+
+    def render(self, sock, header):
+        """Render the job described by *header* (the payloads of which
+           are read from *sock*), and send the reply over *sock*."""
+
+        # backpressure
+        if not self.slots.acquire(False):
+            self._count(rejected=1)
+            send_message(sock, { 'ok': False, 'error': 'busy' })
+            return
+
+        try:
+            self._count(queued=1)
+            self.workers.acquire()
+            self._count(queued=-1, active=1)
+
+            try:
+                self._render(sock, header)
+            finally:
+                self._count(active=-1)
+                self.workers.release()
+        finally:
+            self.slots.release()
+
+
+    def _render(self, sock, header):
+
+        start = time.time()
+
+        engine = self.pool.get()
+        threading.Thread(target=self._engine).start()
+
+        try:
+            if engine is None:
+                engine = self._start()
+            directory = engine.directory
+
+            inputs = set()
+            for name, size in header['files']:
+                name = os.path.basename(name)
+                _recv_to_file(sock, size, os.path.join(directory, name))
+                inputs.add(name)
+
+            for cmd in header['commands']:
+                engine.send(cmd)
+            engine.close()
+
+            if engine.session.returncode != 0:
+                self._count(failed=1)
+                send_message(sock, { 'ok': False,
+                                     'error': 'asy exited with status %d'
+                                     % engine.session.returncode })
+                return
+
+            names = [ name for name in sorted(os.listdir(directory))
+                      if name not in inputs ]
+
+            if header.get('output') is not None:
+                paths = []
+                for name in names:
+                    path = os.path.join(header['output'], name)
+                    shutil.move(os.path.join(directory, name), path)
+                    paths.append(path)
+                self._count(jobs=1, time=time.time()-start)
+                send_message(sock, { 'ok': True, 'paths': paths })
+            else:
+                files = []
+                for name in names:
+                    f = open(os.path.join(directory, name), 'rb')
+                    files.append((name, [ f.read() ]))
+                    f.close()
+                self._count(jobs=1, time=time.time()-start)
+                send_message(sock, { 'ok': True }, files)
+
+        except Exception, e:
+            self._count(failed=1)
+            try:
+                send_message(sock, { 'ok': False,
+                                     'error': str(e) or e.__class__.__name__ })
+            except IOError:             # client gone
+                pass
+
+        finally:
+            if engine is not None:
+                try:
+                    engine.close()
+                except Exception:
+                    pass
+                shutil.rmtree(engine.directory, ignore_errors=True)
+
+
+    def serve_forever(self):
+        """Start the warm engines and serve jobs (until interrupted)."""
+
+        for i in range(self.engines):
+            self._engine()
+
+        if os.path.exists(self.address):
+            os.remove(self.address)
+
+        server = _UnixServer(self.address, _Handler)
+        server.pyasy = self
+        os.chmod(self.address, 0600)
+
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            os.remove(self.address)
+            while not self.pool.empty():
+                engine = self.pool.get()
+                if engine is not None:
+                    engine.close()
+                    shutil.rmtree(engine.directory, ignore_errors=True)
+
+
+######################################################################
+
+def main(args=None):
+    """Run a render server (see the module documentation)."""
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='PyAsy render server.')
+    parser.add_argument('address', help='socket address')
+    parser.add_argument('--engines', type=int, default=2,
+                        help='number of warm Asymptote engines')
+    parser.add_argument('--max-queue', type=int, default=16,
+                        help='maximum number of queued jobs')
+    args = parser.parse_args(args)
+
+    server = Server(args.address, engines=args.engines, max_queue=args.max_queue)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
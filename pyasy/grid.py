@@ -0,0 +1,243 @@
+"""PyAsy Grid object (multi-panel figures)."""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+import numpy as np
+
+import plot
+
+
+######################################################################
+
+class Grid(object):
+    """PyAsy multi-panel figure.
+
+       Each panel of a grid is a :class:`pyasy.plot.Plot` with its
+       own Asymptote engine, so the panels are built and rendered in
+       parallel.  When the grid is shipped out, each panel is rendered
+       to its own (EPS) file, and the panels are then placed on the
+       page at the positions computed by PyAsy.
+
+       **Basic usage**
+
+       >>> import pyasy.grid
+       >>> g = pyasy.grid.Grid(2, 3, sharex=True, sharey=True)
+       >>> for i in range(2):
+       ...     for j in range(3):
+       ...         g.panel(i, j, title='run %d' % (3*i+j)).line(x, y[i,j])
+       >>> g.shipout('dashboard')
+
+       **Arguments**
+
+       * *rows*, *cols* - Number of rows and columns of panels.
+
+       * *size* - Size ``(width, height)`` of the data area of each
+         panel (in inches).
+
+       * *spacing* - Space ``(horizontal, vertical)`` between the
+         data areas of neighbouring panels (in inches), which should
+         leave room for tick labels and axis labels.
+
+       * *sharex* - If True, the panels in each column share their x
+         limits, and only the bottom panel of each column has x tick
+         labels and an x axis label.
+
+       * *sharey* - If True, the panels in each row share their y
+         limits, and only the left panel of each row has y tick
+         labels and a y axis label.
+
+       * *xlabel*, *ylabel* - Default axis labels of the panels.
+
+       Any other keyword arguments are passed on to the
+       :class:`pyasy.plot.Plot` constructor of each panel, and of the
+       plot that composes the panels (eg, *directory*, where the grid
+       is written, *preview*, and the resource limits).  The panels
+       themselves are rendered in a temporary directory.
+
+       **Methods**
+
+       """
+
+    def __init__(self, rows, cols, size=(2.0, 1.5), spacing=(0.75, 0.6),
+                 sharex=False, sharey=False, xlabel='$x$', ylabel='',
+                 **kwargs):
+
+        self.rows = rows
+        self.cols = cols
+        self.size = size
+        self.spacing = spacing
+        self.sharex = sharex
+        self.sharey = sharey
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+        self.kwargs = kwargs
+
+        self.directory = tempfile.mkdtemp(prefix='pyasy-')
+        self.panels = {}
+        self.axes = {}
+        self.lock = threading.Lock()
+
+
+    ##################################################################
+
+    def panel(self, row, col, **kwargs):
+        """Return the plot of the panel at (*row*, *col*).
+
+           The plot is created by the first call.  Any keyword
+           arguments (eg, *title*, *xlabel*, *ylabel*, *xticks*, and
+           *yticks*) are passed on to :func:`pyasy.plot.Plot.axis`
+           when the grid is shipped out (don't call it yourself).
+
+           """
+
+        if not (0 <= row < self.rows and 0 <= col < self.cols):
+            raise IndexError('pyasy: no panel (%d, %d) in a %dx%d grid'
+                             % (row, col, self.rows, self.cols))
+
+        with self.lock:
+            if (row, col) not in self.panels:
+                options = dict(self.kwargs, size=tuple(self.size) + (False,),
+                               directory=self.directory)
+                self.panels[row, col] = plot.Plot(**options)
+                self.axes[row, col] = { 'xlabel': self.xlabel,
+                                        'ylabel': self.ylabel }
+
+            self.axes[row, col].update(kwargs)
+
+        return self.panels[row, col]
+
+
+    ##################################################################
+
+    def _limits(self, panels, axis):
+
+        # union of the bounds of the panels along axis (in data space)
+        bounds = [ p.plots[-1]['bounds'] for p in panels ]
+        return list(panels[0]._unscaled(axis, np.array([ min([ b['min'][axis] for b in bounds ]),
+                                                         max([ b['max'][axis] for b in bounds ]) ])))
+
+
+    def _no_labels(self, ticks):
+
+        options = dict(ticks[1])
+        options['format'] = '"%"'
+        return (ticks[0], options)
+
+
+    def _render(self, row, col, panels):
+
+        p = self.panels[row, col]
+        axes = dict(self.axes[row, col])
+
+        column = [ (i, j) for i, j in panels if j == col ]
+        line = [ (i, j) for i, j in panels if i == row ]
+
+        if self.sharex:
+            p.xlims = self._limits([ self.panels[k] for k in column ], 0)
+            if row != max([ i for i, j in column ]):
+                axes['xlabel'] = ''
+                axes['xticks'] = self._no_labels(axes.get('xticks', ('LeftTicks', {})))
+
+        if self.sharey:
+            axes['ylims'] = self._limits([ self.panels[k] for k in line ], 1)
+            if col != min([ j for i, j in line ]):
+                axes['ylabel'] = ''
+                axes['yticks'] = self._no_labels(axes.get('yticks', ('RightTicks', {})))
+
+        p.axis(**axes)
+
+        # ship the panel out as is (with the lower left corner of the
+        # data area at the origin), along with its bounding box (the
+        # name is relative to the working directory of the engine,
+        # where Asymptote is allowed to write)
+        name = 'panel-%d-%d' % (row, col)
+
+        with p.asy.lock:
+            p._compose()
+            p.asy.send('frame F = currentpicture.fit()')
+            p.asy.send('file box = output("%s.box")' % name)
+            p.asy.send('write(box, min(F).x, endl); write(box, min(F).y, endl)')
+            p.asy.send('write(box, max(F).x, endl); write(box, max(F).y, endl)')
+            p.asy.send('close(box)')
+            p.asy.send('shipout("%s", F, format="eps")' % name)
+
+        return name
+
+
+    def shipout(self, basename='grid', format='pdf', echo=False):
+        """Render the panels (in parallel) and compose them into
+           *basename.format*.  The *format* may also be a list of
+           formats."""
+
+        if isinstance(format, str):
+            format = [format]
+
+        try:
+            self._shipout(basename, format, echo)
+        finally:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+    def _shipout(self, basename, format, echo):
+
+        # panels without data are left empty
+        panels = [ k for k in sorted(self.panels)
+                   if self.panels[k].plots and 'bounds' in self.panels[k].plots[-1] ]
+
+        names = {}
+        for row, col in panels:
+            names[row, col] = os.path.join(self.directory, self._render(row, col, panels))
+
+        # wait for the panel engines to finish (in parallel)
+        errors = []
+
+        def close(panel):
+            try:
+                panel.close()
+            except Exception:
+                errors.append(sys.exc_info())
+
+        threads = [ threading.Thread(target=close, args=(self.panels[k],))
+                    for k in self.panels ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        if errors:
+            raise errors[0][0], errors[0][1], errors[0][2]
+
+        for row, col in panels:
+            session = getattr(self.panels[row, col].asy, 'session', None)
+            if session is not None and session.returncode:
+                raise RuntimeError('pyasy: panel (%d, %d) failed: asy exited with status %d'
+                                   % (row, col, session.returncode))
+
+        w, h = self.size
+        sx, sy = self.spacing
+
+        # the panels are composed by a plot with the options of the
+        # grid (but not recorded)
+        options = dict(self.kwargs, echo=echo or self.kwargs.get('echo', False))
+        options.pop('record', None)
+        asy = plot.Plot(**options).asy
+
+        for i, j in panels:
+            f = open(names[i, j] + '.box')
+            xmin, ymin, xmax, ymax = [ float(v) for v in f.read().split() ]
+            f.close()
+
+            # position of the centre of the panel
+            x = 72.0*j*(w + sx) + (xmin + xmax)/2
+            y = 72.0*(self.rows - 1 - i)*(h + sy) + (ymin + ymax)/2
+
+            asy.send('label(graphic("%s.eps"), (%r, %r))' % (names[i, j], x, y))
+
+        for fmt in format:
+            asy.send('shipout("%s", format="%s")' % (basename, fmt))
+
+        asy.close()
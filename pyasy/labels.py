@@ -0,0 +1,228 @@
+"""PyAsy label cache."""
+
+import hashlib
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+
+######################################################################
+
+# Asymptote functions to write, read, and fill label outlines: the
+# outlines of a label are stored as a flat array with, for each path,
+# the number of nodes, whether the path is cyclic, and the point,
+# precontrol, and postcontrol of each node
+asy_outlines = '''
+void writeoutlines(string name, path[] g) {
+  file f = output(name);
+  for (int i=0; i<g.length; ++i) {
+    int n = size(g[i]);
+    write(f, n, endl);
+    write(f, cyclic(g[i]) ? 1 : 0, endl);
+    for (int j=0; j<n; ++j) {
+      pair z = point(g[i], j), a = precontrol(g[i], j), b = postcontrol(g[i], j);
+      write(f, z.x, endl); write(f, z.y, endl);
+      write(f, a.x, endl); write(f, a.y, endl);
+      write(f, b.x, endl); write(f, b.y, endl);
+    }
+  }
+  close(f);
+}
+
+path[] readoutlines(real[] a) {
+  path[] g;
+  int k = 0;
+  while (k < a.length) {
+    int n = round(a[k]);
+    path q = (a[k+2], a[k+3]);
+    for (int i=1; i<n; ++i) {
+      int j = k + 2 + 6*i;
+      q = q .. controls (a[j-2], a[j-1]) and (a[j+2], a[j+3]) .. (a[j], a[j+1]);
+    }
+    if (a[k+1] != 0) {
+      int j = k + 2 + 6*(n-1);
+      q = q .. controls (a[j+4], a[j+5]) and (a[k+4], a[k+5]) .. cycle;
+    }
+    g.push(q);
+    k += 2 + 6*n;
+  }
+  return g;
+}
+
+frame fillframe(path[] g) {
+  frame f;
+  if (g.length > 0)
+    fill(f, g, currentpen);
+  return f;
+}
+'''
+
+
+class LabelCache(object):
+    """PyAsy label cache (persistent, on-disk cache of typeset labels).
+
+       The first time a label (eg, ``'$x$'``) is used, it is typeset
+       by TeX (through the Asymptote ``texpath`` function) and the
+       outlines of the typeset label are saved in the cache
+       directory.  Later uses of the same label, in the same or later
+       runs, fill the cached outlines, so a plot whose labels are all
+       in the cache is rendered without TeX.  Outlines are keyed by
+       the label text, the TeX engine, and the default pen (which
+       includes the font settings).
+
+       Usually the cache is enabled through the *label_cache* argument
+       of the PyAsy Plot class (or the ``PYASY_LABEL_CACHE``
+       environment variable), eg::
+
+       >>> plot = pyasy.plot.Plot(label_cache='~/.cache/pyasy')
+       >>> ...
+       >>> print plot.label_cache.stats()
+
+       **Arguments**
+
+       * *directory* - Cache directory (created if necessary).
+
+       * *max_size* - Maximum size of the cache directory (in bytes).
+         The least recently used outlines are removed when the cache
+         grows beyond this size.
+
+       **Methods**
+
+       """
+
+    def __init__(self, directory, max_size=16*1024*1024):
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+
+    def key(self, text, tex='latex', pen=''):
+        """Return the cache key of the label *text*."""
+        return hashlib.sha1('\0'.join([text, tex, pen])).hexdigest()
+
+
+    def lookup(self, key):
+        """Return the outlines (an array, see :func:`store`) cached
+           under *key*, or None if they aren't in the cache."""
+
+        filename = os.path.join(self.directory, key + '.npy')
+
+        try:
+            outlines = np.load(filename)
+        except (IOError, OSError, ValueError):
+            outlines = None
+
+        with self.lock:
+            if outlines is None:
+                self.misses = self.misses + 1
+                return None
+            self.hits = self.hits + 1
+
+        try:
+            os.utime(filename, None)
+        except OSError:                 # removed by another thread
+            pass
+
+        return outlines
+
+
+    def store(self, key, filename):
+        """Add the outlines written by the Asymptote engine to
+           *filename* (see ``writeoutlines``) to the cache under
+           *key*."""
+
+        f = open(filename)
+        outlines = np.array(f.read().split(), dtype=float)
+        f.close()
+
+        # written to a temporary file and renamed, so that plots
+        # running concurrently never read a partial file
+        fd, tmp = tempfile.mkstemp(prefix='.', suffix='.npy', dir=self.directory)
+        f = os.fdopen(fd, 'wb')
+        np.save(f, outlines)
+        f.close()
+        os.rename(tmp, os.path.join(self.directory, key + '.npy'))
+
+        self.prune(keep=[ key + '.npy' ])
+
+
+    def snippets(self):
+        """Return a list of ``(mtime, size, filename)`` tuples of the
+           outlines in the cache (least recently used first)."""
+
+        snippets = []
+        for name in os.listdir(self.directory):
+            filename = os.path.join(self.directory, name)
+            if name.endswith('.npy') and not name.startswith('.'):
+                try:
+                    st = os.stat(filename)
+                except OSError:         # removed by another thread
+                    continue
+                snippets.append((st.st_mtime, st.st_size, filename))
+
+        return sorted(snippets)
+
+
+    def prune(self, keep=()):
+        """Remove the least recently used outlines (except those
+           named in *keep*) until the cache is smaller than
+           *max_size*."""
+
+        snippets = self.snippets()
+        size = sum([ s[1] for s in snippets ])
+
+        for mtime, nbytes, filename in snippets:
+            if size <= self.max_size:
+                break
+            if os.path.basename(filename) in keep:
+                continue
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+            size = size - nbytes
+
+
+    def stats(self):
+        """Return a dictionary of cache statistics (hits, misses, hit
+           rate, number of cached labels, and size in bytes)."""
+
+        snippets = self.snippets()
+
+        with self.lock:
+            hits, misses = self.hits, self.misses
+
+        return { 'hits': hits,
+                 'misses': misses,
+                 'hit_rate': float(hits)/(hits+misses) if hits+misses else 0.0,
+                 'snippets': len(snippets),
+                 'size': sum([ s[1] for s in snippets ]) }
+
+
+######################################################################
+
+caches = {}
+caches_lock = threading.Lock()
+
+def cache(directory, **kwargs):
+    """Return the (shared) label cache for *directory*.
+
+       Plots that use the same cache directory share the same
+       :class:`LabelCache` instance, so that the hit rates reported
+       by :func:`LabelCache.stats` cover all of them.
+
+       """
+
+    directory = os.path.abspath(os.path.expanduser(directory))
+    with caches_lock:
+        if directory not in caches:
+            caches[directory] = LabelCache(directory, **kwargs)
+
+        return caches[directory]
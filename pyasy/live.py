@@ -0,0 +1,269 @@
+"""PyAsy LivePlot object."""
+
+import time
+
+import numpy as np
+
+import base
+
+
+######################################################################
+
+class LivePlot(base.Base):
+    """PyAsy live plot (for monitoring running computations).
+
+       A live plot keeps its Asymptote engine open.  New samples are
+       appended to a series with :func:`append`: only the new samples
+       are sent to Asymptote, where they are appended to the series.
+       The plot is re-rendered (at most) every *interval* seconds to
+       *basename.format*, which can be watched by a viewer (the
+       output is rendered to a temporary file and then renamed, so
+       the viewer never sees a partial file).  The data files of the
+       appended samples are removed at each render, once the engine
+       has read them.
+
+       **Basic usage**
+
+       >>> import pyasy.live
+       >>> live = pyasy.live.LivePlot('residual', interval=5.0, window=10000)
+       >>> for step in simulation:
+       ...     live.append([step.time], [step.residual])
+       >>> live.close()
+
+       **Arguments**
+
+       * *basename* - Output file name (without the extension).
+
+       * *format* - Output format.
+
+       * *interval* - Minimum time (in seconds) between renders.
+
+       * *window* - If set, only the last *window* samples of each
+         series are kept (a rolling window).
+
+       * *history* - If set, each series is decimated whenever it
+         grows to more than *history* samples: every other sample of
+         the older half of the series is dropped (and the series is
+         sent again).  Recent samples are kept at full resolution.
+
+       * *title*, *xlabel*, *ylabel* - Plot and axis labels.
+
+       Any other keyword arguments are passed on to the
+       :class:`pyasy.plot.Plot` constructor (eg, *size*).  Without a
+       *window* or *history*, the series grow without bounds.
+
+       **Methods**
+
+       """
+
+    def __init__(self, basename='live', format='png', interval=1.0,
+                 window=None, history=None,
+                 title='', xlabel='$x$', ylabel='', **kwargs):
+
+        base.Base.__init__(self, **kwargs)
+
+        self.basename = basename
+        self.format = format
+        self.interval = interval
+        self.window = window
+        self.history = history
+        self.title = title
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+
+        self.series = []
+        self.rendered = None
+        self.closed = False
+        self.plots = [ {'size': self.size, 'shift': (0,0)} ]
+
+        self.asy.send('picture live')
+
+
+    ##################################################################
+
+    @base.synchronized
+    def append(self, x, y, series=0, pen=None, legend=None, **kwargs):
+        """Append the samples (*x*, *y*) to *series* (a number), and
+           re-render the plot if it hasn't been rendered in the last
+           *interval* seconds.
+
+           The *pen* and *legend* of a series are set by the first
+           :func:`append` to it.  Non-finite samples are dropped.
+
+           """
+
+        x = np.ravel(np.asarray(x, dtype=float))
+        y = np.ravel(np.asarray(y, dtype=float))
+
+        keep = np.isfinite(x) & np.isfinite(y)
+        x = x[keep]
+        y = y[keep]
+
+        while len(self.series) <= series:
+            k = len(self.series)
+            self.asy.send('real[] LX%d, LY%d' % (k, k))
+            self.series.append({ 'pen': None, 'legend': None, 'n': 0,
+                                 'x': None, 'y': None, 'bounds': None })
+
+        s = self.series[series]
+        if s['pen'] is None:
+            s['pen'] = self._pen(pen, **kwargs)
+            s['legend'] = legend
+
+        if x.size > 0:
+            self.asy.slurp2(x, y)
+            self.asy.send('LX%d.append(X); LY%d.append(Y)' % (series, series))
+            s['n'] = s['n'] + x.size
+            self._account('line', x.size)
+
+            if self.window is None and self.history is None:
+                self._bounds(x, y)
+            else:
+                self._retain(series, x, y)
+
+        if self.rendered is None or time.time() - self.rendered >= self.interval:
+            self.render()
+
+
+    def _retain(self, k, x, y):
+
+        # keep a copy of each series (bounded by the window or history)
+        # to decimate it, and to update the bounds when old samples
+        # are dropped
+        s = self.series[k]
+
+        if s['x'] is None:
+            s['x'], s['y'] = x, y
+        else:
+            s['x'] = np.concatenate((s['x'], x))
+            s['y'] = np.concatenate((s['y'], y))
+
+        s['bounds'] = self._extend(s['bounds'], x, y)
+
+        if self.window is not None and s['n'] > self.window:
+            drop = s['n'] - self.window
+            self.asy.send('LX%d.delete(0, %d); LY%d.delete(0, %d)'
+                          % (k, drop-1, k, drop-1))
+            dropped = (s['x'][:drop], s['y'][:drop])
+            s['x'] = s['x'][drop:]
+            s['y'] = s['y'][drop:]
+            s['n'] = self.window
+            self._shrink(s, *dropped)
+
+        if self.history is not None and s['n'] > self.history:
+            h = s['n']//2
+            dropped = (s['x'][1:h:2], s['y'][1:h:2])
+            s['x'] = np.concatenate((s['x'][:h:2], s['x'][h:]))
+            s['y'] = np.concatenate((s['y'][:h:2], s['y'][h:]))
+            s['n'] = s['x'].size
+            self._shrink(s, *dropped)
+
+            self.asy.slurp2(s['x'], s['y'])
+            self.asy.send('LX%d = X; LY%d = Y' % (k, k))
+
+        # the bounds of the plot are those of the series
+        bounds = np.array([ t['bounds'] for t in self.series
+                            if t['bounds'] is not None ])
+        self.plots[-1]['bounds'] = { 'min': (bounds[:,0].min(), bounds[:,2].min()),
+                                     'max': (bounds[:,1].max(), bounds[:,3].max()) }
+
+
+    def _extend(self, bounds, x, y):
+
+        # bounds (xmin, xmax, ymin, ymax) extended by the samples
+        if x.size == 0:
+            return bounds
+
+        b = (x.min(), x.max(), y.min(), y.max())
+        if bounds is None:
+            return b
+
+        return (min(bounds[0], b[0]), max(bounds[1], b[1]),
+                min(bounds[2], b[2]), max(bounds[3], b[3]))
+
+
+    def _shrink(self, s, x, y):
+
+        # the bounds of series s after dropping the samples (x, y):
+        # they are only recomputed if a dropped sample was on them
+        b = s['bounds']
+        if x.size and (x.min() <= b[0] or x.max() >= b[1] or
+                       y.min() <= b[2] or y.max() >= b[3]):
+            s['bounds'] = self._extend(None, s['x'], s['y'])
+
+
+    ##################################################################
+
+    @base.synchronized
+    def render(self):
+        """Render the plot now (to *basename.format*)."""
+
+        asy = self.asy
+
+        self.rendered = time.time()
+
+        # remove the slurp files of the samples appended so far (this
+        # waits for the engine to finish the previous render)
+        asy.release()
+
+        if 'bounds' not in self.plots[-1]:
+            return
+
+        d = self.plots[-1]['bounds']
+        xlims = self.xlims or [d['min'][0], d['max'][0]]
+        ylims = self.ylims or [d['min'][1], d['max'][1]]
+
+        if xlims[1] <= xlims[0]:
+            xlims = [xlims[0] - 0.5, xlims[0] + 0.5]
+        if ylims[1] <= ylims[0]:
+            ylims = [ylims[0] - 0.5, ylims[0] + 0.5]
+
+        asy.send('live = new picture')
+
+        legends = False
+        for k, s in enumerate(self.series):
+            if s['n'] < 2:
+                continue
+
+            command = 'draw(live, graph(LX%d, LY%d), %s' % (k, k, s['pen'])
+            if s['legend'] is not None:
+                command = command + (', legend="%s"' % self._label(s['legend']))
+                legends = True
+            asy.send(command + ')')
+
+        asy.send('''xaxis(live, Label("%s", MidPoint, N), YEquals(%r),
+                          %r, %r, above=true)'''
+                 % (self._label(self.title), ylims[1], xlims[0], xlims[1]))
+        asy.send('''xaxis(live, Label("%s", MidPoint, S), YEquals(%r),
+                          %r, %r, LeftTicks, above=true)'''
+                 % (self._label(self.xlabel), ylims[0], xlims[0], xlims[1]))
+        asy.send('''yaxis(live, "%s", LeftRight, %r, %r, RightTicks,
+                          above=true)'''
+                 % (self._label(self.ylabel), ylims[0], ylims[1]))
+
+        if legends:
+            asy.send('add(live, legend(live), point(live, NE), 20SE, UnFill)')
+
+        w, h = self.size[:2]
+        asy.send('size(live, %s*inch, %s*inch, (%r, %r), (%r, %r))'
+                 % (w, h, xlims[0], ylims[0], xlims[1], ylims[1]))
+
+        fmt = 'png' if self.preview else self.format
+        asy.send('shipout("%s-next", live, format="%s")' % (self.basename, fmt))
+        asy.send('rename("%s-next.%s", "%s.%s")'
+                 % (self.basename, fmt, self.basename, fmt))
+
+
+    ##################################################################
+
+    @base.synchronized
+    def close(self):
+        """Render the plot (one last time) and close the Asymptote
+           engine."""
+
+        if self.closed:
+            return
+        self.closed = True
+
+        self.render()
+        self.asy.close()
@@ -0,0 +1,87 @@
+"""PyAsy preprocessing pipeline.
+
+   The NumPy preprocessing of the data of a plot (filtering gaps,
+   scaling, smoothing, simplifying, and bounds) can be run on a pool
+   of threads (most NumPy operations on large arrays release the
+   GIL).  The number of threads is set with the *workers* argument of
+   :class:`pyasy.plot.Plot`, or for all plots with the
+   ``PYASY_WORKERS`` environment variable (it defaults to 1, ie, no
+   threads)::
+
+   >>> plot = pyasy.plot.Plot(workers=4)
+
+   Large arrays are then preprocessed in chunks on the pool, and the
+   series drawn by :func:`pyasy.plot.Plot.lines` are preprocessed on
+   the pool while the previous series are sent to Asymptote.
+
+   The pools are shared by all plots with the same number of workers.
+
+   """
+
+import os
+import threading
+
+from multiprocessing.pool import ThreadPool
+
+
+######################################################################
+
+# number of samples per chunk
+chunk = 1<<18
+
+_pools = {}
+_lock = threading.Lock()
+
+
+def workers(n=None):
+    """Return the number of workers *n*, which defaults to the
+       ``PYASY_WORKERS`` environment variable (or 1)."""
+
+    if n is None:
+        n = int(os.environ.get('PYASY_WORKERS') or 1)
+
+    return max(n, 1)
+
+
+def pool(n):
+    """Return the (shared) pool of *n* threads, or None if *n* is
+       1."""
+
+    if n <= 1:
+        return None
+
+    with _lock:
+        if n not in _pools:
+            _pools[n] = ThreadPool(n)
+        return _pools[n]
+
+
+def chunks(size, pool=None):
+    """Return the slices of the chunks of *size* samples (one slice
+       if there is no *pool*)."""
+
+    if pool is None or size <= chunk:
+        return [ slice(0, size) ]
+
+    return [ slice(i, min(i + chunk, size)) for i in range(0, size, chunk) ]
+
+
+def map(pool, func, items):
+    """Return ``[ func(item) for item in items ]``, computed on
+       *pool* (if it isn't None)."""
+
+    items = list(items)
+    if pool is None or len(items) < 2:
+        return [ func(item) for item in items ]
+
+    return pool.map(func, items)
+
+
+def imap(pool, func, items):
+    """Iterate over ``func(item)`` for each of *items* (in order),
+       computed ahead on *pool* (if it isn't None)."""
+
+    if pool is None:
+        return (func(item) for item in items)
+
+    return pool.imap(func, items)
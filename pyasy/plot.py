@@ -1,11 +1,15 @@
 """PyAsy Plot object."""
 
+import itertools
 import textwrap
 
 import numpy as np
 
 import base
 import asymptote
+import pipeline
+import raster
+import scales
 
 
 ######################################################################
@@ -55,6 +59,14 @@ class Plot(base.Base):
 
        >>> plot.asy.echo = True
 
+       **Threads**
+
+       Each plot owns its Asymptote engine (and scratch files), so
+       independent plots can be built and shipped out from different
+       threads at the same time.  A plot can also be shared between
+       threads: each method holds the engine lock (see
+       :class:`pyasy.asymptote.Asymptote`) while it runs.
+
        **Arguments**
 
        * *xlims* - Sets the default xlimits ([xmin, xmax]).
@@ -70,6 +82,44 @@ class Plot(base.Base):
        * *plotpen* - Sets the plot pen (used when drawing lines and
          dots in the plots, but not for axis etc).
 
+       * *preview* - Fast preview mode: labels are rendered without
+         LaTeX, large data sets are decimated, and the plot is
+         shipped out as a low resolution PNG.  Defaults to True if
+         the ``PYASY_PREVIEW`` environment variable is set (and not
+         ``0``), so that the same script renders in full quality when
+         the variable is unset.
+
+       * *label_cache* - Directory (or :class:`pyasy.labels.LabelCache`
+         instance) of the persistent cache of typeset labels (the
+         title, axis, and tick labels, see :func:`axis`).  Defaults
+         to the ``PYASY_LABEL_CACHE`` environment variable (if set).
+
+       * *server* - Socket address of a PyAsy render server (see
+         :mod:`pyasy.daemon`).  If set, the plot is rendered by the
+         server when it is shipped out.
+
+       * *budget* - Render budget and degradation policy (see
+         :class:`pyasy.cost.Budget`).  The predicted cost of the plot
+         is available through :func:`pyasy.plot.Plot.estimate`.
+
+       * *record* - Directory of a session archive: the plot method
+         calls and the data they send to Asymptote are recorded
+         there, so that the plot can be re-rendered (eg, with a
+         different style) by :func:`pyasy.session.replay`.  A
+         ValueError is raised if the other arguments can't be recorded
+         (eg, an axis scale given by functions); calls with arguments
+         that can't be recorded are made, but not recorded (with a
+         warning).
+
+       * *xscale*, *yscale* - Axis scales: ``'linear'`` (the default),
+         ``'log'``, ``'symlog'``, a ``(forward, inverse)`` tuple of
+         functions, or a :class:`pyasy.scales.Scale` (see
+         :mod:`pyasy.scales`).
+
+       * *workers* - Number of preprocessing threads (see
+         :mod:`pyasy.pipeline`).  Defaults to the ``PYASY_WORKERS``
+         environment variable (or 1).
+
        Any other keyword arugments are passed on to the
        pyasy.asymptote.Asymptote constructor.
 
@@ -79,6 +129,8 @@ class Plot(base.Base):
 
     ##################################################################
 
+    @base.synchronized
+    @base.recorded
     def axis(self, title='',
              xlabel='$x$', ylabel='',
              ylims=None,                # XXX: move elsewhere?
@@ -103,6 +155,15 @@ class Plot(base.Base):
 
            * *yticks*: As above.
 
+           The ticks of scaled axes (see :mod:`pyasy.scales`) are
+           placed by the scale, unless the *Ticks* (or *format*)
+           option is given.
+
+           With a label cache (see :mod:`pyasy.labels`), the title,
+           the axis labels, and the tick labels are drawn from the
+           cache, and the ticks of linear axes are placed at round
+           numbers by PyAsy.
+
            .. _`Asymptote`: http://asymptote.sf.net/
 
            """
@@ -113,13 +174,18 @@ class Plot(base.Base):
 
         picture = self._picture()
 
+        # limits (in scaled coordinates)
         if xlims is None:
             xlims = [self.plots[-1]['bounds']['min'][0],
                      self.plots[-1]['bounds']['max'][0]]
+        else:
+            xlims = self._scaled(0, xlims)
 
         if ylims is None:
             ylims = [self.plots[-1]['bounds']['min'][1],
                      self.plots[-1]['bounds']['max'][1]]
+        else:
+            ylims = self._scaled(1, ylims)
 
         asy.send('real x1 = %lf' % xlims[0])
         asy.send('real x2 = %lf' % xlims[1])
@@ -127,12 +193,35 @@ class Plot(base.Base):
         asy.send('real y1 = %lf' % ylims[0])
         asy.send('real y2 = %lf' % ylims[1])
 
+        if self.label_cache is not None:
+            self._outline_axis(picture, title, xlabel, ylabel, xticks, yticks,
+                               xlims, ylims)
+        else:
+            self._typeset_axis(picture, title, xlabel, ylabel, xticks, yticks,
+                               xlims, ylims)
+
+        # pallete
+        if self.palette:
+            asy.send(self.palette)
+            self.palette = False
+
+        self._bounds(np.array(xlims), np.array(ylims))
+
+
+    def _typeset_axis(self, picture, title, xlabel, ylabel, xticks, yticks,
+                      xlims, ylims):
+
+        asy = self.asy
+
+        xticks = self._scale_ticks(picture, 'x', self.xscale, xlims, xticks)
+        yticks = self._scale_ticks(picture, 'y', self.yscale, ylims, yticks)
+
         asy.send('''xaxis(%(pic)s,
                           Label("%(title)s", MidPoint, N),
                           YEquals(y2),
                           x1, x2, above=true
                           )'''
-                 % { 'pic': picture, 'title': title } )
+                 % { 'pic': picture, 'title': self._label(title) } )
 
 
         # x ticks
@@ -146,7 +235,7 @@ class Plot(base.Base):
                           above=true
                           )'''
                  % { 'pic': picture,
-                     'xlabel': xlabel,
+                     'xlabel': self._label(xlabel),
                      'ticks': ticks })
 
         # y ticks
@@ -162,20 +251,121 @@ class Plot(base.Base):
                           above=true
                           )'''
                  % { 'pic': picture,
-                     'ylabel': ylabel,
+                     'ylabel': self._label(ylabel),
                      'ticks': ticks })
 
-        # pallete
-        if self.palette:
-            asy.send(self.palette)
-            self.palette = False
 
-        self._bounds(np.array(xlims), np.array(ylims))
+    def _outline_axis(self, picture, title, xlabel, ylabel, xticks, yticks,
+                      xlims, ylims):
+
+        # the labels are drawn as outlines from the label cache (see
+        # pyasy.labels), and placed by PyAsy: the tick labels at their
+        # ticks, and the axis labels beyond the tick labels (if the
+        # ticks are given by the Ticks or format option, their labels
+        # and the axis label are typeset by Asymptote instead)
+        asy = self.asy
+
+        xticks, xplaced = self._outline_ticks(self.xscale, xlims, xticks)
+        yticks, yplaced = self._outline_ticks(self.yscale, ylims, yticks)
+
+        asy.send('xaxis(%s, YEquals(y2), x1, x2, above=true)' % picture)
+        asy.send('xaxis(%s, %s, YEquals(y1), x1, x2, %s, above=true)'
+                 % (picture, '""' if xplaced is not None
+                             else 'Label("%s", MidPoint, S)' % self._label(xlabel),
+                    xticks[0] + self._dict_to_arguments(xticks[1])))
+        asy.send('yaxis(%s, %s, LeftRight, y1, y2, %s, above=true)'
+                 % (picture, '""' if yplaced is not None
+                             else '"%s"' % self._label(ylabel),
+                    yticks[0] + self._dict_to_arguments(yticks[1])))
+
+        commands = [ 'real w = 0, h = 0' ]
+
+        for v, label in xplaced or []:
+            f = self._outlines(self._label(label))
+            commands.append('add(%s, %s, (%r, y1), S); h = max(h, ypart(size(%s)))'
+                            % (picture, f, v, f))
+        for v, label in yplaced or []:
+            f = self._outlines(self._label(label))
+            commands.append('add(%s, %s, (x1, %r), W); w = max(w, xpart(size(%s)))'
+                            % (picture, f, v, f))
+
+        if title:
+            f = self._outlines(self._label(title))
+            commands.append('add(%s, %s, ((x1 + x2)/2, y2), N)' % (picture, f))
+        if xlabel and xplaced is not None:
+            f = self._outlines(self._label(xlabel))
+            commands.append('add(%s, shift(0, -h - labelmargin())*%s, ((x1 + x2)/2, y1), S)'
+                            % (picture, f))
+        if ylabel and yplaced is not None:
+            f = self._outlines(self._label(ylabel))
+            commands.append('add(%s, shift(-w - labelmargin(), 0)*rotate(90)*%s, (x1, (y1 + y2)/2), W)'
+                            % (picture, f))
+
+        asy.send('{ %s; }' % '; '.join(commands))
+
+
+    def _outline_ticks(self, scale, lims, ticks):
+
+        # ticks placed by PyAsy (by the scale, or at round numbers),
+        # without labels, and the placed labels: a list of (value,
+        # label) pairs, or None if the ticks are given by the options
+        options = dict(ticks[1])
+        if 'Ticks' in options or 'format' in options:
+            return ticks, None
+
+        placed = scale.ticks(*lims)
+        if placed is None:
+            placed = scales.Scale.ticks(scale, *lims)
+
+        major, labels, minor = placed
+
+        options['format'] = '"%"'
+        options['Ticks'] = 'new real[] {%s}' % ', '.join([ repr(float(v)) for v in major ])
+        options['ticks'] = 'new real[] {%s}' % ', '.join([ repr(float(v)) for v in minor ])
+
+        return (ticks[0], options), [ (float(v), l) for v, l in zip(major, labels) if l ]
+
+
+    def _scale_ticks(self, picture, axis, scale, lims, ticks):
+
+        # ticks (and their labels) placed by a scale
+        options = dict(ticks[1])
+        if 'Ticks' in options or 'format' in options:
+            return ticks
+
+        placed = scale.ticks(*lims)
+        if placed is None:
+            return ticks
+
+        major, labels, minor = placed
+        name = '%s%sticklabel' % (picture, axis)
+
+        self.asy.send('''real[] %(name)sv = {%(values)s};
+                         string[] %(name)ss = {%(labels)s};
+                         string %(name)s(real x) {
+                           for (int i=0; i<%(name)sv.length; ++i)
+                             if (abs(x - %(name)sv[i]) <= 1e-9*(1 + abs(x)))
+                               return %(name)ss[i];
+                           return "";
+                         }'''
+                      % { 'name': name,
+                          'values': ', '.join([ repr(float(v)) for v in major ]),
+                          'labels': ', '.join([ '"%s"' % self._label(l) for l in labels ]) })
+
+        options['ticklabel'] = name
+        options['Ticks'] = '%sv' % name
+        options['ticks'] = 'new real[] {%s}' % ', '.join([ repr(float(v)) for v in minor ])
+
+        return (ticks[0], options)
 
 
     ##################################################################
 
-    def scatter(self, x, y, pen=None, **kwargs):
+    @base.synchronized
+    @base.recorded
+    def scatter(self, x, y, pen=None, rasterize=False, dpi=None,
+                dotsize=3.0, c=None, s=None, palette='Rainbow(512)',
+                crange=None, srange=None, bar=False, **kwargs):
         """Scatter plot of *y* vs *x* (both of which should be 1d
            ndarrays).
 
@@ -185,6 +375,27 @@ class Plot(base.Base):
            * *y*: Vertical coordindates of data points.
            * *pen*: Asymptote pen (array or '+' delimited string).
              Defaults to *plotpen*.
+           * *rasterize*: If True, the dots are drawn into a raster
+             image (see :func:`pyasy.plot.Plot.line`).  Colours and
+             sizes (see below) are ignored.
+           * *dpi*: Resolution of the raster image.
+           * *dotsize*: Diameter of the rasterized dots (in bp).
+           * *c*: Colour values (1d ndarray): each dot is coloured by
+             mapping its value through the *palette*.
+           * *s*: Dot diameters (in bp): a scalar, or a 1d ndarray of
+             per dot sizes.
+           * *palette*: `Asymptote palette`_ for the colour values.
+           * *crange*: Range ``[min, max]`` of colour values mapped to
+             the palette (defaults to the range of *c*).
+           * *srange*: Range ``[min, max]`` of diameters (in bp).  If
+             given, the values of *s* are mapped linearly onto it.
+           * *bar*: Palette bar for the colour values (see
+             :func:`pyasy.plot.Plot.density`).
+
+           The colours and sizes are computed by PyAsy and sent to
+           Asymptote along with the coordinates (in one transfer).
+
+           .. _`Asymptote palette`: http://asymptote.sourceforge.net/doc/palette.html
 
            """
 
@@ -193,16 +404,80 @@ class Plot(base.Base):
         picture = self._picture(**kwargs)
         pen = self._pen(pen, **kwargs)
 
-        self._filter_and_slurp2(x, y, **kwargs)
+        if s is not None and np.ndim(s) == 0:
+            pen = pen + '+linewidth(%r/dotfactor)' % float(s)
+            s = None
+
+        k, rasterize = self._degrade('scatter', len(x), rasterize)
+        x = x[::k]
+        y = y[::k]
+
+        if rasterize:
+            self._filter_and_rasterize2(x, y, picture, pen, dpi=dpi,
+                                        dotsize=dotsize)
+            return
+
+        if c is None and s is None:
+            self._filter_and_slurp2(x, y, **kwargs)
+            self._account('scatter', self.x.size)
+
+            self.asy.send('''for (int i=0; i<X.length; ++i)
+                               { dot(%s, (X[i], Y[i]), %s); }'''
+                          % (picture, pen))
+            return
+
+        columns = [ c if c is None else np.asanyarray(c)[::k],
+                    s if s is None else np.asanyarray(s)[::k] ]
+        x, y, offsets, (c, s) = self._filter2_columns(x, y, columns)
+
+        arrays = [ ('X', x), ('Y', y) ]
+        commands = []
+
+        if c is not None:
+            if crange is None:
+                crange = [c.min(), c.max()] if c.size else [0.0, 1.0]
+            if crange[1] > crange[0]:
+                c = (c - crange[0])/float(crange[1] - crange[0])
+            else:
+                c = 0.0*c
+
+            arrays.append(('C', np.clip(c, 0.0, 1.0)))
+            commands.append('p = p + pal[round(C[i]*(pal.length-1))]')
+            self.asy.send('pen[] pal = %s' % palette)
+
+        if s is not None:
+            if srange is not None and s.size and s.max() > s.min():
+                s = srange[0] + (s - s.min())/(s.max() - s.min())*(srange[1] - srange[0])
+
+            arrays.append(('S', s))
+            commands.append('p = p + linewidth(S[i]/dotfactor)')
+
+        self.asy.load(arrays)
 
         self.asy.send('''for (int i=0; i<X.length; ++i)
-                           { dot(%s, (X[i], Y[i]), %s); }'''
-                      % (picture, pen))
+                           { pen p = %s; %s; dot(%s, (X[i], Y[i]), p); }'''
+                      % (pen, '; '.join(commands), picture))
+
+        if bar and c is not None:
+            self.asy.send('bounds range = bounds(%r, %r)' % tuple(map(float, crange)))
+            self.asy.send('pair initial = (%r, %r)' % (x.min(), y.min()))
+            self.asy.send('pair final = (%r, %r)' % (x.max(), y.max()))
+            self._palette_bar(picture, bar, pen)
+
+        self._account('scatter', x.size)
+
+        self.x = x
+        self.y = y
+        self._bounds(x, y)
 
 
     ##################################################################
 
-    def line(self, x, y, pen=None, legend=None, marker=None, **kwargs):
+    @base.synchronized
+    @base.recorded
+    def line(self, x, y, pen=None, legend=None, marker=None,
+             rasterize=False, dpi=None, linewidth=0.5, simplify=None,
+             **kwargs):
         """Line plot of *y* vs *x* (both of which should be 1d
            ndarrays).
 
@@ -214,21 +489,69 @@ class Plot(base.Base):
              Defaults to *plotpen*.
            * *legend*: Asymptote legend key
              (see :func:`pyasy.plot.Plot.legend`).
+           * *rasterize*: If True, the line is drawn (by PyAsy) into
+             an anti-aliased raster image which is placed in the plot
+             (the axis, ticks, labels, and legend remain vector
+             graphics).  This is much faster, and produces much
+             smaller output, for very dense lines.  The image has a
+             white background, so rasterized lines should be drawn
+             first.  Markers are not drawn.
+           * *dpi*: Resolution of the raster image (defaults to
+             ``Plot.raster_dpi``).
+           * *linewidth*: Width of the rasterized line (in bp).
+           * *simplify*: Tolerance (in bp, at the size of the plot,
+             eg, ``0.1``).  If given, vertices that are closer than
+             this to the simplified line are removed (with the
+             Ramer-Douglas-Peucker algorithm) before the line is sent
+             to Asymptote.  This works for any line (eg, parametric
+             curves and trajectories), and the vertex counts before
+             and after are stored in the *simplified* instance
+             variable.
+
+           NaN and masked (``numpy.ma``) values in *x* or *y* are
+           treated as gaps: the line is broken at each gap and all of
+           the segments are drawn as one multi-path.
 
            """
 
         picture = self._picture(**kwargs)
         pen = self._pen(pen, **kwargs)
 
-        self._filter_and_slurp2(x, y)
+        k, rasterize = self._degrade('line', len(x), rasterize)
+        x = x[::k]
+        y = y[::k]
+
+        if rasterize:
+            self._filter_and_rasterize2(x, y, picture, pen, dpi=dpi,
+                                        linewidth=linewidth)
+            command = 'draw(%s, nullpath, %s' % (picture, pen)
+        else:
+            offsets = self._filter_and_slurp2(x, y, segments=True,
+                                              simplify=simplify)
+            command = self._line_command(picture, pen, offsets)
+
+        self._draw(command, legend, marker)
 
-        command = 'draw(%s, graph(X, Y), %s' % (picture, pen)
 
+    def _line_command(self, picture, pen, offsets):
+
+        # draw the slurped line (see _filter_and_slurp2)
+        self._account('line', self.x.size)
+
+        if offsets is None:
+            return 'draw(%s, graph(X, Y), %s' % (picture, pen)
+
+        return 'draw(%s, segments(X, Y, O), %s' % (picture, pen)
+
+
+    def _draw(self, command, legend=None, marker=None):
+
+        # finish a draw command (with its legend and marker) and send it
         if legend is not None:
             if legend.find('"') >= 0:
                 command = command + (', legend=%s' % legend)
             else:
-                command = command + (', legend="%s"' % legend)
+                command = command + (', legend="%s"' % self._label(legend))
 
         if marker is not None:
             command = command + (', marker=%s' % marker)
@@ -240,6 +563,170 @@ class Plot(base.Base):
 
     ##################################################################
 
+    @base.synchronized
+    @base.recorded
+    def lines(self, series, pens=None, legends=None, marker=None,
+              simplify=None, **kwargs):
+        """Line plots of each ``(x, y)`` pair of *series*.
+
+           As :func:`pyasy.plot.Plot.line`, but the series are
+           preprocessed (filtered, scaled, smoothed, and simplified)
+           on the preprocessing pool (see :mod:`pyasy.pipeline`),
+           ahead of being sent to Asymptote in order, so that the
+           preprocessing of the next series overlaps the transfer of
+           the current one.
+
+           **Arguments**
+
+           * *series*: List of ``(x, y)`` pairs.
+           * *pens*: List of pens (one per series), or None.
+           * *legends*: List of legend keys (one per series), or None.
+           * *marker*, *simplify*: See :func:`pyasy.plot.Plot.line`.
+
+           Series that the render budget rasterizes are drawn by
+           :func:`pyasy.plot.Plot.line` (without the pool).
+
+           """
+
+        picture = self._picture(**kwargs)
+
+        series = list(series)
+        pens = pens or [ None ]*len(series)
+        legends = legends or [ None ]*len(series)
+
+        # each series is charged to the budget as it is degraded, so
+        # that the series share the budget
+        jobs = []
+        pending = { 'line': 0 }
+        for x, y in series:
+            k, rasterize = self._degrade('line', len(x), pending=pending)
+            if not rasterize:
+                pending['line'] = pending['line'] + len(x[::k])
+            jobs.append((x[::k], y[::k], rasterize))
+
+        def prepare(job):
+            x, y, rasterize = job
+            if rasterize:
+                return None
+            return self._prepare2(x, y, simplify, parallel=False)
+
+        prepared = pipeline.imap(self.pool, prepare, jobs)
+
+        for (x, y, rasterize), p, pen, legend in itertools.izip(jobs, prepared, pens, legends):
+            if p is None:
+                self.line(x, y, pen=pen, legend=legend, rasterize=True, **kwargs)
+                continue
+
+            offsets = self._slurp_prepared2(p, segments=True)
+            command = self._line_command(picture, self._pen(pen, **kwargs), offsets)
+            self._draw(command, legend, marker)
+
+
+    ##################################################################
+
+    @base.synchronized
+    def function(self, f, a=None, b=None, pen=None, legend=None, marker=None,
+                 tolerance=0.1, samples=65, max_samples=10000, **kwargs):
+        """Line plot of the function *f* on [*a*, *b*].
+
+           The function is sampled adaptively: starting from
+           *samples* evenly spaced samples, each interval is split
+           (at its midpoint) while the midpoint is further than
+           *tolerance* (in bp, at the size of the plot) from the
+           straight line drawn between the ends of the interval, so
+           samples are concentrated where the curve bends.  The
+           samples are then drawn as a line (see
+           :func:`pyasy.plot.Plot.line`).
+
+           **Arguments**
+
+           * *f*: Vectorized function (called with an ndarray of x
+             values, returning an ndarray of y values).  NaN and
+             infinite values are treated as gaps.
+           * *a*, *b*: Interval (defaults to, and is clipped to,
+             *xlims*).
+           * *pen*, *legend*, *marker*: See
+             :func:`pyasy.plot.Plot.line`.
+           * *tolerance*: Largest distance (in bp) between the curve
+             and the drawn line.
+           * *samples*: Number of initial samples.
+           * *max_samples*: Maximum number of samples.
+
+           """
+
+        if self.xlims is not None:
+            a = self.xlims[0] if a is None else max(a, self.xlims[0])
+            b = self.xlims[1] if b is None else min(b, self.xlims[1])
+
+        if a is None or b is None:
+            raise ValueError('pyasy: no interval (or xlims) for the function')
+
+        # sampled in scaled coordinates (see pyasy.scales)
+        def evaluate(x):
+            with np.errstate(all='ignore'):
+                y = np.asarray(f(self._unscaled(0, x)), dtype=float)
+            return self._scaled(1, y + np.zeros(x.shape))
+
+        a, b = self._scaled(0, np.array([ a, b ], dtype=float))
+        x = np.linspace(a, b, samples)
+        y = evaluate(x)
+
+        # output units (bp) per data unit
+        self._picture(**kwargs)
+        w, h = self.plots[-1]['size'][:2]
+
+        if self.ylims is not None:
+            ymin, ymax = self._scaled(1, np.array(self.ylims, dtype=float))
+        else:
+            finite = y[np.isfinite(y)]
+            ymin, ymax = (finite.min(), finite.max()) if finite.size else (0.0, 1.0)
+
+        sx = 72.0*w/(b - a) if b > a else 1.0
+        sy = 72.0*h/(ymax - ymin) if ymax > ymin else 1.0
+
+        # intervals to be checked
+        active = np.ones(x.size - 1, dtype=bool)
+
+        while active.any() and x.size < max_samples:
+            i = np.flatnonzero(active)
+
+            xm = (x[i] + x[i+1])/2
+            ym = evaluate(xm)
+
+            # distance (bp) of the midpoint from the chord
+            dx = (x[i+1] - x[i])*sx
+            dy = (y[i+1] - y[i])*sy
+            with np.errstate(invalid='ignore'):
+                dm = (ym - (y[i] + y[i+1])/2)*sy
+                d = np.abs(dx*dm)/np.hypot(dx, dy)
+                split = d > tolerance
+
+            # and find the edges of gaps
+            ends = np.isfinite([ y[i], y[i+1], ym ]).sum(axis=0)
+            split |= (ends > 0) & (ends < 3)
+            split &= dx > 0.01
+
+            i = i[split][:max_samples - x.size]
+            if i.size == 0:
+                break
+
+            x = np.insert(x, i+1, xm[split][:i.size])
+            y = np.insert(y, i+1, ym[split][:i.size])
+
+            # both halves of each split interval are checked next
+            k = i + np.arange(i.size)
+            active = np.zeros(x.size - 1, dtype=bool)
+            active[k] = True
+            active[k+1] = True
+
+        self.line(self._unscaled(0, x), self._unscaled(1, y),
+                  pen=pen, legend=legend, marker=marker, **kwargs)
+
+
+    ##################################################################
+
+    @base.synchronized
+    @base.recorded
     def bar(self, x, y, pen=None, legend=None, marker=None, **kwargs):
         """Bar plot of *y* vs *x* (both of which should be 1d
            ndarrays).
@@ -258,7 +745,9 @@ class Plot(base.Base):
         picture = self._picture(**kwargs)
         pen = self._pen(pen, **kwargs)
 
-        self._filter_and_slurp2(x, y)
+        k, rasterize = self._degrade('line', len(x))
+        self._filter_and_slurp2(x[::k], y[::k])
+        self._account('line', self.x.size)
 
         command = 'draw(%s, graph(X, Y), %s' % (picture, pen)
 
@@ -266,7 +755,7 @@ class Plot(base.Base):
             if legend.find('"') >= 0:
                 command = command + (', legend=%s' % legend)
             else:
-                command = command + (', legend="%s"' % legend)
+                command = command + (', legend="%s"' % self._label(legend))
 
         if marker is not None:
             command = command + (', marker=%s' % marker)
@@ -278,10 +767,13 @@ class Plot(base.Base):
 
     ##################################################################
 
+    @base.synchronized
+    @base.recorded
     def density(self, x, y, z, pen=None,
                 palette='Rainbow(512)',
                 brange='Full',
                 bar=False,
+                rasterize=False, dpi=None,
                 **kwargs):
         """Density (colour filled contour) plot of *z* vs (*x*, *y*).
 
@@ -307,6 +799,19 @@ class Plot(base.Base):
                right corner of the bar.
              * *label*: Label for the bar (eg, ``'$z$'``).
 
+           * *rasterize*: If True, grids that are finer than the
+             output resolution are block averaged down to it (by
+             PyAsy) before they are sent to Asymptote.
+           * *dpi*: Output resolution (defaults to
+             ``Plot.raster_dpi``).
+
+           If *x*, *y*, and *z* are shared arrays (see
+           :mod:`pyasy.shared`), they are read directly by Asymptote.
+
+           On scaled axes (see :mod:`pyasy.scales`), the grid should
+           be evenly spaced in the scaled coordinates (eg,
+           ``numpy.logspace`` on a log axis).
+
            .. _`Asymptote palette`: http://asymptote.sourceforge.net/doc/palette.html
 
         """
@@ -314,7 +819,36 @@ class Plot(base.Base):
         picture = self._picture(**kwargs)
         pen = self._pen(pen, **kwargs)
 
+        x = np.asanyarray(x)
+        y = np.asanyarray(y)
+        z = np.asanyarray(z)
+
+        k, rasterize = self._degrade('density', z.size, rasterize)
+
+        if k > 1 or self._stride(max(len(x), len(y)), self.preview_grid) > 1:
+            # clip to the limits before decimating (and keep the gaps)
+            sx, sy = self._clip(x, self.xlims), self._clip(y, self.ylims)
+            x, y, z = x[sx], y[sy], z[sx,sy]
+
+            kx = self._stride(len(x), self.preview_grid)
+            ky = self._stride(len(y), self.preview_grid)
+            if k > 1:
+                kx = ky = int(np.ceil(np.sqrt(k)))
+
+            if kx > 1 or ky > 1:
+                x, y, z = self._decimate_grid(x, y, z, kx, ky)
+
+        if rasterize:
+            hx, hy = self._raster_pixel(x.min(), x.max(), y.min(), y.max(), dpi)
+            x, y, z = raster.resample(x, y, z,
+                                      (max(int(np.ceil((x.max() - x.min())/hx)), 1),
+                                       max(int(np.ceil((y.max() - y.min())/hy)), 1)))
+
+        x = self._scaled(0, x)
+        y = self._scaled(1, y)
+
         self._slurp3(x, y, z)
+        self._account('density', z.size)
 
         if isinstance(brange, list):
             brange = 'Range(%lf, %lf)' % tuple(brange)
@@ -327,15 +861,7 @@ class Plot(base.Base):
                 antialias=true)''' % (picture, brange))
 
         if bar:
-            self.palette = '''
-              initial = %(initial)s;
-              final = %(final)s;
-              palette(%(picture)s, "%(label)s", range, initial, final, pal, %(pen)s)
-              ''' % {'picture': picture,
-                     'initial': str(bar['initial']),
-                     'final':   str(bar['final']),
-                     'label': bar['label'],
-                     'pen': pen }
+            self._palette_bar(picture, bar, pen)
 
         self.x = x
         self.y = y
@@ -346,20 +872,182 @@ class Plot(base.Base):
 
     ##################################################################
 
+    @base.synchronized
+    @base.recorded
+    def tripcolor(self, points, triangles, values, pen=None,
+                  palette='Rainbow(512)', brange=None, bar=False,
+                  edges=None, rasterize=False, dpi=None, per=None, **kwargs):
+        """Colour filled plot of *values* on an unstructured
+           triangle mesh.
+
+           Each triangle is filled with the palette colour of its
+           value (computed by PyAsy), and the vertices, connectivity,
+           and colours are sent to Asymptote in one transfer and
+           filled in one loop.
+
+           **Arguments**
+
+           * *points*: Vertices of the mesh (a ``(n, 2)`` array).
+           * *triangles*: Triangles (a ``(m, 3)`` array of indices
+             into *points*).
+           * *values*: Values of the triangles (``m`` values), or of
+             the vertices (``n`` values, each triangle is then
+             coloured by the mean of its vertex values).  Triangles
+             with NaN (or masked) values are not drawn.
+           * *per*: ``'triangle'`` or ``'vertex'``: whether *values*
+             are given per triangle or per vertex.  By default this is
+             inferred from the number of values (and a ValueError is
+             raised if the mesh has as many vertices as triangles).
+           * *palette*: `Asymptote palette`_.
+           * *brange*: Range ``[min, max]`` of the values (defaults
+             to the range of the values).
+           * *bar*: Palette bar (see :func:`pyasy.plot.Plot.density`).
+           * *edges*: Pen of the triangle edges (by default, the
+             edges are not drawn).
+           * *rasterize*: If True, the mesh is drawn (by PyAsy) into
+             a raster image at *dpi* (defaults to
+             ``Plot.raster_dpi``), which is much faster for very
+             large meshes.  Pixels outside the mesh are white.
+
+           .. _`Asymptote palette`: http://asymptote.sourceforge.net/doc/palette.html
+
+           """
+
+        picture = self._picture(**kwargs)
+        pen = self._pen(pen, **kwargs)
+
+        points = np.asarray(points, dtype=float)
+        triangles = np.asarray(triangles, dtype=int).reshape(-1, 3)
+        values = np.ma.masked_invalid(1.0*np.ma.asarray(values)).ravel()
+
+        x = self._scaled(0, points[:,0])
+        y = self._scaled(1, points[:,1])
+
+        if per is None:
+            if len(points) == len(triangles):
+                raise ValueError('pyasy: tripcolor mesh has as many vertices as triangles, '
+                                 'set per to "triangle" or "vertex"')
+            per = 'triangle' if values.size == len(triangles) else 'vertex'
+
+        expected = { 'triangle': len(triangles), 'vertex': len(points) }
+        if per not in expected:
+            raise ValueError('pyasy: unknown tripcolor per %r' % (per,))
+        if values.size != expected[per]:
+            raise ValueError('pyasy: tripcolor expected %d values (one per %s), got %d'
+                             % (expected[per], per, values.size))
+
+        if per == 'triangle':
+            c = values
+        else:
+            c = np.ma.array(values.data[triangles].mean(axis=1),
+                            mask=np.ma.getmaskarray(values)[triangles].any(axis=1))
+
+        # drop triangles without a value (or outside the scales)
+        keep = ~np.ma.getmaskarray(c)
+        keep &= (np.isfinite(x) & np.isfinite(y))[triangles].all(axis=1)
+        triangles = triangles[keep]
+        c = c.data[keep]
+
+        if brange is None:
+            brange = [c.min(), c.max()] if c.size else [0.0, 1.0]
+        if brange[1] > brange[0]:
+            c = np.clip((c - brange[0])/float(brange[1] - brange[0]), 0.0, 1.0)
+        else:
+            c = 0.0*c
+
+        # a decimated mesh has holes: rasterize instead
+        k, rasterize = self._degrade('triangle', len(triangles), rasterize)
+        rasterize = rasterize or k > 1
+
+        self.asy.send('pen[] pal = %s' % palette)
+
+        if rasterize and triangles.size:
+            used = np.unique(triangles)
+            xmin, xmax = x[used].min(), x[used].max()
+            ymin, ymax = y[used].min(), y[used].max()
+            hx, hy = self._raster_pixel(xmin, xmax, ymin, ymax, dpi)
+
+            shape = (max(int(np.ceil((xmax - xmin)/hx)), 1),
+                     max(int(np.ceil((ymax - ymin)/hy)), 1))
+            initial = (xmin, ymin)
+            final = (xmin + shape[0]*hx, ymin + shape[1]*hy)
+
+            # palette indices (of a resampled palette), white outside
+            n = 256
+            f = raster.triangles(x, y, triangles, np.round(c*(n-1)),
+                                 initial, final, shape)
+            f[np.isnan(f)] = n
+
+            self._account('raster', f.size)
+
+            self.asy.slurp3(initial[0] + hx*(np.arange(shape[0]) + 0.5),
+                            initial[1] + hy*(np.arange(shape[1]) + 0.5), f)
+            self.asy.send('''pen[] palw = new pen[%(n)d+1];
+                             for (int k=0; k<%(n)d; ++k)
+                               palw[k] = pal[round(k/(%(n)d-1)*(pal.length-1))];
+                             palw[%(n)d] = white;
+                             image(%(picture)s, ZZ, Range(0, %(n)d), (%(initial)r, %(initial1)r),
+                                   (%(final)r, %(final1)r), palw)'''
+                          % { 'n': n, 'picture': picture,
+                              'initial': initial[0], 'initial1': initial[1],
+                              'final': final[0], 'final1': final[1] })
+        else:
+            self.asy.load([ ('X', x), ('Y', y),
+                            ('T', triangles.astype('int32').ravel()), ('C', c) ])
+            self.asy.send('filltriangles(%s, X, Y, T, C, pal%s)'
+                          % (picture, '' if edges is None else ', ' + self._pen(edges)))
+
+            self._account('triangle', len(triangles))
+
+        self.asy.send('bounds range = bounds(%r, %r)' % tuple(map(float, brange)))
+
+        if bar and triangles.size:
+            self.asy.send('pair initial = (%r, %r)' % (x.min(), y.min()))
+            self.asy.send('pair final = (%r, %r)' % (x.max(), y.max()))
+            self._palette_bar(picture, bar, pen)
+
+        used = np.unique(triangles)
+        self.x = x[used]
+        self.y = y[used]
+        self._bounds(self.x, self.y)
+
+
+    def _palette_bar(self, picture, bar, pen):
+
+        # drawn (by axis) from the current Asymptote range and pal
+        self.palette = '''
+          initial = %(initial)s;
+          final = %(final)s;
+          palette(%(picture)s, "%(label)s", range, initial, final, pal, %(pen)s)
+          ''' % {'picture': picture,
+                 'initial': str(bar['initial']),
+                 'final':   str(bar['final']),
+                 'label': self._label(bar['label']),
+                 'pen': pen }
+
+
+    ##################################################################
+
+    @base.synchronized
+    @base.recorded
     def horizontal_line(self, y=0.0, pen='plotpen+dotted', **kwargs):
         """Draw a horizontal line at *y* on the graph."""
 
         picture = self._picture(**kwargs)
         pen = self._pen(pen, **kwargs)
 
-        self.asy.send('real x1 = %lf' % self.xlims[0])
-        self.asy.send('real x2 = %lf' % self.xlims[1])
+        xlims = self._scaled(0, self.xlims)
+
+        self.asy.send('real x1 = %lf' % xlims[0])
+        self.asy.send('real x2 = %lf' % xlims[1])
         self.asy.send('xaxis(%s, YEquals(%lf, false), x1, x2, %s, above=true)'
-                      % (picture, y, pen))
+                      % (picture, self._scaled(1, y), pen))
 
 
     ##################################################################
 
+    @base.synchronized
+    @base.recorded
     def vertical_line(self, x=0.0, pen='plotpen+dotted', **kwargs):
         """Draw a vertical line at *x* on the graph."""
 
@@ -368,11 +1056,198 @@ class Plot(base.Base):
 
 
         self.asy.send('yaxis(%s, XEquals(%lf, false), %s, above=true)'
-                      % (picture, x, pen))
+                      % (picture, self._scaled(0, x), pen))
+
+
+    ##################################################################
+
+    @base.synchronized
+    @base.recorded
+    def hlines(self, y, xmin=None, xmax=None, pen='plotpen+dotted', **kwargs):
+        """Draw horizontal lines at *y* (an array) from *xmin* to
+           *xmax* (arrays or scalars, defaulting to the x limits of the
+           plot).
+
+           All of the lines are sent to Asymptote in one transfer and
+           drawn in one loop (unlike
+           :func:`pyasy.plot.Plot.horizontal_line`, which draws an
+           axis per line).
+
+           """
+
+        picture = self._picture(**kwargs)
+        pen = self._pen(pen, **kwargs)
+
+        xmin, xmax = self._extent(0, xmin, xmax)
+        n = self._slurp_pairs(xmin, y, xmax, y)
+        self.asy.send('drawpairs(%s, X, Y, %s)' % (picture, pen))
+
+        self._account('line', 2*n)
 
 
     ##################################################################
 
+    @base.synchronized
+    @base.recorded
+    def vlines(self, x, ymin=None, ymax=None, pen='plotpen+dotted', **kwargs):
+        """Draw vertical lines at *x* (an array) from *ymin* to *ymax*
+           (arrays or scalars, defaulting to the y limits of the
+           plot).  See :func:`pyasy.plot.Plot.hlines`."""
+
+        picture = self._picture(**kwargs)
+        pen = self._pen(pen, **kwargs)
+
+        ymin, ymax = self._extent(1, ymin, ymax)
+        n = self._slurp_pairs(x, ymin, x, ymax)
+        self.asy.send('drawpairs(%s, X, Y, %s)' % (picture, pen))
+
+        self._account('line', 2*n)
+
+
+    ##################################################################
+
+    @base.synchronized
+    @base.recorded
+    def xbands(self, x1, x2, ymin=None, ymax=None, pen='lightgray', **kwargs):
+        """Fill vertical bands from *x1* to *x2* (arrays), and from
+           *ymin* to *ymax* (arrays or scalars, defaulting to the y
+           limits of the plot).
+
+           Bands are filled in the order they are drawn, so they
+           should usually be drawn before the data (or with a
+           translucent pen, eg, ``'blue+opacity(0.2)'``).
+
+           """
+
+        picture = self._picture(**kwargs)
+        pen = self._pen(pen, **kwargs)
+
+        ymin, ymax = self._extent(1, ymin, ymax)
+        n = self._slurp_pairs(x1, ymin, x2, ymax)
+        self.asy.send('fillpairs(%s, X, Y, %s)' % (picture, pen))
+
+        self._account('line', 4*n)
+
+
+    ##################################################################
+
+    @base.synchronized
+    @base.recorded
+    def ybands(self, y1, y2, xmin=None, xmax=None, pen='lightgray', **kwargs):
+        """Fill horizontal bands from *y1* to *y2* (arrays), and from
+           *xmin* to *xmax* (arrays or scalars, defaulting to the x
+           limits of the plot).  See :func:`pyasy.plot.Plot.xbands`."""
+
+        picture = self._picture(**kwargs)
+        pen = self._pen(pen, **kwargs)
+
+        xmin, xmax = self._extent(0, xmin, xmax)
+        n = self._slurp_pairs(xmin, y1, xmax, y2)
+        self.asy.send('fillpairs(%s, X, Y, %s)' % (picture, pen))
+
+        self._account('line', 4*n)
+
+
+    ##################################################################
+
+    @base.synchronized
+    @base.recorded
+    def errorbars(self, x, y, yerr=None, xerr=None, pen=None, caps=True,
+                  **kwargs):
+        """Draw error bars at (*x*, *y*).
+
+           **Arguments**
+
+           * *yerr*: y errors: an array (or scalar) of symmetric
+             errors, or a tuple ``(lower, upper)`` of arrays.
+           * *xerr*: x errors (as above).
+           * *caps*: If True, the error bars are capped.
+
+           All of the error bars are sent to Asymptote in one
+           transfer and drawn in one loop.
+
+           """
+
+        picture = self._picture(**kwargs)
+        pen = self._pen(pen, **kwargs)
+
+        x = np.ravel(np.asarray(x, dtype=float))
+        y = np.ravel(np.asarray(y, dtype=float))
+
+        def errors(err):
+            if err is None:
+                return np.zeros(x.size), np.zeros(x.size)
+            if isinstance(err, tuple):
+                return err
+            return err, err
+
+        ylo, yhi = errors(yerr)
+        xlo, xhi = errors(xerr)
+
+        x0 = np.concatenate([ x, x - xlo ])
+        x1 = np.concatenate([ x, x + xhi ])
+        y0 = np.concatenate([ y - ylo, y ])
+        y1 = np.concatenate([ y + yhi, y ])
+
+        # drop missing and zero length bars
+        keep = np.isfinite(x0) & np.isfinite(x1) & np.isfinite(y0) & np.isfinite(y1)
+        keep &= (x0 != x1) | (y0 != y1)
+        if self.xlims is not None:
+            keep &= (x0 >= self.xlims[0]) & (x1 <= self.xlims[1])
+
+        # and bars outside the domain of the scales
+        sx = self._scaled(0, np.concatenate((x0, x1)))
+        sy = self._scaled(1, np.concatenate((y0, y1)))
+        keep &= (np.isfinite(sx) & np.isfinite(sy)).reshape(2, -1).all(axis=0)
+
+        x0, x1, y0, y1 = x0[keep], x1[keep], y0[keep], y1[keep]
+
+        n = self._slurp_pairs(x0, y0, x1, y1)
+        self.asy.send('drawpairs(%s, X, Y, %s, bar=%s)'
+                      % (picture, pen, 'Bars' if caps else 'None'))
+
+        self._account('line', 2*n)
+        self._bounds(sx[np.tile(keep, 2)], sy[np.tile(keep, 2)])
+
+
+    ##################################################################
+
+    @base.synchronized
+    @base.recorded
+    def texts(self, x, y, labels, pen=None, align='NoAlign', **kwargs):
+        """Draw the text *labels* (a list of strings) at (*x*, *y*).
+
+           All of the positions are sent to Asymptote in one transfer
+           (and the labels in one statement), and the labels are drawn
+           in one loop.
+
+           **Arguments**
+
+           * *align*: Alignment of the labels (an Asymptote pair, eg,
+             ``'N'`` or ``'NE'``).
+
+           """
+
+        picture = self._picture(**kwargs)
+        pen = self._pen(pen, **kwargs)
+
+        labels = [ self._label(str(l)) for l in labels ]
+
+        x = self._scaled(0, np.ravel(np.asarray(x, dtype=float)))
+        y = self._scaled(1, np.ravel(np.asarray(y, dtype=float)))
+        self.asy.slurp2(x, y)
+
+        self.asy.send('labelpoints(%s, new string[] {%s}, X, Y, %s, %s)'
+                      % (picture, ', '.join([ self._string(l) for l in labels ]),
+                         align, pen))
+
+        self._bounds(x, y)
+
+
+    ##################################################################
+
+    @base.synchronized
+    @base.recorded
     def caption(self, caption='', label='',
                 includegraphics_options='', **kwargs):
         """Set caption used for LaTeX export (see the
@@ -398,6 +1273,8 @@ class Plot(base.Base):
 
     ##################################################################
 
+    @base.synchronized
+    @base.recorded
     def legend(self, position=None, direction=None,
                perline=1, length='legendlinelength',
                legends=[],
@@ -453,6 +1330,8 @@ class Plot(base.Base):
 
     ##################################################################
 
+    @base.synchronized
+    @base.recorded
     def new_plot(self, size=None, shift=(0,0)):
         """Create a new subplot.
 
@@ -474,22 +1353,14 @@ class Plot(base.Base):
 
     ##################################################################
 
-    def shipout(self, basename='plot', format='pdf'):
-        """Shipout the current plot(s).
-
-           The current plot(s) is rendered and output to the file
-           *basename.format* (eg, ``plot.pdf``).
-
-           If a caption was set, the LaTeX commands for including and
-           annotating the plot (in a LaTeX *figure* environment) are
-           output to *basename*.tex (eg, ``plot.tex``).  See
-           :func:`pyasy.plot.Plot.caption`.
-
-           """
+    def _compose(self):
 
+        # lay out the plots in the current picture (plots that have
+        # already been laid out, by a previous shipout, are reused)
         asy = self.asy
 
-        for i, p in enumerate(self.plots):
+        for i in range(self.composed, len(self.plots)):
+            p = self.plots[i]
             picture = 'p%d' % (i+1)
             frame = 'f%d' % (i+1)
             shift = '(%lf*inch,%lf*inch)' % p['shift']
@@ -518,45 +1389,115 @@ class Plot(base.Base):
             self.asy.send('add(shift(%s)*%s)'
                           % (shift, frame))
 
-        self.asy.send('shipout("%s", "%s")' % (basename, format))
-        self.asy.close()
+        self.composed = len(self.plots)
 
-        if self.export_tex:
 
-            caption = self.caption
-            label   = self.label
-            options = self.includegraphics_options
+    ##################################################################
 
-            f = open('%s.tex' % (basename), 'w')
+    def tex_figure(self, basename='plot'):
+        """Return the LaTeX commands for including and annotating the
+           plot *basename* (in a LaTeX *figure* environment), or None
+           if no caption was set.  See
+           :func:`pyasy.plot.Plot.caption`.
 
-            if options:
-                f.write(textwrap.dedent(
-                    '''\
-                    \\begin{figure}
-                      \\centering
-                      \\includegraphics[%(options)s]{figures/%(basename)s}
-                      \\caption{%(caption)s}
-                      \\label{%(label)s}
-                    \\end{figure}
-                    ''' % { 'basename': basename,
-                            'options': options,
-                            'caption': caption,
-                            'label': label
-                            }  ))
-            else:
-                f.write(textwrap.dedent(
-                    '''\
-                    \\begin{figure}
-                      \\centering
-                      \\includegraphics{figures/%(basename)s}
-                      \\caption{%(caption)s}
-                      \\label{%(label)s}
-                    \\end{figure}
-                    ''' % { 'basename': basename,
-                            'caption': caption,
-                            'label': label
-                            }  ))
+           """
+
+        if not self.export_tex:
+            return None
+
+        if self.includegraphics_options:
+            graphics = '\\includegraphics[%s]' % self.includegraphics_options
+        else:
+            graphics = '\\includegraphics'
+
+        return textwrap.dedent(
+            '''\
+            \\begin{figure}
+              \\centering
+              %(graphics)s{figures/%(basename)s}
+              \\caption{%(caption)s}
+              \\label{%(label)s}
+            \\end{figure}
+            ''' % { 'basename': basename,
+                    'graphics': graphics,
+                    'caption': self.caption,
+                    'label': self.label
+                    }  )
+
+
+    @base.synchronized
+    def shipout(self, basename='plot', format='pdf', close=True,
+                memory=False, file=None):
+        """Shipout the current plot(s).
+
+           The current plot(s) is rendered and output to the file
+           *basename.format* (eg, ``plot.pdf``).  The *format* may
+           also be a list of formats (eg, ``['pdf', 'svg', 'png']``),
+           in which case the plot(s) is laid out once and output in
+           each format from the same Asymptote session.
+
+           If *memory* is True, nothing is written to the current
+           directory: the engine renders to a private directory, and
+           the output is returned as a string (or, if *format* is a
+           list, as a dictionary of strings keyed by format).  If a
+           *file* (a file-like object) is given, the output is written
+           to it instead (*format* must then be a single format)::
+
+           >>> pdf = plot.shipout(memory=True)
+           >>> plot.shipout(format='png', file=response)
+
+           If *close* is False, the Asymptote session is kept alive
+           after the plot(s) is output, so that :func:`shipout` can be
+           called again (eg, with another format) without rebuilding
+           the plot(s).  Call :func:`pyasy.plot.Plot.close` when you
+           are done.
+
+           In preview mode, the plot(s) is always output as a PNG
+           (output in memory is still keyed by the requested formats
+           if *format* is a list).
 
+           If a caption was set, the LaTeX commands for including and
+           annotating the plot (in a LaTeX *figure* environment) are
+           output to *basename*.tex (eg, ``plot.tex``), unless the
+           output is kept in memory (see
+           :func:`pyasy.plot.Plot.tex_figure`).  See
+           :func:`pyasy.plot.Plot.caption`.
+
+           If a render budget was set, a warning is issued if the plot
+           is predicted to exceed it (see :mod:`pyasy.cost`).
+
+           """
+
+        self._check_budget()
+
+        requested = format
+        if self.preview:
+            format = 'png' if isinstance(format, str) else [ 'png' for fmt in format ]
+
+        formats = [format] if isinstance(format, str) else format
+        formats = [ fmt for i, fmt in enumerate(formats) if fmt not in formats[:i] ]
+
+        self._compose()
+
+        def ship(name):
+            for fmt in formats:
+                self.asy.send('shipout("%s", format="%s")' % (name, fmt))
+
+        if memory or file is not None:
+            output = self._shipout_memory(ship, basename, format, close, file)
+            if self.preview and isinstance(output, dict):
+                output = dict([ (fmt, output['png']) for fmt in requested ])
+            return output
+
+        ship(basename)
+
+        if close:
+            self.asy.close()
+
+        if self.export_tex:
+
+            f = open('%s.tex' % (basename), 'w')
+            f.write(self.tex_figure(basename))
             f.close()
 
             self.export_tex = False
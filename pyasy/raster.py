@@ -0,0 +1,216 @@
+"""PyAsy rasterizer.
+
+   Dense lines and point clouds can be drawn into anti-aliased NumPy
+   rasters, which are then placed in the picture as images (see the
+   *rasterize* option of :func:`pyasy.plot.Plot.line`).  The rasters
+   are *coverage* arrays: each entry is the fraction (between 0 and 1)
+   of the pixel covered by the line or dots.  Rasters are indexed as
+   ``f[i,j]``, where *i* runs along x and *j* runs along y, like the
+   *z* array of :func:`pyasy.plot.Plot.density`.
+
+   Triangle meshes are rasterized into value arrays (see the
+   *rasterize* option of :func:`pyasy.plot.Plot.tripcolor`).
+
+   """
+
+import numpy as np
+
+
+######################################################################
+
+def _pixels(x, y, initial, final, shape):
+
+    # fractional pixel coordinates relative to pixel centres
+    u = (x - initial[0])/(final[0] - initial[0])*shape[0] - 0.5
+    v = (y - initial[1])/(final[1] - initial[1])*shape[1] - 0.5
+
+    return u, v
+
+
+def _splat(f, u, v, w):
+
+    # accumulate weights w at (u, v) with bilinear weights
+    nx, ny = f.shape
+
+    i = np.floor(u).astype(int)
+    j = np.floor(v).astype(int)
+    fu = u - i
+    fv = v - j
+
+    for di, dj, b in [ (0, 0, (1-fu)*(1-fv)), (1, 0, fu*(1-fv)),
+                       (0, 1, (1-fu)*fv),     (1, 1, fu*fv) ]:
+        ii = i + di
+        jj = j + dj
+        k = (ii >= 0) & (ii < nx) & (jj >= 0) & (jj < ny)
+        f += np.bincount(ii[k]*ny + jj[k], weights=(w*b)[k],
+                         minlength=nx*ny).reshape(nx, ny)
+
+
+def _box(f, k):
+
+    # k by k moving sum
+    if k <= 1:
+        return f
+
+    h = k // 2
+    f = np.pad(f, ((h, k-1-h), (h, k-1-h)), mode='constant')
+
+    c = np.cumsum(f, axis=0)
+    c = np.concatenate((np.zeros((1, c.shape[1])), c), axis=0)
+    f = c[k:,:] - c[:-k,:]
+
+    c = np.cumsum(f, axis=1)
+    c = np.concatenate((np.zeros((c.shape[0], 1)), c), axis=1)
+    f = c[:,k:] - c[:,:-k]
+
+    return f
+
+
+def lines(x, y, initial, final, shape, width=1.0, offsets=None,
+          chunk=1<<20):
+    """Rasterize the polyline through (*x*, *y*) into a coverage
+       array of the given *shape* spanning *initial* to *final*.
+
+       **Arguments**
+
+       * *width*: Line width in pixels.
+       * *offsets*: Segment offsets (see
+         :func:`pyasy.asymptote.Asymptote.slurp2`); the line is not
+         drawn across gaps.
+       * *chunk*: Number of samples rasterized at once (bounds the
+         memory used).
+
+       """
+
+    f = np.zeros(shape)
+    u, v = _pixels(x, y, initial, final, shape)
+
+    du = np.diff(u)
+    dv = np.diff(v)
+    length = np.hypot(du, dv)
+
+    # sample each segment every pixel (or so)
+    n = np.ceil(length).astype(int) + 1
+    if offsets is not None:
+        n[offsets[1:-1]-1] = 0          # don't connect across gaps
+
+    c = np.cumsum(n)
+    if c.size == 0:
+        return f
+
+    splits = list(np.searchsorted(c, np.arange(chunk, c[-1], chunk)))
+
+    for start, end in zip([0] + splits, splits + [n.size]):
+        if end <= start:
+            continue
+
+        m = n[start:end]
+        s = np.repeat(np.arange(start, end), m)
+        t = np.arange(m.sum()) - np.repeat(np.cumsum(m)-m, m)
+        t = t/np.maximum(np.repeat(m-1, m), 1).astype(float)
+
+        _splat(f, u[s] + t*du[s], v[s] + t*dv[s],
+               (length[start:end]/np.maximum(m, 1))[s - start])
+
+    # f is now the length of line (in pixels) through each pixel
+    k = max(int(round(width)), 1)
+    return np.clip(_box(f, k)*width/k**2, 0.0, 1.0)
+
+
+def points(x, y, initial, final, shape, radius=1.0):
+    """Rasterize dots of the given *radius* (in pixels) centred at
+       (*x*, *y*) into a coverage array of the given *shape* spanning
+       *initial* to *final*."""
+
+    f = np.zeros(shape)
+    u, v = _pixels(x, y, initial, final, shape)
+
+    _splat(f, u, v, np.pi*radius**2*np.ones(len(u)))
+
+    k = max(int(round(2*radius)), 1)
+    return np.clip(_box(f, k)/k**2, 0.0, 1.0)
+
+
+def resample(x, y, z, shape):
+    """Block average the grid *z* (indexed as ``z[i,j]`` at
+       ``(x[i], y[j])``) down to (at most) *shape*.  Return the
+       resampled ``(x, y, z)``."""
+
+    kx = max(int(np.ceil(float(len(x))/shape[0])), 1)
+    ky = max(int(np.ceil(float(len(y))/shape[1])), 1)
+
+    if kx == 1 and ky == 1:
+        return x, y, z
+
+    ix = np.arange(0, len(x), kx)
+    iy = np.arange(0, len(y), ky)
+    cx = np.diff(np.append(ix, len(x))).astype(float)
+    cy = np.diff(np.append(iy, len(y))).astype(float)
+
+    x = np.add.reduceat(x, ix)/cx
+    y = np.add.reduceat(y, iy)/cy
+    z = np.add.reduceat(np.add.reduceat(z, ix, axis=0), iy, axis=1)
+    z = z/np.outer(cx, cy)
+
+    return x, y, z
+
+
+def triangles(x, y, triangles, c, initial, final, shape, chunk=1<<20):
+    """Rasterize the triangles (a ``(m, 3)`` array of indices into
+       *x* and *y*) with values *c* (one per triangle) into an array
+       of the given *shape* spanning *initial* to *final*.  Each pixel
+       takes the value of the triangle containing its centre, or NaN
+       if there is none.
+
+       **Arguments**
+
+       * *chunk*: Number of (triangle, pixel) pairs tested at once
+         (bounds the memory used).
+
+       """
+
+    f = np.nan*np.ones(shape)
+    u, v = _pixels(x, y, initial, final, shape)
+
+    tu = u[triangles]
+    tv = v[triangles]
+
+    # pixel bounding box of each triangle
+    i0 = np.clip(np.ceil(tu.min(axis=1)).astype(int), 0, shape[0])
+    i1 = np.clip(np.floor(tu.max(axis=1)).astype(int) + 1, 0, shape[0])
+    j0 = np.clip(np.ceil(tv.min(axis=1)).astype(int), 0, shape[1])
+    j1 = np.clip(np.floor(tv.max(axis=1)).astype(int) + 1, 0, shape[1])
+
+    nw = np.maximum(i1 - i0, 0)
+    nh = np.maximum(j1 - j0, 0)
+    n = nw*nh
+
+    c = np.asarray(c, dtype=float)
+    cn = np.cumsum(n)
+    if cn.size == 0 or cn[-1] == 0:
+        return f
+
+    splits = list(np.searchsorted(cn, np.arange(chunk, cn[-1], chunk)))
+
+    for start, end in zip([0] + splits, splits + [n.size]):
+        if end <= start:
+            continue
+
+        m = n[start:end]
+        s = np.repeat(np.arange(start, end), m)
+        k = np.arange(m.sum()) - np.repeat(np.cumsum(m)-m, m)
+        i = i0[s] + k // np.maximum(nh[s], 1)
+        j = j0[s] + k % np.maximum(nh[s], 1)
+
+        # barycentric coordinates of the pixel centres
+        (ax, bx, cx), (ay, by, cy) = tu[s].T, tv[s].T
+        d = (by - cy)*(ax - cx) + (cx - bx)*(ay - cy)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            l1 = ((by - cy)*(i - cx) + (cx - bx)*(j - cy))/d
+            l2 = ((cy - ay)*(i - cx) + (ax - cx)*(j - cy))/d
+        eps = -1e-9
+        inside = (l1 >= eps) & (l2 >= eps) & (1.0 - l1 - l2 >= eps)
+
+        f[i[inside], j[inside]] = c[s[inside]]
+
+    return f
@@ -0,0 +1,228 @@
+"""PyAsy engine resource accounting.
+
+   The memory (resident set size) and CPU time (user and system) of
+   each Asymptote engine, including the processes it runs (eg, LaTeX
+   and Ghostscript), are sampled from ``/proc`` while the engine runs,
+   and the peaks are recorded (see
+   :func:`pyasy.asymptote.Asymptote.usage`).
+
+   Memory and CPU limits can be set for each engine (see the
+   *memory_limit* and *cpu_limit* arguments of
+   :class:`pyasy.asymptote.Asymptote`), or for all engines with the
+   ``PYASY_MEMORY_LIMIT`` (megabytes) and ``PYASY_CPU_LIMIT``
+   (seconds) environment variables.  An engine that exceeds its limits
+   is killed, and the plot raises a :class:`ResourceError`.
+
+   """
+
+import os
+import signal
+import threading
+
+
+######################################################################
+
+class ResourceError(RuntimeError):
+    """Raised when an Asymptote engine exceeds its resource limits."""
+    pass
+
+
+if hasattr(os, 'sysconf'):
+    _ticks = os.sysconf('SC_CLK_TCK')
+    _page = os.sysconf('SC_PAGE_SIZE')
+else:
+    _ticks = 100
+    _page = 4096
+
+
+def _children(pid):
+
+    try:
+        f = open('/proc/%d/task/%d/children' % (pid, pid))
+        children = [ int(c) for c in f.read().split() ]
+        f.close()
+    except IOError:
+        children = []
+
+    return children
+
+
+def tree(pid):
+    """Return the process *pid* and its descendants (a list of
+       pids)."""
+
+    pids = []
+    todo = [ pid ]
+    while todo:
+        p = todo.pop()
+        pids.append(p)
+        todo.extend(_children(p))
+
+    return pids
+
+
+def alive(pid):
+    """Return True if the process *pid* is running.  Unlike
+       ``Popen.poll``, this doesn't reap the process if it has exited
+       (so that its parent can still get its resource usage)."""
+
+    try:
+        stat = open('/proc/%d/stat' % pid).read()
+    except IOError:
+        if os.path.isdir('/proc'):
+            return False
+        try:
+            os.kill(pid, 0)
+        except OSError:
+            return False
+        return True
+
+    return stat[stat.rindex(')')+2] != 'Z'
+
+
+def kill(pid):
+    """Kill the process *pid* and its descendants."""
+
+    # the whole tree is listed before anything is killed (the
+    # descendants are reparented once their parent is killed), and
+    # the descendants are killed before their parents
+    for p in reversed(tree(pid)):
+        try:
+            os.kill(p, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+def sample(pid):
+    """Return the memory (bytes) and CPU time (seconds) used by the
+       process *pid* and its descendants, or None if the process is
+       gone (or ``/proc`` isn't available)."""
+
+    rss = 0
+    cpu = 0.0
+    found = False
+
+    pids = [ pid ]
+    while pids:
+        p = pids.pop()
+        try:
+            stat = open('/proc/%d/stat' % p).read()
+            statm = open('/proc/%d/statm' % p).read()
+        except IOError:
+            continue
+
+        # fields after the command name: utime, stime, cutime, and
+        # cstime are fields 14 to 17 of /proc/pid/stat
+        fields = stat[stat.rindex(')')+2:].split()
+        cpu = cpu + sum([ int(f) for f in fields[11:15] ])/float(_ticks)
+        rss = rss + int(statm.split()[1])*_page
+        found = True
+
+        pids.extend(_children(p))
+
+    if not found:
+        return None
+
+    return rss, cpu
+
+
+def limits(memory_limit=None, cpu_limit=None):
+    """Return the memory limit (bytes) and CPU limit (seconds) given
+       *memory_limit* (megabytes) and *cpu_limit* (seconds), which
+       default to the ``PYASY_MEMORY_LIMIT`` and ``PYASY_CPU_LIMIT``
+       environment variables."""
+
+    if memory_limit is None and os.environ.get('PYASY_MEMORY_LIMIT'):
+        memory_limit = float(os.environ['PYASY_MEMORY_LIMIT'])
+    if cpu_limit is None and os.environ.get('PYASY_CPU_LIMIT'):
+        cpu_limit = float(os.environ['PYASY_CPU_LIMIT'])
+
+    if memory_limit is not None:
+        memory_limit = memory_limit*1024*1024
+
+    return memory_limit, cpu_limit
+
+
+class Monitor(threading.Thread):
+    """Resource monitor of an Asymptote engine *process* (a
+       ``subprocess.Popen`` instance).
+
+       The process is sampled every *interval* seconds until it
+       exits (it isn't reaped by the monitor), or until :func:`stop`
+       is called.  If it exceeds *memory_limit* (bytes) or
+       *cpu_limit* (seconds), *kill* is called and *error* is set.
+
+       """
+
+    def __init__(self, process, interval=0.25, memory_limit=None,
+                 cpu_limit=None, kill=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+        self.process = process
+        self.interval = interval
+        self.memory_limit = memory_limit
+        self.cpu_limit = cpu_limit
+        self.kill = kill or process.kill
+
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.rss = 0
+        self.cpu = 0.0
+        self.peak_rss = 0
+        self.samples = 0
+        self.error = None
+
+
+    def update(self, rss, cpu):
+        """Record a sample (and check the limits)."""
+
+        with self.lock:
+            self.rss = rss
+            self.cpu = max(self.cpu, cpu)
+            self.peak_rss = max(self.peak_rss, rss)
+            self.samples = self.samples + 1
+
+            if self.error is not None:
+                return
+
+            if self.memory_limit is not None and rss > self.memory_limit:
+                self.error = ('pyasy: Asymptote engine exceeded its memory limit '
+                              '(%d MB > %d MB)' % (rss/2**20, self.memory_limit/2**20))
+            elif self.cpu_limit is not None and cpu > self.cpu_limit:
+                self.error = ('pyasy: Asymptote engine exceeded its CPU limit '
+                              '(%.1fs > %.1fs)' % (cpu, self.cpu_limit))
+            else:
+                return
+
+        self.kill()
+
+
+    def run(self):
+
+        pid = self.process.pid
+        while not self.stopped.is_set() and alive(pid):
+            s = sample(pid)
+            if s is not None:
+                self.update(*s)
+            if self.error is not None:
+                return
+            self.stopped.wait(self.interval)
+
+
+    def stop(self):
+        """Stop sampling (and wait for the monitor to finish)."""
+
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+
+
+    def usage(self):
+        """Return a dictionary with the current (*rss*) and peak
+           (*peak_rss*) memory (bytes), the CPU time (*cpu*, seconds),
+           and the number of *samples*."""
+
+        with self.lock:
+            return { 'rss': self.rss, 'peak_rss': self.peak_rss,
+                     'cpu': self.cpu, 'samples': self.samples }
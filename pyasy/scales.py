@@ -0,0 +1,182 @@
+"""PyAsy axis scales.
+
+   The axes of a plot are linear by default.  Other scales are set
+   with the *xscale* and *yscale* arguments of
+   :class:`pyasy.plot.Plot`::
+
+   >>> plot = pyasy.plot.Plot(xscale='log', yscale='symlog')
+   >>> plot = pyasy.plot.Plot(yscale=pyasy.scales.SymLog(linthresh=0.01))
+   >>> plot = pyasy.plot.Plot(xscale=(np.sqrt, np.square))
+
+   The data is transformed by PyAsy (with NumPy, once) before it is
+   sent to Asymptote, which draws it (and works out the bounds of the
+   plot) as if the axes were linear.  The ticks are placed, and
+   labelled, in data space by the scale.
+
+   Values outside the domain of a scale (eg, non-positive values on a
+   log axis) are treated as gaps.
+
+   """
+
+import numpy as np
+
+
+######################################################################
+
+def _nice(lo, hi, n=5):
+    """Return about *n* evenly spaced round numbers in [*lo*, *hi*]."""
+
+    if not hi > lo:
+        return np.array([ lo ])
+
+    step = (hi - lo)/float(n)
+    magnitude = 10.0**np.floor(np.log10(step))
+    for m in (1.0, 2.0, 5.0, 10.0):
+        if m*magnitude >= step:
+            break
+    step = m*magnitude
+
+    ticks = step*np.arange(np.ceil(lo/step - 1e-9), np.floor(hi/step + 1e-9) + 1)
+    ticks[np.abs(ticks) < 1e-12*step] = 0.0
+
+    return ticks
+
+
+def _number(v):
+    return '$%g$' % v
+
+
+def _power(sign, k):
+    return '$%s10^{%d}$' % ('-' if sign < 0 else '', k)
+
+
+class Scale(object):
+    """Axis scale given by the (vectorized, monotonic) functions
+       *forward* (from data to axis coordinates) and *inverse*.
+
+       Ticks are placed at round numbers in data space.
+
+       """
+
+    linear = False
+
+    def __init__(self, forward, inverse):
+        self._forward = forward
+        self._inverse = inverse
+
+    def forward(self, a):
+        return self._forward(a)
+
+    def inverse(self, a):
+        return self._inverse(a)
+
+    def ticks(self, lo, hi):
+        """Return the major ticks, their labels, and the minor ticks
+           (in axis coordinates) between *lo* and *hi* (in axis
+           coordinates), or None for Asymptote's ticks."""
+
+        values = _nice(*sorted(self.inverse(np.array([ lo, hi ]))))
+        return self.forward(values), [ _number(v) for v in values ], np.array([])
+
+
+class Linear(Scale):
+    """Linear axis scale (the default)."""
+
+    linear = True
+
+    def __init__(self):
+        pass
+
+    def forward(self, a):
+        return a
+
+    def inverse(self, a):
+        return a
+
+    def ticks(self, lo, hi):
+        return None
+
+
+class Log(Scale):
+    """Logarithmic axis scale (major ticks at the powers of 10)."""
+
+    def __init__(self):
+        pass
+
+    def forward(self, a):
+        a = np.ma.masked_less_equal(a, 0.0) if np.ma.isMA(a) else np.where(a > 0, a, np.nan)
+        return np.log10(a)
+
+    def inverse(self, a):
+        return 10.0**a
+
+    def ticks(self, lo, hi):
+
+        decades = np.arange(np.floor(lo), np.ceil(hi) + 1)
+        minor = np.log10(np.arange(2, 10))[None,:] + decades[:,None]
+        minor = minor.ravel()
+        minor = minor[(minor >= lo) & (minor <= hi)]
+
+        major = decades[(decades >= lo - 1e-9) & (decades <= hi + 1e-9)]
+        if major.size >= 2:
+            return major, [ _power(1, k) for k in major ], minor
+
+        # less than a decade: round numbers
+        values = _nice(10.0**lo, 10.0**hi)
+        values = values[values > 0]
+        return np.log10(values), [ _number(v) for v in values ], np.array([])
+
+
+class SymLog(Scale):
+    """Symmetric logarithmic axis scale: ``sign(a)*log10(1 +
+       |a|/linthresh)``, which is linear near zero (for ``|a|`` less
+       than about *linthresh*), and logarithmic further out (for
+       both positive and negative values)."""
+
+    def __init__(self, linthresh=1.0):
+        self.linthresh = float(linthresh)
+
+    def forward(self, a):
+        return np.sign(a)*np.log10(1.0 + np.abs(a)/self.linthresh)
+
+    def inverse(self, a):
+        return np.sign(a)*self.linthresh*(10.0**np.abs(a) - 1.0)
+
+    def ticks(self, lo, hi):
+
+        a, b = self.inverse(np.array([ lo, hi ]))
+        top = max(abs(a), abs(b), self.linthresh)
+
+        powers = np.arange(np.ceil(np.log10(self.linthresh)), np.floor(np.log10(top)) + 1)
+        values = np.concatenate((-10.0**powers[::-1], [ 0.0 ], 10.0**powers))
+        labels = ([ _power(-1, k) for k in powers[::-1] ] + [ '$0$' ] +
+                  [ _power(1, k) for k in powers ])
+
+        keep = (values >= a) & (values <= b)
+        labels = [ l for l, k in zip(labels, keep) if k ]
+
+        minor = (np.arange(2, 10)[None,:]*10.0**powers[:,None]).ravel()
+        minor = np.concatenate((-minor, minor))
+        minor = minor[(minor >= a) & (minor <= b)]
+
+        return self.forward(values[keep]), labels, self.forward(minor)
+
+
+scales = { 'linear': Linear, 'log': Log, 'symlog': SymLog }
+
+
+def scale(s):
+    """Return the scale *s*: a :class:`Scale` instance, the name of a
+       scale (``'linear'``, ``'log'``, or ``'symlog'``), or a
+       ``(forward, inverse)`` tuple of functions."""
+
+    if s is None:
+        return Linear()
+    if isinstance(s, Scale):
+        return s
+    if isinstance(s, tuple):
+        return Scale(*s)
+    if s in scales:
+        return scales[s]()
+
+    raise ValueError('pyasy: unknown axis scale %r' % (s,))
@@ -0,0 +1,357 @@
+"""PyAsy session recording and replay.
+
+   A plot can record its session (the plot method calls, their
+   arguments, and the exact data slurped by each call) to an archive
+   directory::
+
+   >>> plot = pyasy.plot.Plot(record='figure.session')
+   >>> plot.line(x, expensive(x), legend='data')
+   >>> plot.axis(xlabel='$x$')
+   >>> plot.shipout('figure')
+
+   The archive can then be re-rendered, with style overrides, without
+   re-running the script that produced the data::
+
+   >>> pyasy.session.replay('figure.session', 'figure',
+   ...                      overrides={'line': {'pen': 'red+dashed'},
+   ...                                 'axis': {'xlabel': '$t$'}})
+
+   Overrides are keyed by method name (applied to every call of that
+   method) or by call number (the position of the call in the
+   session).  Calls whose data isn't affected by the overrides reuse
+   the slurp files in the archive: the Asymptote engine reads them
+   directly, so the data isn't written again.
+
+   **Archive layout**
+
+   * ``session.json`` - The class and constructor arguments of the
+     plot, and a list of calls (method name, arguments, and the names
+     of the array and slurp files of each call).
+   * ``callN-argK.npy`` - Array arguments of call *N*.
+   * ``callN-slurpK.dat`` - Slurp files of call *N*.
+
+   """
+
+import json
+import numbers
+import os
+import shutil
+import warnings
+
+import numpy as np
+
+import cost
+import labels
+import scales
+
+
+# arguments that only change the style of the plot (as opposed to the
+# data sent to Asymptote); any other argument is assumed to change the
+# data
+style_arguments = set([ 'pen', 'pens', 'legend', 'legends', 'marker',
+                        'title', 'xlabel', 'ylabel', 'tlabel',
+                        'xticks', 'yticks', 'bar', 'edges', 'align',
+                        'caption', 'label', 'includegraphics_options',
+                        'position', 'direction', 'perline', 'length',
+                        'frame', 'defaultpen', 'plotpen', 'markers',
+                        'echo', 'label_cache' ])
+
+
+######################################################################
+
+def _jsonable(value):
+
+    if isinstance(value, (str, unicode, bool, type(None))):
+        return True
+    if isinstance(value, numbers.Number):
+        return True
+    if isinstance(value, (list, tuple)):
+        return all([ _jsonable(v) for v in value ])
+    if isinstance(value, dict):
+        return all([ isinstance(k, (str, unicode)) and _jsonable(value[k])
+                     for k in value ])
+    return False
+
+
+def _plain(value):
+
+    # numpy scalars (eg, from x.min()) to python numbers
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [ _plain(v) for v in value ]
+    if isinstance(value, dict):
+        return dict([ (k, _plain(value[k])) for k in value ])
+    return value
+
+
+def _tuples(value):
+
+    # JSON has no tuples (eg, for the shift of new_plot)
+    if isinstance(value, list):
+        return tuple([ _tuples(v) for v in value ])
+    if isinstance(value, dict):
+        return dict([ (str(k), _tuples(value[k])) for k in value ])
+    if isinstance(value, unicode):
+        return str(value)
+    return value
+
+
+def _load(directory, names, value):
+
+    # arrays (or lists of arrays) saved by Recorder._save
+    if names is None:
+        return value
+    if isinstance(names, (str, unicode)):
+        return np.load(os.path.join(directory, names), mmap_mode='r')
+    return tuple([ _load(directory, n, v) for n, v in zip(names, value) ])
+
+
+def _names(names):
+
+    # the file names in the (possibly nested) names of Recorder._save
+    if names is None:
+        return []
+    if isinstance(names, (str, unicode)):
+        return [ names ]
+    return sum([ _names(n) for n in names ], [])
+
+
+def _encode(key, value):
+
+    # constructor arguments that are objects: the named axis scales,
+    # the label cache (by directory), and the render budget (and its
+    # cost model)
+    if key in ('xscale', 'yscale') and isinstance(value, scales.Scale):
+        for name in scales.scales:
+            if type(value) is scales.scales[name]:
+                return dict(vars(value), scale=name)
+    if key == 'label_cache' and isinstance(value, labels.LabelCache):
+        return value.directory
+    if key == 'budget' and isinstance(value, cost.Budget):
+        budget = dict(vars(value))
+        if value.model is not None:
+            budget['model'] = { 'time': value.model.time, 'size': value.model.size }
+        return budget
+    return value
+
+
+def _decode(key, value):
+
+    # the inverse of _encode
+    if key in ('xscale', 'yscale') and isinstance(value, dict):
+        value = dict(value)
+        return scales.scales[value.pop('scale')](**value)
+    if key == 'budget' and isinstance(value, dict):
+        value = dict(value)
+        if value['model'] is not None:
+            value['model'] = cost.CostModel(**value['model'])
+        return cost.Budget(**value)
+    return value
+
+
+def _data(kwargs):
+    return not style_arguments.issuperset(kwargs)
+
+
+class Recorder(object):
+    """PyAsy session recorder (see the module documentation).
+
+       Usually the recorder is created by the PyAsy Plot class (see
+       the *record* argument).  A ValueError is raised if a
+       constructor argument (in *kwargs*) can't be recorded (eg, an
+       axis scale given by functions).
+
+       """
+
+    def __init__(self, directory, cls, kwargs):
+        self.directory = directory
+        self.depth = 0
+        self.call = None
+
+        init = {}
+        for key in kwargs:
+            value = _plain(_encode(key, kwargs[key]))
+            if not _jsonable(value):
+                raise ValueError('pyasy: can not record argument %s=%r'
+                                 % (key, kwargs[key]))
+            init[key] = value
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.session = { 'version': 1,
+                         'class': cls,
+                         'init': init,
+                         'calls': [] }
+        self.save()
+
+
+    def begin(self, method, args, kwargs):
+        """Begin recording a call of *method*.  Nested calls (eg,
+           :func:`pyasy.plot.Plot.new_plot` called by another method)
+           aren't recorded.  A call with an argument that can't be
+           recorded is made, but not recorded (with a warning)."""
+
+        self.depth = self.depth + 1
+        if self.depth > 1:
+            return
+
+        n = len(self.session['calls'])
+        call = { 'method': method, 'args': [], 'kwargs': {},
+                 'arrays': {}, 'slurps': [] }
+
+        try:
+            for key, value in enumerate(args):
+                call['args'].append(self._argument(n, str(key), value, call))
+            for key in kwargs:
+                call['kwargs'][key] = self._argument(n, key, kwargs[key], call)
+        except ValueError, e:
+            warnings.warn('%s: call %s not recorded' % (e, method))
+            for name in _names(call['arrays'].values()):
+                os.remove(os.path.join(self.directory, name))
+            return
+
+        self.session['calls'].append(call)
+        self.call = call
+
+
+    def _save(self, n, key, value):
+        """Save the arrays in *value* (an array, or a list or tuple,
+           possibly nested).  Return their file names (a name, or a
+           list of names and Nones), and *value* with the arrays
+           replaced by None."""
+
+        if isinstance(value, np.ndarray):
+            name = 'call%d-arg%s.npy' % (n, key)
+            if isinstance(value, np.ma.MaskedArray):
+                value = np.ma.filled(value.astype(float), np.nan)
+            np.save(os.path.join(self.directory, name), value)
+            return name, None
+
+        if isinstance(value, (list, tuple)):
+            saved = [ self._save(n, '%s-%d' % (key, i), v) for i, v in enumerate(value) ]
+            if [ name for name, v in saved if name is not None ]:
+                return [ name for name, v in saved ], [ v for name, v in saved ]
+
+        return None, value
+
+
+    def _argument(self, n, key, value, call):
+
+        names, value = self._save(n, key, value)
+        if names is not None:
+            call['arrays'][key] = names
+
+        value = _plain(value)
+        if not _jsonable(value):
+            raise ValueError('pyasy: can not record argument %s=%r' % (key, value))
+
+        return value
+
+
+    def slurp(self, filename):
+        """Add the slurp file *filename* to the current call."""
+
+        if self.call is None:
+            return
+
+        n = len(self.session['calls']) - 1
+        name = 'call%d-slurp%d.dat' % (n, len(self.call['slurps']))
+        path = os.path.join(self.directory, name)
+
+        try:
+            os.link(filename, path)
+        except (OSError, AttributeError):
+            shutil.copyfile(filename, path)
+
+        self.call['slurps'].append(name)
+
+
+    def end(self):
+        """End recording the current call."""
+
+        self.depth = self.depth - 1
+        if self.depth == 0:
+            self.call = None
+            self.save()
+
+
+    def save(self):
+        """Write ``session.json``."""
+
+        f = open(os.path.join(self.directory, 'session.json'), 'w')
+        json.dump(self.session, f, indent=1)
+        f.close()
+
+
+######################################################################
+
+def load(directory):
+    """Return the session (a dictionary) recorded in *directory*."""
+
+    f = open(os.path.join(directory, 'session.json'))
+    session = json.load(f)
+    f.close()
+
+    return session
+
+
+def replay(directory, basename, format='pdf', overrides=None, **kwargs):
+    """Re-render the session recorded in *directory* to
+       *basename.format*.
+
+       **Arguments**
+
+       * *overrides*: Dictionary of method arguments to override,
+         keyed by method name or call number.
+       * Any other keyword arguments override the constructor
+         arguments of the plot.
+
+       Return the (shipped out) plot.
+
+       """
+
+    import animation
+    import plot
+
+    session = load(directory)
+    overrides = overrides or {}
+
+    cls = { 'Plot': plot.Plot, 'Animation': animation.Animation }[session['class']]
+
+    init = _tuples(session['init'])
+    init = dict([ (k, _decode(k, init[k])) for k in init ])
+    init.update(kwargs)
+    reuse = not _data(kwargs)
+
+    p = cls(**init)
+
+    for n, call in enumerate(session['calls']):
+        args = list(_tuples(call['args']))
+        kw = _tuples(call['kwargs'])
+
+        for key, names in call['arrays'].items():
+            if key.isdigit():
+                args[int(key)] = _load(directory, names, args[int(key)])
+            else:
+                kw[str(key)] = _load(directory, names, kw.get(str(key)))
+
+        override = {}
+        override.update(overrides.get(call['method'], {}))
+        override.update(overrides.get(n, {}))
+        kw.update(override)
+
+        if reuse and not _data(override):
+            p.asy.replay([ os.path.join(os.path.abspath(directory), s)
+                           for s in call['slurps'] ])
+
+        getattr(p, call['method'])(*args, **kw)
+        p.asy.replay([])
+
+    if session['class'] == 'Animation':
+        p.shipout(basename)
+    else:
+        p.shipout(basename, format)
+
+    return p
@@ -0,0 +1,171 @@
+"""PyAsy shared arrays.
+
+   Shared arrays are NumPy arrays stored in a memory mapped file that
+   is laid out exactly like an Asymptote slurp file (see
+   :class:`pyasy.asymptote.Asymptote`).  This has two benefits:
+
+   * Shared arrays are pickled by reference (ie, only the file name
+     and shapes are pickled), so handing them to worker processes
+     (eg, through :mod:`multiprocessing`) doesn't copy the data.
+
+   * When shared arrays are slurped (eg, by
+     :func:`pyasy.plot.Plot.density`) the Asymptote engine reads
+     the file directly, so the data isn't written again.
+
+   The file is created in ``/dev/shm`` (if available) and is removed
+   when the producer calls :func:`SharedArrays.unlink` (or leaves the
+   ``with`` block).  For example::
+
+   >>> import pyasy.shared
+   >>> with pyasy.shared.slurp3(2000, 1000) as data:
+   ...     data.x[:] = numpy.linspace(0.0, 1.0, 2000)
+   ...     data.y[:] = numpy.linspace(0.0, 1.0, 1000)
+   ...     data.z[:] = ...
+   ...     pool.map(make_figure, [ data ])
+
+   where, in the worker process::
+
+   >>> def make_figure(data):
+   ...     plot = pyasy.plot.Plot()
+   ...     plot.density(data.x, data.y, data.z)
+   ...     ...
+
+   """
+
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+
+######################################################################
+
+def _directory():
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+class SharedArrays(object):
+    """Shared arrays (of type ``float64``) in a memory mapped file.
+
+       **Arguments**
+
+       * *header* - List of integers written (as native ``int``) at
+         the start of the file (eg, the array sizes for the Asymptote
+         slurp readers).
+
+       * *shapes* - List of array shapes.  The arrays follow the
+         header, in order, in the file.
+
+       * *filename* - Existing file to map (used when unpickling).
+         If None, a new file is created.
+
+       The arrays are available as a list (*arrays*) or, for
+       convenience, as *x*, *y*, and *z*.
+
+       **Methods**
+
+       """
+
+    def __init__(self, header, shapes, filename=None):
+        self.header = list(header)
+        self.shapes = [ tuple(s) for s in shapes ]
+
+        head = struct.pack('i'*len(self.header), *self.header)
+
+        if filename is None:
+            size = len(head) + sum([ 8*int(np.prod(s)) for s in self.shapes ])
+            fd, filename = tempfile.mkstemp(prefix='pyasy-', suffix='.dat',
+                                            dir=_directory())
+            os.ftruncate(fd, size)
+            os.write(fd, head)
+            os.close(fd)
+            self.owner = True
+        else:
+            self.owner = False
+
+        self.filename = filename
+        self.arrays = []
+
+        offset = len(head)
+        for s in self.shapes:
+            self.arrays.append(np.memmap(filename, dtype=np.float64, mode='r+',
+                                         offset=offset, shape=s))
+            offset = offset + 8*int(np.prod(s))
+
+
+    def __reduce__(self):
+        return (SharedArrays, (self.header, self.shapes, self.filename))
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.unlink()
+
+
+    x = property(lambda self: self.arrays[0])
+    y = property(lambda self: self.arrays[1])
+    z = property(lambda self: self.arrays[2])
+
+
+    def unlink(self):
+        """Remove the file (if this instance created it).  Processes
+           that have the file mapped can still use the arrays."""
+
+        if self.owner and os.path.exists(self.filename):
+            os.remove(self.filename)
+
+
+def slurp2(n):
+    """Return shared arrays *x* and *y* of size *n* (see
+       :func:`pyasy.asymptote.Asymptote.slurp2`)."""
+    return SharedArrays([n], [(n,), (n,)])
+
+
+def slurp3(nx, ny):
+    """Return shared arrays *x*, *y*, and *z* of shapes ``(nx,)``,
+       ``(ny,)``, and ``(nx, ny)`` (see
+       :func:`pyasy.asymptote.Asymptote.slurp3`)."""
+    return SharedArrays([nx, ny], [(nx,), (ny,), (nx, ny)])
+
+
+######################################################################
+
+def filename(parts):
+    """Return the name of the shared file that is laid out exactly as
+       the slurp *parts* (header strings followed by arrays), or None
+       if there is no such file."""
+
+    header = ''
+    while parts and isinstance(parts[0], str):
+        header = header + parts[0]
+        parts = parts[1:]
+
+    name = None
+    offset = len(header)
+    for part in parts:
+        if not (isinstance(part, np.memmap) and isinstance(part.base, mmap.mmap)
+                and part.flags.c_contiguous):
+            return None
+        if name is None:
+            name = part.filename
+        if part.filename != name or part.offset != offset:
+            return None
+        offset = offset + part.nbytes
+
+    if name is None:
+        return None
+
+    f = open(name, 'rb')
+    ok = f.read(len(header)) == header
+    f.close()
+
+    if ok:
+        return name
+    return None
@@ -61,6 +61,10 @@ setup(
     zip_safe = False,
 
     package_data = {'': ['__version__.py', '__git_version__.py']},
+
+    entry_points = {
+        'console_scripts': [ 'pyasy = pyasy.build:main' ],
+        },
     exclude_package_data = {'': ['.gitignore']},
 
     author = "Matthew Emmett",
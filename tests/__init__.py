@@ -0,0 +1,19 @@
+"""PyAsy tests.
+
+   The tests don't need Asymptote: plots are created with a render
+   server address (see :mod:`pyasy.daemon`), so that the commands and
+   the data are buffered rather than sent to an engine.  Run them
+   with::
+
+     python -m unittest discover tests
+
+   """
+
+import pyasy.plot
+
+
+def plot(**kwargs):
+    """Return a plot that buffers its commands (and is never shipped
+       out)."""
+
+    return pyasy.plot.Plot(server='unused', **kwargs)
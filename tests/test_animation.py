@@ -0,0 +1,89 @@
+"""Tests of the frame preprocessing of pyasy.animation."""
+
+import unittest
+
+import numpy as np
+
+import pyasy.animation
+
+
+class FrameTests(unittest.TestCase):
+
+    def setUp(self):
+        self.animation = pyasy.animation.Animation(server='unused')
+
+    def test_resample(self):
+        t = np.array([ 0.0, 1.0, 3.0 ])
+        y = np.array([ [ 0.0, 1.0 ], [ 1.0, 2.0 ], [ 3.0, 4.0 ] ])
+
+        tn, yn = self.animation._resample(t, y, frames=7)
+
+        self.assertTrue(np.allclose(tn, np.linspace(0.0, 3.0, 7)))
+        self.assertTrue(np.allclose(yn[:,0], tn))
+        self.assertTrue(np.allclose(yn[:,1], tn + 1.0))
+
+        tn, yn = self.animation._resample(t, y, rate=2)
+        self.assertTrue(np.allclose(tn, np.arange(0.0, 3.5, 0.5)))
+
+    def test_unique(self):
+        t = np.arange(5.0)
+        y = np.array([ [ 0.0 ], [ 0.0 ], [ 1.0 ], [ 1.0005 ], [ 2.0 ] ])
+
+        tu, yu, repeats = self.animation._unique(t, y, 0.001)
+
+        self.assertEqual(list(tu), [ 0, 2, 4 ])
+        self.assertEqual(list(repeats), [ 2, 2, 1 ])
+        self.assertEqual(repeats.sum(), len(t))
+
+    def test_resample_duplicate_times(self):
+        t = np.array([ 0.0, 1.0, 1.0, 2.0 ])
+        y = np.array([ [ 0.0 ], [ 1.0 ], [ 5.0 ], [ 2.0 ] ])
+
+        tn, yn = self.animation._resample(t, y, frames=5)
+
+        self.assertTrue(np.isfinite(yn).all())
+        self.assertTrue(np.allclose(yn[:,0], tn))
+
+    def test_unique_drift(self):
+        # same frames as comparing each frame with the last kept frame
+        # (a slow drift is broken into several kept frames)
+        def reference(y, tolerance):
+            keep, repeats = [ 0 ], [ 1 ]
+            for n in range(1, len(y)):
+                if np.abs(y[n] - y[keep[-1]]).max() <= tolerance:
+                    repeats[-1] = repeats[-1] + 1
+                else:
+                    keep.append(n)
+                    repeats.append(1)
+            return keep, repeats
+
+        random = np.random.RandomState(1)
+        for scale in (0.001, 0.01, 0.1):
+            y = np.cumsum(scale*random.randn(300, 4), axis=0)
+            t = np.arange(300.0)
+
+            tu, yu, repeats = self.animation._unique(t, y, 0.02)
+            keep, expected = reference(y, 0.02)
+
+            self.assertEqual(list(tu), list(t[keep]))
+            self.assertEqual(list(repeats), expected)
+
+
+class PreviewTests(unittest.TestCase):
+
+    def test_clipped_before_decimation(self):
+        a = pyasy.animation.Animation(server='unused', preview=True)
+        x = np.arange(10000.0)
+        y = np.ones((5, 10000))
+        y[2,51] = np.nan
+
+        a.animate(x, np.arange(5.0), y, xlims=(0, 1000))
+
+        sx = a.asy.files[-1][1][2]
+        self.assertTrue(a.preview_grid/2 < sx.size <= a.preview_grid + 2)
+        self.assertEqual((sx[0], sx[-1]), (0, 1001))
+        self.assertTrue(51 in sx)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+"""Tests of the preprocessing of pyasy.base."""
+
+import unittest
+
+import numpy as np
+
+from tests import plot
+
+
+class FilterTests(unittest.TestCase):
+
+    def test_gaps(self):
+        p = plot()
+        y = np.arange(10.0)
+        y[[3, 5]] = np.nan
+
+        x, y, offsets = p._filter2(np.arange(10.0), y)
+
+        self.assertEqual(list(x), [0, 1, 2, 4, 6, 7, 8, 9])
+        self.assertEqual(list(offsets), [0, 3, 4, 8])
+
+    def test_smooth_short_segments(self):
+        # segments shorter than the window are left unsmoothed
+        p = plot(smooth=5)
+        y = np.arange(10.0)
+        y[[3, 5]] = np.nan
+
+        x, y, offsets = p._filter2(np.arange(10.0), y)
+
+        self.assertEqual(len(x), len(y))
+        self.assertEqual(list(y[:4]), [0, 1, 2, 4])
+
+
+class PreviewTests(unittest.TestCase):
+
+    def test_clipped_before_decimation(self):
+        # the visible points are decimated, not the whole line
+        p = plot(preview=True, xlims=(0, 0.01))
+        x = np.linspace(0.0, 1.0, 1000000)
+
+        sx, sy, offsets = p._filter2(x, x)
+
+        self.assertTrue(sx.size > p.preview_points/2)
+        self.assertTrue(sx.size <= p.preview_points + 1)
+        self.assertTrue(sx.max() <= 0.01)
+
+    def test_gaps_kept(self):
+        p = plot(preview=True)
+        y = np.arange(10000.0)
+        y[4001] = np.nan
+
+        sx, sy, offsets = p._filter2(np.arange(10000.0), y)
+
+        self.assertEqual(len(offsets), 3)
+        self.assertEqual((sx[offsets[1] - 1], sx[offsets[1]]), (4000, 4002))
+        self.assertEqual((sx[0], sx[-1]), (0, 9999))
+
+    def test_grid_gaps_kept(self):
+        p = plot(preview=True)
+        x, y = np.arange(1000.0), np.arange(500.0)
+        z = np.ones((1000, 500))
+        z[501, 3] = np.nan
+
+        sx, sy, sz = p._decimate_grid(x, y, z, 8, 4)
+
+        self.assertEqual(sz.shape, (125, 125))
+        self.assertEqual(list(np.argwhere(np.isnan(sz))[0]), [62, 0])
+        self.assertEqual(np.isnan(sz).sum(), 1)
+
+    def test_grid_clip(self):
+        p = plot()
+        x = np.arange(10.0)
+
+        self.assertEqual(p._clip(x, None), slice(0, 10))
+        self.assertEqual(p._clip(x, (2.5, 5)), slice(2, 7))
+        self.assertEqual(p._clip(x, (20, 30)), slice(9, 10))
+
+
+class SimplifyTests(unittest.TestCase):
+
+    def distance(self, u, v, su, sv):
+        # distance from each point (u, v) to the polyline (su, sv)
+        ax, ay = su[:-1][None,:], sv[:-1][None,:]
+        dx, dy = np.diff(su)[None,:], np.diff(sv)[None,:]
+        l2 = np.maximum(dx*dx + dy*dy, 1e-300)
+        t = np.clip(((u[:,None] - ax)*dx + (v[:,None] - ay)*dy)/l2, 0.0, 1.0)
+        return np.hypot(u[:,None] - ax - t*dx, v[:,None] - ay - t*dy).min(axis=1)
+
+    def test_tolerance(self):
+        # a 4in plot of [-1, 1] x [-1, 1]: 144bp per unit
+        p = plot(xlims=(-1, 1), ylims=(-1, 1), size=(4, 4, False))
+        p.new_plot(p.size)
+
+        tolerance = 0.5
+        for n in (500, 5000):
+            t = np.linspace(0.0, 6*np.pi, n)
+            x, y = t*np.cos(t)/(6*np.pi), t*np.sin(t)/(6*np.pi)
+
+            sx, sy, offsets = p._simplify(x, y, np.array([0, n]), tolerance)
+
+            self.assertTrue(sx.size < n/2)
+            self.assertEqual(list(offsets), [0, sx.size])
+            self.assertEqual((sx[0], sx[-1]), (x[0], x[-1]))
+
+            d = self.distance(144*x, 144*y, 144*sx, 144*sy)
+            self.assertTrue(d.max() <= tolerance + 1e-9)
+
+    def test_segments(self):
+        # the ends of each segment are kept
+        p = plot(xlims=(0, 1), ylims=(0, 1))
+        p.new_plot(p.size)
+
+        x = np.linspace(0.0, 1.0, 300)
+        y = 0.5*np.ones(300)
+
+        sx, sy, offsets = p._simplify(x, y, np.array([0, 100, 300]), 0.5)
+
+        self.assertEqual(list(offsets), [0, 2, 4])
+        self.assertEqual(list(sx), [ x[0], x[99], x[100], x[299] ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+"""Tests of the incremental builds of pyasy.build."""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import pyasy.build
+
+
+class StaleTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.figure = { 'name': 'fig.py', 'path': os.path.join(self.directory, 'fig.py'),
+                        'kind': 'script', 'inputs': [ 'fig.py', 'data.npy' ],
+                        'outputs': [ 'fig.pdf' ] }
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def touch(self, name, mtime):
+        path = os.path.join(self.directory, name)
+        open(path, 'w').close()
+        os.utime(path, (mtime, mtime))
+
+    def test_stale(self):
+        self.touch('fig.py', 100)
+        self.touch('data.npy', 100)
+
+        # no output yet
+        self.assertTrue(pyasy.build.stale(self.directory, self.figure))
+
+        self.touch('fig.pdf', 200)
+        self.assertFalse(pyasy.build.stale(self.directory, self.figure))
+
+        # an input is newer than the output
+        self.touch('data.npy', 300)
+        self.assertTrue(pyasy.build.stale(self.directory, self.figure))
+
+    def test_manifest(self):
+        self.touch('fig.py', 100)
+        self.touch('data.npy', 100)
+        self.touch('fig.pdf', 200)
+
+        built = { 'fig.py': [ 'fig.py', 'data.npy' ] }
+        self.assertFalse(pyasy.build.stale(self.directory, self.figure, built))
+
+        # the inputs changed since the last build
+        built = { 'fig.py': [ 'fig.py' ] }
+        self.assertTrue(pyasy.build.stale(self.directory, self.figure, built))
+
+
+class BuildTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, source):
+        f = open(os.path.join(self.directory, name), 'w')
+        f.write(source)
+        f.close()
+
+    def test_figures(self):
+        # only scripts that list their outputs are figures
+        self.write('fig.py', "# pyasy-outputs: fig.pdf fig.png\nnp.load('run.npz')\n")
+        self.write('data.py', "np.save('run.npy', x)\n")
+        self.write('empty.py', "# pyasy-outputs:\n")
+
+        figures = pyasy.build.figures(self.directory)
+
+        self.assertEqual([ f['name'] for f in figures ], [ 'fig.py' ])
+        self.assertEqual(figures[0]['inputs'], [ 'fig.py', 'run.npz' ])
+        self.assertEqual(figures[0]['outputs'], [ 'fig.pdf', 'fig.png' ])
+
+    def test_missing_outputs(self):
+        # a figure that doesn't write its outputs isn't recorded as built
+        self.write('good.py', "# pyasy-outputs: good.pdf\nopen('good.pdf', 'w').close()\n")
+        self.write('bad.py', "# pyasy-outputs: bad.pdf bad.png\nopen('bad.pdf', 'w').close()\n")
+
+        results = pyasy.build.build(self.directory, jobs=2, echo=False)
+
+        self.assertEqual([ r[:2] for r in results ], [ ('bad.py', 'failed'), ('good.py', 'built') ])
+        self.assertEqual(results[0][3], 'missing outputs: bad.png')
+
+        built = json.load(open(os.path.join(self.directory, pyasy.build.manifest)))
+        self.assertEqual(sorted(built), [ 'good.py' ])
+
+
+if __name__ == '__main__':
+    unittest.main()
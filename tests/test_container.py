@@ -0,0 +1,56 @@
+"""Tests of the binary container format of pyasy.container."""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import pyasy.container
+
+
+class ContainerTests(unittest.TestCase):
+
+    def test_round_trip(self):
+        arrays = [ ('X', np.linspace(0.0, 1.0, 7)),
+                   ('I', np.arange(5, dtype='int32')),
+                   ('RGB', np.arange(24, dtype='uint8').reshape(2, 4, 3)),
+                   ('B', np.array([ True, False, True ])),
+                   ('ZZ', np.arange(6, dtype='float32').reshape(2, 3)),
+                   ('H', np.arange(4, dtype='float16')) ]
+
+        fd, filename = tempfile.mkstemp()
+        try:
+            f = os.fdopen(fd, 'wb')
+            for part in pyasy.container.parts(arrays):
+                f.write(part if isinstance(part, str) else part.tostring())
+            f.close()
+
+            read = pyasy.container.read(filename)
+        finally:
+            os.remove(filename)
+
+        self.assertEqual([ name for name, a in read ], [ name for name, a in arrays ])
+        for (name, a), (_, b) in zip(arrays, read):
+            self.assertEqual(a.shape, b.shape)
+            self.assertTrue(np.array_equal(a, b))
+
+        # small integers and booleans are written as int32, and other
+        # floating point types as float64
+        self.assertEqual(read[2][1].dtype, np.dtype('int32'))
+        self.assertEqual(read[3][1].dtype, np.dtype('int32'))
+        self.assertEqual(read[4][1].dtype, np.dtype('float32'))
+        self.assertEqual(read[5][1].dtype, np.dtype('float64'))
+
+    def test_magic(self):
+        fd, filename = tempfile.mkstemp()
+        try:
+            os.write(fd, '\0'*12)
+            os.close(fd)
+            self.assertRaises(ValueError, pyasy.container.read, filename)
+        finally:
+            os.remove(filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""Tests of the render budget of pyasy.cost."""
+
+import struct
+import unittest
+import warnings
+
+import numpy as np
+
+import pyasy.cost
+
+from tests import plot
+
+
+# one second per line point or frame, nothing else
+model = pyasy.cost.CostModel(time=dict([ (k, 0.0) for k in pyasy.cost.kinds ] +
+                                       [ ('overhead', 0.0), ('line', 1.0), ('frame', 1.0) ]))
+
+
+def budget(action, time=1000.0):
+    return pyasy.cost.Budget(time=time, action=action, model=model)
+
+
+class CostModelTests(unittest.TestCase):
+
+    def test_predict(self):
+        m = pyasy.cost.CostModel(time={ 'overhead': 1.0, 'line': 0.5 },
+                                 size={ 'overhead': 10.0, 'line': 2.0 })
+        self.assertEqual(m.predict({ 'line': 4 }), (3.0, 18.0))
+
+    def test_calibrate(self):
+        m = pyasy.cost.CostModel()
+        samples = [ ({ 'line': n }, 2.0 + 0.01*n, 100.0 + 8.0*n) for n in (10, 100, 1000) ]
+
+        m.calibrate(samples)
+
+        self.assertAlmostEqual(m.time['overhead'], 2.0)
+        self.assertAlmostEqual(m.time['line'], 0.01)
+        self.assertAlmostEqual(m.size['line'], 8.0)
+
+    def test_allowance(self):
+        b = budget('warn')
+        self.assertEqual(b.allowance({ 'line': 400 }, 'line'), 600.0)
+        self.assertEqual(b.allowance({ 'line': 2000 }, 'line'), 0.0)
+        self.assertTrue(b.over({ 'line': 1001 }))
+        self.assertFalse(b.over({ 'line': 1000 }))
+        self.assertRaises(ValueError, pyasy.cost.Budget, action='ignore')
+
+
+class DegradeTests(unittest.TestCase):
+
+    def degrade(self, p, *args, **kwargs):
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            result = p._degrade(*args, **kwargs)
+        return result, len(w)
+
+    def test_actions(self):
+        self.assertEqual(self.degrade(plot(budget=budget('warn')), 'line', 5000), ((1, False), 1))
+        self.assertEqual(self.degrade(plot(budget=budget('decimate')), 'line', 5000), ((5, False), 0))
+        self.assertEqual(self.degrade(plot(budget=budget('rasterize')), 'line', 5000), ((1, True), 0))
+        self.assertEqual(self.degrade(plot(budget=budget('decimate')), 'line', 500), ((1, False), 0))
+
+    def test_minimum(self):
+        # a used up budget doesn't decimate artists to nothing
+        p = plot(budget=budget('decimate'))
+        p._account('line', 1000)
+
+        self.assertEqual(self.degrade(p, 'line', 5000), ((1, True), 1))
+        self.assertEqual(self.degrade(p, 'frame', 500), ((50, False), 1))
+        self.assertEqual(self.degrade(p, 'frame', 5), ((1, False), 1))
+
+    def test_pending(self):
+        p = plot(budget=budget('decimate'))
+        self.assertEqual(self.degrade(p, 'line', 1000, pending={ 'line': 500 }), ((2, False), 0))
+
+    def test_lines_share_the_budget(self):
+        # each series is charged before the next one is degraded
+        p = plot(budget=budget('decimate'))
+        x = np.arange(800.0)
+
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            p.lines([ (x, x), (x, x), (x, x) ])
+
+        self.assertEqual(len(w), 1)
+
+        sizes = [ struct.unpack('i', parts[0])[0] for name, parts in p.asy.files ]
+        self.assertEqual(sizes, [ 800, 200 ] + sizes[2:])
+        self.assertTrue(p.counts['line'] <= 1000)
+        self.assertTrue(p.counts['raster'] > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,219 @@
+"""Tests of the render server (and client) of pyasy.daemon."""
+
+import os
+import re
+import shutil
+import socket
+import StringIO
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+import pyasy.daemon
+import pyasy.plot
+
+
+class Engine(object):
+    """Stand-in for a warm Asymptote engine: the shipped out files
+       list the files in its working directory (and their sizes)."""
+
+    def __init__(self):
+        self.directory = tempfile.mkdtemp(prefix='pyasy-')
+        self.commands = []
+        self.closed = False
+        self.session = self
+        self.returncode = 0
+
+    def send(self, cmd):
+        self.commands.append(cmd)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+
+        listing = ' '.join([ '%s:%d' % (name, os.path.getsize(os.path.join(self.directory, name)))
+                             for name in sorted(os.listdir(self.directory)) ])
+
+        for cmd in self.commands:
+            for name, fmt in re.findall(r'shipout\("([^"]+)", format="(\w+)"\)', cmd):
+                f = open(os.path.join(self.directory, '%s.%s' % (name, fmt)), 'w')
+                f.write('%s %s' % (fmt, listing))
+                f.close()
+
+
+class Server(pyasy.daemon.Server):
+
+    def _start(self):
+        if self.kwargs.get('broken'):
+            raise OSError('no engine')
+        return Engine()
+
+
+class ProtocolTests(unittest.TestCase):
+
+    def test_message(self):
+        a, b = socket.socketpair()
+        x = np.arange(5.0)
+
+        try:
+            pyasy.daemon.send_message(a, { 'op': 'render' },
+                                      [ ('one', [ 'ab', x ]), ('two', [ 'c' ]) ])
+            header = pyasy.daemon.recv_header(b)
+            payloads = [ pyasy.daemon._recv_exactly(b, size) for name, size in header['files'] ]
+        finally:
+            a.close()
+            b.close()
+
+        self.assertEqual(header['op'], 'render')
+        self.assertEqual(header['files'], [ [ 'one', 42 ], [ 'two', 1 ] ])
+        self.assertEqual(payloads, [ 'ab' + x.tostring(), 'c' ])
+
+    def test_closed(self):
+        a, b = socket.socketpair()
+        a.sendall('\0\0\0\x10{}')
+        a.close()
+
+        self.assertRaises(IOError, pyasy.daemon.recv_header, b)
+        b.close()
+
+
+class ServerCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.address = os.path.join(self.directory, 'pyasy.sock')
+        self.cwd = os.getcwd()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        if hasattr(self, 'server'):
+            self.server.shutdown()
+            self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def serve(self, engines=1, **kwargs):
+        pyasy_server = Server(self.address, engines=engines, **kwargs)
+        for i in range(engines):
+            pyasy_server._engine()
+
+        self.server = pyasy.daemon._UnixServer(self.address, pyasy.daemon._Handler)
+        self.server.pyasy = pyasy_server
+
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        return pyasy_server
+
+
+class ServerTests(ServerCase):
+
+    def test_render(self):
+        # the slurped data is sent with the job, and the output is
+        # sent back
+        self.serve()
+
+        p = pyasy.plot.Plot(server=self.address)
+        p.line(np.arange(10.0), np.arange(10.0))
+        p.shipout('plot')
+
+        self.assertEqual(sorted(os.listdir(self.directory)), [ 'plot.pdf', 'pyasy.sock' ])
+        self.assertTrue('.tmp0.dat:164' in open('plot.pdf').read())
+
+        stats = pyasy.daemon.statistics(self.address)
+        self.assertEqual((stats['jobs'], stats['failed']), (1, 0))
+        self.assertTrue(pyasy.daemon.health(self.address)['ok'])
+
+    def test_output(self):
+        # the server moves the output files to the output directory
+        self.serve()
+        output = os.path.join(self.directory, 'output')
+        os.mkdir(output)
+
+        p = pyasy.plot.Plot(server=self.address, output=output)
+        p.shipout('plot', format='svg')
+
+        self.assertEqual(p.asy.outputs, { 'plot.svg': os.path.join(output, 'plot.svg') })
+        self.assertEqual(os.listdir(output), [ 'plot.svg' ])
+
+    def test_failure(self):
+        # failed jobs get a reply, and the pool doesn't run dry (the
+        # second job would wait for an engine forever)
+        self.serve(broken=True)
+
+        for i in range(2):
+            p = pyasy.plot.Plot(server=self.address)
+            self.assertRaises(RuntimeError, p.shipout, 'plot')
+
+        self.assertEqual(pyasy.daemon.statistics(self.address)['failed'], 2)
+
+    def test_busy(self):
+        server = self.serve(max_queue=0)
+        server.slots.acquire()
+
+        reply, outputs = pyasy.daemon.request(self.address, { 'op': 'render', 'commands': [] })
+        self.assertEqual(reply, { 'ok': False, 'error': 'busy', 'files': [] })
+        self.assertEqual(pyasy.daemon.statistics(self.address)['rejected'], 1)
+
+    def test_unknown(self):
+        self.serve()
+        reply, outputs = pyasy.daemon.request(self.address, { 'op': 'reboot' })
+        self.assertFalse(reply['ok'])
+
+
+class MemoryTests(ServerCase):
+
+    def setUp(self):
+        ServerCase.setUp(self)
+        self.serve()
+
+    def plot(self, **kwargs):
+        p = pyasy.plot.Plot(server=self.address, **kwargs)
+        p.line(np.arange(10.0), np.arange(10.0))
+        return p
+
+    def test_memory(self):
+        # nothing is written to the current directory
+        pdf = self.plot().shipout('plot', memory=True)
+
+        self.assertTrue(pdf.startswith('pdf .tmp0.dat:164'))
+        self.assertEqual(os.listdir(self.directory), [ 'pyasy.sock' ])
+
+    def test_formats(self):
+        # several formats from one job
+        outputs = self.plot().shipout('plot', format=[ 'pdf', 'svg' ], memory=True)
+
+        self.assertEqual(sorted(outputs), [ 'pdf', 'svg' ])
+        self.assertTrue(outputs['svg'].startswith('svg '))
+        self.assertEqual(pyasy.daemon.statistics(self.address)['jobs'], 1)
+
+    def test_file(self):
+        f = StringIO.StringIO()
+        self.assertEqual(self.plot().shipout('plot', format='png', file=f), None)
+        self.assertTrue(f.getvalue().startswith('png '))
+
+        self.assertRaises(ValueError, self.plot().shipout, 'plot',
+                          format=[ 'pdf', 'png' ], file=f)
+
+    def test_output(self):
+        # moved to the output directory of the server, and read back
+        output = os.path.join(self.directory, 'output')
+        os.mkdir(output)
+
+        pdf = self.plot(output=output).shipout('plot', memory=True)
+        self.assertTrue(pdf.startswith('pdf '))
+
+    def test_preview(self):
+        # rendered as PNG, keyed by the requested formats
+        outputs = self.plot(preview=True).shipout('plot', format=[ 'pdf', 'svg' ], memory=True)
+
+        self.assertEqual(outputs['pdf'], outputs['svg'])
+        self.assertTrue(outputs['pdf'].startswith('png '))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+"""Tests of the panels of pyasy.grid."""
+
+import os
+import socket
+import unittest
+
+import numpy as np
+
+import pyasy.grid
+
+
+class GridTests(unittest.TestCase):
+
+    def grid(self, **kwargs):
+        return pyasy.grid.Grid(2, 2, server='unused', **kwargs)
+
+    def test_panel_directory(self):
+        # the panels are rendered in the directory of the grid
+        g = self.grid(directory='elsewhere')
+        p = g.panel(1, 0, title='a')
+
+        self.assertTrue(g.panel(1, 0) is p)
+        self.assertEqual(p.asy.directory, g.directory)
+        self.assertEqual(g.axes[1, 0]['title'], 'a')
+        self.assertRaises(IndexError, g.panel, 2, 0)
+
+        os.rmdir(g.directory)
+
+    def test_cleanup(self):
+        # the panel directory is removed even if the shipout fails
+        g = self.grid()
+        x = np.arange(10.0)
+        g.panel(0, 0).line(x, x)
+
+        self.assertRaises(socket.error, g.shipout, 'grid')
+        self.assertFalse(os.path.exists(g.directory))
+
+
+if __name__ == '__main__':
+    unittest.main()
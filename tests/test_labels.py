@@ -0,0 +1,131 @@
+"""Tests of the label cache of pyasy.labels."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import pyasy.labels
+
+from tests import plot
+
+
+# outlines of one (cyclic) path with two nodes, as written by
+# writeoutlines
+outlines = [ 2, 1 ] + [ 0.0 ]*6 + [ 1.0 ]*6
+
+
+class LabelCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = pyasy.labels.LabelCache(os.path.join(self.directory, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, values=outlines):
+        filename = os.path.join(self.directory, name)
+        f = open(filename, 'w')
+        f.write('\n'.join([ str(v) for v in values ]) + '\n')
+        f.close()
+        return filename
+
+    def test_store(self):
+        key = self.cache.key('$x$')
+        self.assertTrue(self.cache.lookup(key) is None)
+
+        self.cache.store(key, self.write('x'))
+
+        self.assertEqual(list(self.cache.lookup(key)), outlines)
+        self.assertNotEqual(key, self.cache.key('$x$', tex='pdflatex'))
+        self.assertNotEqual(key, self.cache.key('$x$', pen='fontsize(8)'))
+
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['snippets']), (1, 1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_prune(self):
+        # the least recently used outlines are removed first, never
+        # the ones just stored
+        keys = [ self.cache.key(str(i)) for i in range(3) ]
+        for i, key in enumerate(keys):
+            self.cache.store(key, self.write(key))
+            os.utime(os.path.join(self.cache.directory, key + '.npy'), (i, i))
+
+        self.cache.max_size = 2*self.cache.snippets()[0][1]
+        self.cache.lookup(keys[0])
+        self.cache.store(keys[1], self.write(keys[1]))
+
+        self.assertTrue(self.cache.lookup(keys[0]) is not None)
+        self.assertTrue(self.cache.lookup(keys[1]) is not None)
+        self.assertTrue(self.cache.lookup(keys[2]) is None)
+
+    def test_shared(self):
+        directory = os.path.join(self.directory, 'shared')
+        self.assertTrue(pyasy.labels.cache(directory) is pyasy.labels.cache(directory + '/'))
+
+
+class PlotTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def axis(self, p):
+        x = np.linspace(0.0, 1.0, 10)
+        p.line(x, x)
+        p.axis(title='T', xlabel='$x$', ylabel='$y$')
+        return '\n'.join(p.asy.commands)
+
+    def test_miss(self):
+        p = plot(label_cache=self.directory)
+        commands = self.axis(p)
+
+        self.assertTrue('texpath(Label("$x$"))' in commands)
+        self.assertFalse('readoutlines(L' in commands)
+        self.assertEqual(p.label_cache.stats()['hits'], 0)
+
+    def test_hit(self):
+        # a plot whose labels are all in the cache isn't typeset
+        cache = pyasy.labels.cache(self.directory)
+        p = plot(label_cache=self.directory)
+        for text in [ 'T', '$x$', '$y$' ] + [ '$%g$' % v for v in np.linspace(0.0, 1.0, 6) ]:
+            filename = os.path.join(self.directory, 'outlines')
+            f = open(filename, 'w')
+            f.write(' '.join([ str(v) for v in outlines ]))
+            f.close()
+            cache.store(cache.key(text, p.tex, p.defaultpen), filename)
+
+        commands = self.axis(p)
+
+        self.assertFalse('texpath' in commands)
+        self.assertTrue('frame L0 = fillframe(readoutlines(L0a))' in commands)
+        self.assertEqual(p.label_cache.stats()['misses'], 0)
+
+    def test_store_labels(self):
+        # the outlines written by the engine are added to the cache
+        p = plot(label_cache=self.directory)
+        filename = os.path.join(self.directory, 'written')
+        f = open(filename, 'w')
+        f.write(' '.join([ str(v) for v in outlines ]))
+        f.close()
+
+        key = p.label_cache.key('$x$')
+        p.unsaved.append((key, filename))
+        p._store_labels()
+
+        self.assertEqual(p.unsaved, [])
+        self.assertEqual(list(p.label_cache.lookup(key)), outlines)
+
+    def test_preview(self):
+        p = plot(label_cache=self.directory, preview=True)
+        self.assertTrue(p.label_cache is None)
+
+
+if __name__ == '__main__':
+    unittest.main()
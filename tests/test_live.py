@@ -0,0 +1,68 @@
+"""Tests of the appends of pyasy.live."""
+
+import unittest
+
+import numpy as np
+
+import pyasy.live
+
+
+def live(**kwargs):
+    return pyasy.live.LivePlot(server='unused', interval=1e6, **kwargs)
+
+
+class AppendTests(unittest.TestCase):
+
+    def bounds(self, l):
+        d = l.plots[-1]['bounds']
+        return d['min'] + d['max']
+
+    def test_append(self):
+        # only the new (finite) samples are sent
+        l = live()
+        l.append([0.0, 1.0], [2.0, 3.0])
+        l.append([2.0, np.nan], [4.0, 5.0])
+
+        self.assertEqual(l.series[0]['n'], 3)
+        self.assertEqual(list(l.asy.files[-1][1][1]), [2.0])
+        self.assertEqual(l.asy.commands[-1], 'LX0.append(X); LY0.append(Y)')
+        self.assertEqual(self.bounds(l), (0.0, 2.0, 2.0, 4.0))
+
+    def test_window(self):
+        l = live(window=50)
+        x = np.arange(200.0)
+        y = np.sin(x)*x
+
+        for i in range(200):
+            l.append(x[i:i+1], y[i:i+1])
+            lo = max(i - 49, 0)
+            self.assertEqual(self.bounds(l),
+                             (x[lo], y[lo:i+1].min(), x[i], y[lo:i+1].max()))
+
+        self.assertEqual(l.series[0]['n'], 50)
+
+    def test_history(self):
+        l = live(history=64)
+        x = np.arange(1000.0)
+        y = np.cos(x)*np.sqrt(x)
+
+        for i in range(0, 1000, 10):
+            l.append(x[i:i+10], y[i:i+10])
+
+        s = l.series[0]
+        self.assertTrue(s['n'] <= 64)
+        self.assertEqual(s['x'][-1], 999.0)
+        self.assertEqual(self.bounds(l),
+                         (s['x'].min(), s['y'].min(), s['x'].max(), s['y'].max()))
+
+    def test_series(self):
+        l = live(window=10)
+        l.append([0.0, 1.0], [0.0, 1.0])
+        l.append([5.0], [-3.0], series=1)
+
+        self.assertEqual(len(l.series), 2)
+        self.assertEqual(self.bounds(l), (0.0, -3.0, 5.0, 1.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
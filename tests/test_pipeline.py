@@ -0,0 +1,65 @@
+"""Tests of the preprocessing pipeline of pyasy.pipeline."""
+
+import unittest
+
+import numpy as np
+
+import pyasy.pipeline
+
+from tests import plot
+
+
+class PipelineTests(unittest.TestCase):
+
+    def test_chunks(self):
+        pool = pyasy.pipeline.pool(2)
+        n = 2*pyasy.pipeline.chunk + 5
+
+        chunks = pyasy.pipeline.chunks(n, pool)
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(chunks[-1], slice(2*pyasy.pipeline.chunk, n))
+
+        # no pool: one chunk
+        self.assertEqual(pyasy.pipeline.chunks(n), [ slice(0, n) ])
+
+    def test_map(self):
+        pool = pyasy.pipeline.pool(4)
+        self.assertEqual(pyasy.pipeline.map(pool, lambda i: i*i, range(10)),
+                         [ i*i for i in range(10) ])
+        self.assertEqual(list(pyasy.pipeline.imap(pool, lambda i: -i, range(10))),
+                         [ -i for i in range(10) ])
+        self.assertTrue(pyasy.pipeline.pool(4) is pool)
+        self.assertEqual(pyasy.pipeline.pool(1), None)
+
+    def test_workers(self):
+        # chunked filtering on the pool gives the same result
+        n = 3*pyasy.pipeline.chunk + 17
+        x = np.linspace(0.0, 1.0, n)
+        y = np.sin(50*x)
+        y[::1000] = np.nan
+        y = np.ma.masked_greater(y, 0.99)
+
+        one = plot(smooth=3, workers=1)._filter2(x, y)
+        four = plot(smooth=3, workers=4)._filter2(x, y)
+
+        for a, b in zip(one, four):
+            self.assertTrue(np.array_equal(a, b))
+
+    def test_bounds(self):
+        n = 3*pyasy.pipeline.chunk
+        x = np.linspace(-1.0, 2.0, n)
+        y = np.cos(7*x)
+        y[:10] = np.nan
+
+        p = plot(workers=4)
+        p.new_plot(p.size)
+        p._bounds(x, y)
+
+        bounds = p.plots[-1]['bounds']
+        self.assertEqual(bounds['min'][0], x[10])
+        self.assertEqual(bounds['max'][0], 2.0)
+        self.assertEqual(bounds['max'][1], np.nanmax(y))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+"""Tests of the commands sent by pyasy.plot."""
+
+import unittest
+
+import numpy as np
+
+from tests import plot
+
+
+class DensityTests(unittest.TestCase):
+
+    def test_preview_clipped(self):
+        # clipped to the limits, then decimated (keeping the gaps)
+        p = plot(preview=True, xlims=(0, 100))
+        x, y = np.arange(1000.0), np.arange(600.0)
+        z = np.ones((1000, 600))
+        z[50,300] = np.nan
+
+        p.density(x, y, z)
+
+        sx, sy, sz = p.asy.files[-1][1][2:]
+        self.assertEqual((sx[0], sx[-1]), (0, 101))
+        self.assertEqual(sy.size, 120)
+        self.assertEqual(np.isnan(sz).sum(), 1)
+
+
+class RasterTests(unittest.TestCase):
+
+    def test_coverage_is_opacity(self):
+        # the raster is translucent: no opaque (white) background
+        p = plot()
+        x = np.linspace(0.0, 1.0, 100)
+
+        p.line(x, x*x, pen='red', rasterize=True)
+
+        image = [ c for c in p.asy.commands if 'image(' in c ][-1]
+        self.assertTrue('red + opacity(k/255)' in image)
+        self.assertTrue('image(p1, P,' in image)
+        self.assertFalse('white' in image)
+
+        f = p.asy.files[-1][1][-1]
+        self.assertTrue(f.min() >= 0.0 and f.max() <= 1.0)
+
+
+class ScatterTests(unittest.TestCase):
+
+    x = np.arange(5.0)
+    y = np.array([ 0.0, 1.0, np.nan, 3.0, 4.0 ])
+
+    def test_mapped(self):
+        # coordinates, colours and sizes in one transfer (the colours
+        # and sizes of dropped points are dropped too)
+        p = plot()
+        p.scatter(self.x, self.y, c=[ 0.0, 1.0, 2.0, 3.0, 4.0 ],
+                  s=[ 1.0, 2.0, 3.0, 4.0, 5.0 ], crange=[ 0.0, 2.0 ], srange=[ 2.0, 10.0 ])
+
+        self.assertEqual(len(p.asy.files), 1)
+        x, y, c, s = p.asy.files[0][1][1:]
+        self.assertEqual(list(x), [ 0.0, 1.0, 3.0, 4.0 ])
+        self.assertEqual(list(c), [ 0.0, 0.5, 1.0, 1.0 ])
+        self.assertEqual(list(s), [ 2.0, 4.0, 8.0, 10.0 ])
+
+        command = p.asy.commands[-1]
+        self.assertTrue('pal[round(C[i]*(pal.length-1))]' in command)
+        self.assertTrue('linewidth(S[i]/dotfactor)' in command)
+
+    def test_scalar_size(self):
+        p = plot()
+        p.scatter(self.x, self.x, s=4)
+
+        self.assertTrue('linewidth(4.0/dotfactor)' in p.asy.commands[-1])
+        self.assertFalse('S[i]' in p.asy.commands[-1])
+
+
+class ShipoutTests(unittest.TestCase):
+
+    def shipouts(self, p):
+        return [ c for c in p.asy.commands if c.startswith('shipout(') ]
+
+    def test_formats(self):
+        # laid out once, output in each format
+        p = plot()
+        p.line(np.arange(10.0), np.arange(10.0))
+        p.shipout('plot', format=[ 'pdf', 'svg', 'pdf' ], close=False)
+
+        self.assertEqual(self.shipouts(p), [ 'shipout("plot", format="pdf")',
+                                             'shipout("plot", format="svg")' ])
+        self.assertEqual(len([ c for c in p.asy.commands if '.fit()' in c ]), 1)
+
+    def test_again(self):
+        # an open session is shipped out again without a new layout
+        p = plot()
+        p.line(np.arange(10.0), np.arange(10.0))
+        p.shipout('plot', close=False)
+        n = len(p.asy.commands)
+
+        p.shipout('plot', format='png', close=False)
+
+        self.assertEqual(p.asy.commands[n:], [ 'shipout("plot", format="png")' ])
+
+    def test_preview(self):
+        p = plot(preview=True)
+        p.line(np.arange(10.0), np.arange(10.0))
+        p.shipout('plot', format=[ 'pdf', 'svg' ], close=False)
+
+        self.assertEqual(self.shipouts(p), [ 'shipout("plot", format="png")' ])
+
+
+class TextsTests(unittest.TestCase):
+
+    def test_escaping(self):
+        p = plot()
+        p.texts([ 0.0, 1.0 ], [ 0.0, 1.0 ], [ 'say "hi"', '$\\alpha\\\\$' ])
+
+        command = p.asy.commands[-1]
+        self.assertTrue(command.startswith('labelpoints('))
+        self.assertTrue('{"say \\"hi\\"", "$\\\\alpha\\\\\\\\$"}' in command)
+
+
+class TripcolorTests(unittest.TestCase):
+
+    points = np.array([ [ 0.0, 0.0 ], [ 1.0, 0.0 ], [ 0.0, 1.0 ], [ 1.0, 1.0 ] ])
+    triangles = np.array([ [ 0, 1, 2 ], [ 1, 3, 2 ] ])
+
+    def colours(self, p):
+        # the normalised colours (last array of the last transfer)
+        return list(p.asy.files[-1][1][-1])
+
+    def test_per_triangle(self):
+        p = plot()
+        p.tripcolor(self.points, self.triangles, [ 0.0, 1.0 ])
+        self.assertEqual(self.colours(p), [ 0.0, 1.0 ])
+
+    def test_per_vertex(self):
+        p = plot()
+        p.tripcolor(self.points, self.triangles, [ 0.0, 0.0, 0.0, 3.0 ])
+        self.assertEqual(self.colours(p), [ 0.0, 1.0 ])
+
+    def test_ambiguous(self):
+        # as many vertices as triangles
+        points = self.points[:3]
+        triangles = np.array([ [ 0, 1, 2 ], [ 0, 1, 2 ], [ 0, 1, 2 ] ])
+
+        self.assertRaises(ValueError, plot().tripcolor, points, triangles, [ 0.0, 1.0, 2.0 ])
+
+        p = plot()
+        p.tripcolor(points, triangles, [ 0.0, 1.0, 2.0 ], per='vertex')
+        self.assertEqual(self.colours(p), [ 0.0, 0.0, 0.0 ])
+
+    def test_wrong_size(self):
+        self.assertRaises(ValueError, plot().tripcolor, self.points, self.triangles,
+                          [ 0.0, 1.0 ], per='vertex')
+
+
+if __name__ == '__main__':
+    unittest.main()
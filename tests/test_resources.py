@@ -0,0 +1,68 @@
+"""Tests of the engine resource accounting of pyasy.resources."""
+
+import os
+import subprocess
+import time
+import unittest
+
+import pyasy.resources
+
+
+class MonitorTests(unittest.TestCase):
+
+    def test_limits(self):
+        environ = dict(os.environ)
+        try:
+            os.environ['PYASY_MEMORY_LIMIT'] = '10'
+            os.environ['PYASY_CPU_LIMIT'] = '2.5'
+            self.assertEqual(pyasy.resources.limits(), (10*1024*1024, 2.5))
+            self.assertEqual(pyasy.resources.limits(1, 1), (1024*1024, 1))
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
+
+    def test_update(self):
+        killed = []
+        monitor = pyasy.resources.Monitor(None, memory_limit=1000, cpu_limit=1.0,
+                                          kill=lambda: killed.append(True))
+
+        monitor.update(500, 0.5)
+        self.assertEqual(monitor.error, None)
+
+        monitor.update(2000, 0.6)
+        self.assertTrue('memory limit' in monitor.error)
+        self.assertEqual(killed, [ True ])
+
+        usage = monitor.usage()
+        self.assertEqual((usage['peak_rss'], usage['cpu'], usage['samples']), (2000, 0.6, 2))
+
+    def test_cpu_limit(self):
+        monitor = pyasy.resources.Monitor(None, cpu_limit=1.0, kill=lambda: None)
+        monitor.update(0, 1.5)
+        self.assertTrue('CPU limit' in monitor.error)
+
+    def test_sample(self):
+        rss, cpu = pyasy.resources.sample(os.getpid())
+        self.assertTrue(rss > 0)
+        self.assertTrue(cpu >= 0)
+
+    def test_kill_tree(self):
+        # a shell with a child: both are killed, and the shell isn't
+        # reaped by alive()
+        p = subprocess.Popen([ 'sh', '-c', 'sleep 100 & wait' ])
+        time.sleep(0.2)
+
+        pids = pyasy.resources.tree(p.pid)
+        self.assertEqual(len(pids), 2)
+        self.assertTrue(pyasy.resources.alive(p.pid))
+
+        pyasy.resources.kill(p.pid)
+        time.sleep(0.2)
+
+        self.assertFalse(pyasy.resources.alive(p.pid))
+        self.assertFalse(pyasy.resources.alive(pids[1]))
+        self.assertEqual(p.wait(), -9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+"""Tests of the axis scales of pyasy.scales."""
+
+import unittest
+
+import numpy as np
+
+import pyasy.scales
+
+
+class ScaleTests(unittest.TestCase):
+
+    def test_log(self):
+        s = pyasy.scales.scale('log')
+        a = np.array([ 0.01, 1.0, 250.0 ])
+
+        self.assertTrue(np.allclose(s.forward(a), [ -2, 0, np.log10(250) ]))
+        self.assertTrue(np.allclose(s.inverse(s.forward(a)), a))
+
+        # outside the domain: gaps
+        with np.errstate(all='ignore'):
+            self.assertTrue(np.isnan(s.forward(np.array([ 0.0, -1.0 ]))).all())
+
+    def test_log_ticks(self):
+        major, labels, minor = pyasy.scales.Log().ticks(0.0, 3.0)
+
+        self.assertEqual(list(major), [ 0, 1, 2, 3 ])
+        self.assertEqual(labels[1], '$10^{1}$')
+        self.assertEqual(len(minor), 3*8)
+
+    def test_symlog(self):
+        s = pyasy.scales.SymLog(linthresh=0.1)
+        a = np.array([ -100.0, -0.05, 0.0, 0.05, 100.0 ])
+
+        self.assertTrue(np.allclose(s.inverse(s.forward(a)), a))
+        self.assertTrue(np.allclose(s.forward(-a), -s.forward(a)))
+        self.assertTrue((np.diff(s.forward(a)) > 0).all())
+
+    def test_custom(self):
+        s = pyasy.scales.scale((np.sqrt, np.square))
+        self.assertTrue(np.allclose(s.inverse(s.forward(np.arange(5.0))), np.arange(5.0)))
+
+    def test_scale(self):
+        self.assertTrue(pyasy.scales.scale(None).linear)
+        self.assertTrue(isinstance(pyasy.scales.scale('symlog'), pyasy.scales.SymLog))
+        self.assertEqual(pyasy.scales.Linear().ticks(0, 1), None)
+        self.assertRaises(ValueError, pyasy.scales.scale, 'bogus')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+"""Tests of the session recording of pyasy.session."""
+
+import array
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+
+import pyasy.cost
+import pyasy.scales
+import pyasy.session
+
+from tests import plot
+
+
+class RecorderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def calls(self):
+        return pyasy.session.load(self.directory)['calls']
+
+    def test_unrecordable_argument(self):
+        # a call that can't be recorded is made (with a warning), and
+        # doesn't stop the recording
+        p = plot(record=self.directory)
+        x = np.arange(10.0)
+
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            p.line(x, array.array('d', x))
+
+        self.assertEqual(len(w), 1)
+        self.assertTrue('not recorded' in str(w[0].message))
+        # the array already saved (x) is removed
+        self.assertEqual(os.listdir(self.directory), [ 'session.json' ])
+        self.assertTrue(len(p.asy.files) > 0)
+
+        p.line(x, x)
+        p.axis()
+
+        self.assertEqual([ c['method'] for c in self.calls() ], [ 'line', 'axis' ])
+        self.assertEqual(p.asy.recorder.depth, 0)
+
+    def test_init(self):
+        # objects are recorded as plain values, and rebuilt
+        budget = pyasy.cost.Budget(time=5.0, action='decimate',
+                                   model=pyasy.cost.CostModel(time={ 'line': 1e-3 }))
+        plot(record=self.directory, xscale=pyasy.scales.SymLog(0.01),
+             yscale='log', budget=budget)
+
+        init = pyasy.session._tuples(pyasy.session.load(self.directory)['init'])
+        xscale = pyasy.session._decode('xscale', init['xscale'])
+        budget = pyasy.session._decode('budget', init['budget'])
+
+        self.assertTrue(isinstance(xscale, pyasy.scales.SymLog))
+        self.assertEqual(xscale.linthresh, 0.01)
+        self.assertEqual(init['yscale'], 'log')
+        self.assertEqual((budget.time, budget.size, budget.action), (5.0, None, 'decimate'))
+        self.assertEqual(budget.model.time['line'], 1e-3)
+
+    def test_unrecordable_init(self):
+        self.assertRaises(ValueError, plot, record=self.directory,
+                          xscale=(np.sqrt, np.square))
+
+    def test_lines(self):
+        p = plot(record=self.directory)
+        x = np.arange(10.0)
+
+        p.lines([ (x, x), (x, 2*x) ], pens=[ 'red', 'blue' ])
+
+        call = self.calls()[0]
+        self.assertEqual(call['method'], 'lines')
+        series = pyasy.session._load(self.directory, call['arrays']['0'],
+                                     pyasy.session._tuples(call['args'][0]))
+        self.assertEqual(list(series[1][1]), list(2*x))
+        self.assertEqual(call['kwargs']['pens'], [ 'red', 'blue' ])
+
+    def test_errorbars(self):
+        p = plot(record=self.directory)
+        x = np.arange(10.0)
+
+        p.errorbars(x, x, yerr=(0.1*x, 0.2*x))
+        p.line(x, x)
+
+        calls = self.calls()
+        self.assertEqual([ c['method'] for c in calls ], [ 'errorbars', 'line' ])
+        self.assertEqual(len(calls[0]['arrays']['yerr']), 2)
+
+    def test_arrays_in_sequences(self):
+        recorder = pyasy.session.Recorder(self.directory, 'Plot', {})
+        lo, hi = np.arange(3.0), np.arange(3.0, 6.0)
+
+        recorder.begin('errorbars', (), { 'yerr': (lo, hi), 'caps': [1, 2] })
+        recorder.end()
+
+        call = self.calls()[0]
+        yerr = pyasy.session._load(self.directory, call['arrays']['yerr'],
+                                   pyasy.session._tuples(call['kwargs']['yerr']))
+
+        self.assertEqual(len(yerr), 2)
+        self.assertEqual(list(yerr[0]), list(lo))
+        self.assertEqual(list(yerr[1]), list(hi))
+        self.assertEqual(call['kwargs']['caps'], [1, 2])
+
+    def test_data_arguments(self):
+        self.assertFalse(pyasy.session._data({ 'pen': 'red', 'legend': 'a' }))
+        self.assertTrue(pyasy.session._data({ 'pen': 'red', 'simplify': 0.1 }))
+        self.assertTrue(pyasy.session._data({ 'some_new_argument': 1 }))
+
+
+if __name__ == '__main__':
+    unittest.main()
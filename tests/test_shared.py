@@ -0,0 +1,93 @@
+"""Tests of the shared arrays of pyasy.shared."""
+
+import multiprocessing
+import os
+import pickle
+import struct
+import unittest
+
+import numpy as np
+
+import pyasy.shared
+
+from tests import plot
+
+
+def total(data):
+    # in a worker process: write to the shared arrays, and sum them
+    data.z[0, 0] = -1.0
+    return data.x.sum() + data.z.sum()
+
+
+class SharedTests(unittest.TestCase):
+
+    def test_pickle(self):
+        # pickled by reference: no copy of the data
+        with pyasy.shared.slurp3(1000, 500) as data:
+            data.z[:] = 1.0
+
+            s = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+            self.assertTrue(len(s) < 1000)
+
+            copy = pickle.loads(s)
+            self.assertEqual(copy.filename, data.filename)
+            self.assertEqual(copy.z.shape, (1000, 500))
+
+            copy.z[1, 2] = 7.0
+            self.assertEqual(data.z[1, 2], 7.0)
+
+            # only the producer removes the file
+            copy.unlink()
+            self.assertTrue(os.path.exists(data.filename))
+
+        self.assertFalse(os.path.exists(data.filename))
+
+    def test_workers(self):
+        with pyasy.shared.slurp3(200, 100) as data:
+            data.x[:] = 1.0
+            data.z[:] = 2.0
+
+            pool = multiprocessing.Pool(2)
+            try:
+                results = pool.map(total, [ data, data ])
+            finally:
+                pool.close()
+                pool.join()
+
+            self.assertEqual(results, [ 200.0 + 2.0*20000 - 3.0 ]*2)
+            self.assertEqual(data.z[0, 0], -1.0)
+
+    def test_layout(self):
+        # the file is laid out as a slurp file
+        with pyasy.shared.slurp2(4) as data:
+            data.x[:] = np.arange(4.0)
+            data.y[:] = -np.arange(4.0)
+
+            f = open(data.filename, 'rb')
+            contents = f.read()
+            f.close()
+
+            self.assertEqual(contents, struct.pack('i', 4) + data.x.tostring() + data.y.tostring())
+
+    def test_filename(self):
+        with pyasy.shared.slurp3(3, 2) as data:
+            header = [ struct.pack('i', 3), struct.pack('i', 2) ]
+
+            self.assertEqual(pyasy.shared.filename(header + data.arrays), data.filename)
+
+            # not the same layout, or not shared
+            self.assertEqual(pyasy.shared.filename([ struct.pack('i', 2) ] + header[1:] + data.arrays), None)
+            self.assertEqual(pyasy.shared.filename(header + [ data.y, data.x, data.z ]), None)
+            self.assertEqual(pyasy.shared.filename(header + [ np.array(a) for a in data.arrays ]), None)
+
+    def test_density(self):
+        # slurped without copies, so the engine can read the file
+        with pyasy.shared.slurp3(3, 2) as data:
+            p = plot()
+            p.density(data.x, data.y, data.z)
+
+            self.assertEqual(pyasy.shared.filename(p.asy.files[-1][1]), data.filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
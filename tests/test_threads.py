@@ -0,0 +1,94 @@
+"""Tests of plots and label caches shared by several threads."""
+
+import os
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+import pyasy.labels
+
+from tests import plot
+
+
+def run(target, n=8):
+    threads = [ threading.Thread(target=target, args=(i,)) for i in range(n) ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+class PlotTests(unittest.TestCase):
+
+    def test_lines(self):
+        # the data slurped by a thread is drawn (with its pen) before
+        # another thread slurps
+        p = plot()
+        x = np.arange(20.0)
+
+        def lines(i):
+            for k in range(25):
+                p.line(x, np.zeros(20) + i, pen='linewidth(%d)' % (i+1))
+
+        run(lines)
+
+        files = dict(p.asy.files)
+        commands = p.asy.commands
+        slurps = [ k for k, c in enumerate(commands) if c.startswith('slurp2(') ]
+
+        self.assertEqual(len(slurps), 200)
+        self.assertEqual(p.counts['line'], 200*20)
+
+        for k in slurps:
+            name = re.match(r'slurp2\("(.*)"\)', commands[k]).group(1)
+            i = int(files[name][2][0])
+            self.assertTrue(commands[k+1].startswith('draw('))
+            self.assertTrue('linewidth(%d)' % (i+1) in commands[k+1])
+
+
+class LabelCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_registry(self):
+        caches = []
+        run(lambda i: caches.append(pyasy.labels.cache(self.directory)))
+
+        self.assertEqual(len(set(map(id, caches))), 1)
+
+    def test_counters(self):
+        # lookups and (pruning) stores from several threads
+        cache = pyasy.labels.LabelCache(self.directory, max_size=2000)
+        errors = []
+
+        def work(i):
+            try:
+                for k in range(50):
+                    key = cache.key('%d' % (k % 10))
+                    if cache.lookup(key) is None:
+                        filename = os.path.join(self.directory, 'outlines%d' % i)
+                        f = open(filename, 'w')
+                        f.write('2 1 ' + ' '.join([ str(v) for v in range(12) ]))
+                        f.close()
+                        cache.store(key, filename)
+            except Exception, e:
+                errors.append(e)
+
+        run(work)
+
+        stats = cache.stats()
+        self.assertEqual(errors, [])
+        self.assertEqual(stats['hits'] + stats['misses'], 400)
+        self.assertTrue(stats['size'] <= 2000)
+
+
+if __name__ == '__main__':
+    unittest.main()